@@ -0,0 +1,99 @@
+"""
+Benchmark of finalizing an undirected networkx graph: time and peak resident
+memory of a build that converts a DiGraph with to_undirected() and removes
+self loops and isolated nodes in full passes, like builds used to, compared to
+the build that adds the nodes and edges straight into a Graph. Every build runs
+in its own process, so the peaks don't mix.
+
+Run with:
+
+    python benchmarks/bench_finalize_memory.py [rows]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+MODES = ["to_undirected", "in place"]
+
+
+def create_workbook(file_path, rows):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    for row in range(1, rows + 1):
+        # a constant, two formulas with references and one without
+        ws.append(
+            [row, f"=A{row}*2+A{row + 1}", f"=B{row}+A{row}+Data!C{row + 1}", "=1+2"]
+        )
+    wb.save(file_path)
+
+
+def build_with_copy(file_path):
+    """
+    The build as it was before graphs were built as their final type.
+    """
+    import networkx as nx
+
+    from graphedexcel.build_stats import BuildStats
+    from graphedexcel.graphbuilder import (
+        add_range_memberships,
+        new_graph,
+        parse_sheets,
+    )
+    from graphedexcel.xlsx_reader import open_formula_reader
+
+    graph = new_graph(as_directed=True)
+    workbook = open_formula_reader(file_path, "xml")
+    parse_sheets(file_path, workbook, graph, BuildStats(), reader="xml")
+    add_range_memberships(graph, unbounded_only=True)
+    graph = graph.to_undirected()
+    graph.remove_edges_from(nx.selfloop_edges(graph))
+    graph.remove_nodes_from(list(nx.isolates(graph)))
+    return graph
+
+
+def measure(file_path, mode):
+    from graphedexcel.graphbuilder import build_graph_and_stats
+
+    start = time.perf_counter()
+    if mode == "to_undirected":
+        graph = build_with_copy(file_path)
+    else:
+        graph, _ = build_graph_and_stats(file_path, reader="xml")
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(graph.number_of_nodes(), graph.number_of_edges(), elapsed, peak)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.xlsx")
+        create_workbook(file_path, rows)
+
+        print(
+            f"{'build'.ljust(16)}{'nodes':>10}{'edges':>10}"
+            f"{'seconds':>10}{'peak MB':>10}"
+        )
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", file_path, mode],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            nodes, edges = int(output[0]), int(output[1])
+            elapsed, peak = map(float, output[2:])
+            print(
+                f"{mode.ljust(16)}{nodes:>10}{edges:>10}"
+                f"{elapsed:>10.2f}{peak / 2**20:>10.1f}"
+            )
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of formula parsing: the single-pass lexer in excel_parser
+against the regular expressions it replaced.
+
+Run with:
+
+    python benchmarks/bench_formula_parser.py
+"""
+
+import re
+import timeit
+
+from graphedexcel.excel_parser import tokenize_formula
+
+# The expressions used before the lexer: one scan for references
+# and another one for the function names.
+LEGACY_CELL_REF_REGEX = r"('?[A-Za-z0-9_\-\[\] ]+'?![A-Z]{1,3}[0-9]+(:[A-Z]{1,3}[0-9]+)?)|([A-Z]{1,3}[0-9]+(:[A-Z]{1,3}[0-9]+)?)"  # noqa
+LEGACY_FUNCTION_REGEX = r"[A-Z]+\("
+
+SHORT_FORMULAS = [
+    "=A1+B1",
+    "=SUM(A2:A400)",
+    "=$B$2*C7-Inputs!$D$4",
+    "=IF(C1>0,SUM(D1:D10),AVERAGE('Data Sheet'!E1:E50))",
+    "=VLOOKUP(A12,Lookup!$A$1:$F$2000,4,FALSE)",
+    '=IFERROR(INDEX(Prices!B:B,MATCH(A3,Prices!A:A,0)),"n/a")',
+    "=ROUND(LOG10(B5)*ATAN2(C5,D5),2)",
+    "=SUMPRODUCT((Sales[Region]=H2)*(Sales[Amount]))+TaxRate",
+]
+
+# Longer formulas with text and quoted sheet names, typical for financial models
+LONG_FORMULAS = [
+    '=IF(AND(Assumptions!$C$12>0,Assumptions!$C$13<>""),'
+    '"Revenue forecast for the selected scenario and region",'
+    '"Please enter the growth assumptions first")',
+    "=SUMIFS('Sales Data 2024'!$F:$F,'Sales Data 2024'!$A:$A,$B7,"
+    "'Sales Data 2024'!$C:$C,\">=\"&DATE(YEAR(Start_Date),MONTH(Start_Date),1))",
+]
+
+
+def legacy_parse(formula):
+    formula = formula.replace("$", "")
+    references = [m[0] or m[2] for m in re.findall(LEGACY_CELL_REF_REGEX, formula)]
+    functions = re.findall(LEGACY_FUNCTION_REGEX, formula)
+    return references, functions
+
+
+def lexer_parse(formula):
+    return tokenize_formula(formula)
+
+
+def formulas_per_second(parse, formulas, repeat=7, number=2000):
+    def run():
+        for formula in formulas:
+            parse(formula)
+
+    best = min(timeit.repeat(run, repeat=repeat, number=number))
+    return number * len(formulas) / best
+
+
+if __name__ == "__main__":
+    print(f"{'formulas/s'.ljust(12)}{'legacy regex':>16}{'lexer':>16}{'speedup':>10}")
+    for label, formulas in [("short", SHORT_FORMULAS), ("long", LONG_FORMULAS)]:
+        legacy = formulas_per_second(legacy_parse, formulas)
+        lexer = formulas_per_second(lexer_parse, formulas)
+        print(
+            f"{label.ljust(12)}{legacy:>16,.0f}{lexer:>16,.0f}{lexer / legacy:>9.2f}x"
+        )
@@ -0,0 +1,52 @@
+"""
+Benchmark of formulas copied down many rows: tokenizing every copy with
+tokenize_formula compared to FormulaTemplates, which tokenizes a formula once
+per template, and translating shared formulas of the xml reader with openpyxl's
+Translator compared to SharedFormula.
+
+Run with:
+
+    python benchmarks/bench_formula_templates.py [rows]
+"""
+
+import sys
+import time
+
+from openpyxl.formula.translate import Translator
+
+from graphedexcel.excel_parser import tokenize_formula
+from graphedexcel.formula_templates import FormulaTemplates, SharedFormula
+
+FORMULAS = {
+    "short": "=B{row}*C{row}",
+    "long": "=IF(B{row}>0,SUM(B{row}:C{row})*$A$1,VLOOKUP(B{row},Data!$A$1:$B$500,2,FALSE))",
+}
+
+
+def timed(function, cells):
+    start = time.perf_counter()
+    for coordinate, formula in cells:
+        function(formula, coordinate)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"{'formula'.ljust(8)}{'step'.ljust(12)}{'before':>10}{'after':>10}")
+    for name, formula in FORMULAS.items():
+        cells = [(f"D{row}", formula.format(row=row)) for row in range(2, rows + 2)]
+
+        templates = FormulaTemplates()
+        before = timed(lambda formula, _: tokenize_formula(formula), cells)
+        after = timed(templates.tokenize, cells)
+        print(f"{name.ljust(8)}{'tokenize'.ljust(12)}{before:>10.3f}{after:>10.3f}")
+
+        first_formula = cells[0][1]
+        translator = Translator(first_formula, "D2")
+        shared = SharedFormula(first_formula, "D2")
+        before = timed(
+            lambda _, coordinate: translator.translate_formula(coordinate), cells
+        )
+        after = timed(lambda _, coordinate: shared.translate(coordinate), cells)
+        print(f"{name.ljust(8)}{'translate'.ljust(12)}{before:>10.3f}{after:>10.3f}")
@@ -0,0 +1,50 @@
+"""
+Benchmark of the start-up cost of the command line tool: the modules with the
+highest cumulative import time when importing graphedexcel.cli, measured with
+python -X importtime in a fresh interpreter.
+
+Run with:
+
+    python benchmarks/bench_import_time.py [module]
+"""
+
+import subprocess
+import sys
+
+
+def import_times(module):
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times.append((int(cumulative) / 1000, name.rstrip()))
+    return times
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "graphedexcel.cli"
+    runs = [import_times(module) for _ in range(5)]
+    totals = sorted(
+        next(ms for ms, name in times if name.strip() == module) for times in runs
+    )
+    print(f"import {module}: {totals[len(totals) // 2]:.1f} ms (median of 5 runs)")
+
+    print()
+    print("Slowest imports of the last run (cumulative ms):")
+    for ms, name in sorted(runs[-1], reverse=True)[:15]:
+        print(f"{ms:10.1f}  {name}")
+
+    loaded = {name.strip().split(".")[0] for _, name in runs[-1]}
+    for heavy in ["matplotlib", "scipy"]:
+        print(f"{heavy} imported: {heavy in loaded}")
+
+
+if __name__ == "__main__":
+    main()
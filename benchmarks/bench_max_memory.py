@@ -0,0 +1,87 @@
+"""
+Benchmark of memory-bounded builds: time and peak resident memory of building
+and summarizing a large graph as a networkx graph, a CompactGraph and with
+--max-memory. Every build runs in its own process, so the peaks don't mix.
+
+Run with:
+
+    python benchmarks/bench_max_memory.py [rows] [max_memory]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+MODES = ["networkx", "compact", "max-memory"]
+
+
+def create_workbook(file_path, rows):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    for row in range(1, rows + 1):
+        # a constant and two formulas with three distinct references per row
+        ws.append([row, f"=A{row}*2+A{row + 1}", f"=B{row}+A{row}+Data!C{row + 1}"])
+    wb.save(file_path)
+
+
+def measure(file_path, mode, max_memory):
+    from graphedexcel.graph_summarizer import summarize
+    from graphedexcel.graphbuilder import build_graph_and_stats
+
+    options = {"reader": "xml"}
+    if mode == "compact":
+        options["compact"] = True
+    elif mode == "max-memory":
+        options["max_memory"] = max_memory
+
+    start = time.perf_counter()
+    graph, stats = build_graph_and_stats(file_path, **options)
+    built = time.perf_counter() - start
+    summary = summarize(graph, stats)
+    summarized = time.perf_counter() - start - built
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(summary.nodes, summary.edges, built, summarized, peak)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit(0)
+
+    from graphedexcel.spill_graph import parse_memory_size
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    max_memory = parse_memory_size(sys.argv[2] if len(sys.argv) > 2 else "64M")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.xlsx")
+        create_workbook(file_path, rows)
+
+        print(
+            f"{'build'.ljust(12)}{'nodes':>10}{'edges':>10}"
+            f"{'build s':>10}{'summary s':>11}{'peak MB':>10}"
+        )
+        for mode in MODES:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--measure",
+                    file_path,
+                    mode,
+                    str(max_memory),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            nodes, edges = int(output[0]), int(output[1])
+            built, summarized, peak = map(float, output[2:])
+            print(
+                f"{mode.ljust(12)}{nodes:>10}{edges:>10}"
+                f"{built:>10.2f}{summarized:>11.2f}{peak / 2**20:>10.1f}"
+            )
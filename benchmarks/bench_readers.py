@@ -0,0 +1,58 @@
+"""
+Benchmark of the formula readers on a workbook dominated by constant cells:
+time and peak Python memory to read all formula cells.
+
+Run with:
+
+    python benchmarks/bench_readers.py [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from openpyxl import Workbook
+
+from graphedexcel.xlsx_reader import open_formula_reader
+
+
+def create_workbook(file_path, rows):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    for row in range(1, rows + 1):
+        # nine constants and one formula per row
+        values = [row * col for col in range(1, 10)] + [f"label {row}"]
+        if row % 10 == 0:
+            values.append(f"=SUM(A{row}:I{row})")
+        ws.append(values)
+    wb.save(file_path)
+
+
+def measure(file_path, reader):
+    tracemalloc.start()
+    start = time.perf_counter()
+    workbook = open_formula_reader(file_path, reader)
+    count = sum(
+        1
+        for sheet_name in workbook.sheetnames
+        for _ in workbook.iter_formula_cells(sheet_name)
+    )
+    workbook.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.xlsx")
+        create_workbook(file_path, rows)
+
+        print(f"{'reader'.ljust(12)}{'formulas':>10}{'seconds':>10}{'peak MB':>10}")
+        for reader in ["openpyxl", "xml"]:
+            count, elapsed, peak = measure(file_path, reader)
+            print(f"{reader.ljust(12)}{count:>10}{elapsed:>10.2f}{peak / 2**20:>10.1f}")
@@ -0,0 +1,52 @@
+"""
+Benchmark of the graph builder on formulas that share a large range, like
+10,000 formulas using SUM(Data!A1:A5000): adding the formulas one at a time
+with process_formula expands and inserts the range for every formula, while a
+FormulaGraphBuilder links the range to its cells once.
+
+Run with:
+
+    python benchmarks/bench_shared_ranges.py [formulas] [range rows]
+"""
+
+import sys
+import time
+
+import networkx as nx
+
+from graphedexcel.graphbuilder import FormulaGraphBuilder, process_formula
+
+
+def formulas(count, range_rows):
+    return [
+        (f"A{row}", f"=SUM(Data!A1:A{range_rows})*{row}") for row in range(1, count + 1)
+    ]
+
+
+def per_formula(cells):
+    graph = nx.DiGraph()
+    for coordinate, formula in cells:
+        process_formula(coordinate, formula, "Calc", graph)
+    return graph
+
+
+def memoized(cells):
+    graph = nx.DiGraph()
+    builder = FormulaGraphBuilder(graph)
+    for coordinate, formula in cells:
+        builder.add_formula(coordinate, formula, "Calc")
+    builder.flush()
+    return graph
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    range_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    cells = formulas(count, range_rows)
+
+    print(f"{'builder'.ljust(12)}{'edges':>10}{'seconds':>10}")
+    for name, build in [("per formula", per_formula), ("memoized", memoized)]:
+        start = time.perf_counter()
+        graph = build(cells)
+        elapsed = time.perf_counter() - start
+        print(f"{name.ljust(12)}{graph.number_of_edges():>10}{elapsed:>10.2f}")
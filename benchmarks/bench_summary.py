@@ -0,0 +1,55 @@
+"""
+Benchmark of the graph summary on a large random dependency graph: the most
+connected nodes through Counter(dict(graph.degree())).most_common(10), as the
+summary used to find them, compared to the full summary with summarize(), on a
+networkx DiGraph and on a CompactGraph with the same nodes and edges.
+
+Run with:
+
+    python benchmarks/bench_summary.py [nodes] [edges per node]
+"""
+
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from graphedexcel.compact_graph import CELL, CompactGraph
+from graphedexcel.graph_summarizer import summarize
+
+SHEETS = 20
+
+
+def compact_graph(nodes, edges):
+    rng = np.random.default_rng(0)
+    ids = np.arange(nodes, dtype=np.int32)
+    return CompactGraph.from_arrays(
+        [f"Sheet{i}" for i in range(SHEETS)],
+        np.full(nodes, CELL, dtype=np.int8),
+        ids % SHEETS,
+        ids // SHEETS + 1,
+        np.ones(nodes, dtype=np.int32),
+        ids // SHEETS + 1,
+        np.ones(nodes, dtype=np.int32),
+        rng.integers(0, nodes, edges, dtype=np.int32),
+        rng.integers(0, nodes, edges, dtype=np.int32),
+    )
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_node = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    compact = compact_graph(nodes, nodes * per_node)
+    graph = compact.to_networkx()
+
+    print(f"{'graph'.ljust(12)}{'top 10 (Counter)':>18}{'summarize':>12}")
+    counter = timed(lambda: Counter(dict(graph.degree())).most_common(10))
+    print(f"{'networkx'.ljust(12)}{counter:>18.2f}{timed(summarize, graph, {}):>12.2f}")
+    print(f"{'compact'.ljust(12)}{'-':>18}{timed(summarize, compact, {}):>12.2f}")
@@ -1,5 +1,8 @@
+import os
+
 from graphedexcel.cli import main
-from graphedexcel import logger_config  # noqa: F401
+from graphedexcel.logger_config import configure_logging
 
 if __name__ == "__main__":
+    configure_logging(os.environ.get("GRAPHEDEXCEL_LOG_FILE"))
     main()
@@ -0,0 +1,98 @@
+"""
+Analysis of a single workbook as one unit of work: build the dependency graph,
+summarize it and optionally render it to an image. Used by the analysis service,
+which runs it in a pool of worker processes.
+"""
+
+import logging
+import os
+import tempfile
+from typing import NamedTuple, Optional
+
+from .build_stats import BuildStats
+from .graph_cache import cached_build_graph_and_stats
+from .graph_summarizer import summarize_graph
+from .layouts import LayoutCache
+from .graphbuilder import build_graph_and_stats
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisError(Exception):
+    """
+    The workbook could not be analyzed.
+    """
+
+
+class AnalysisResult(NamedTuple):
+    """
+    The summary of a workbook's dependency graph, the statistics of the build
+    and the rendered graph as PNG data, if an image was requested.
+    """
+
+    summary: dict
+    stats: BuildStats
+    image: Optional[bytes] = None
+
+
+def warm_up(images: bool = True) -> None:
+    """
+    Import the modules used by analyze_workbook, so the first analysis
+    in a new worker process does not pay for the imports.
+    """
+    import networkx  # noqa: F401
+    import scipy.sparse  # noqa: F401
+
+    if images:
+        from . import graph_visualizer  # noqa: F401
+
+
+def analyze_workbook(
+    file_path: str,
+    as_directed: bool = False,
+    expand_ranges: bool = True,
+    reader: str = "openpyxl",
+    compact: bool = False,
+    cache_dir: Optional[str] = None,
+    use_cache: bool = True,
+    image_layout: Optional[str] = None,
+) -> AnalysisResult:
+    """
+    Build and summarize the dependency graph of a workbook. With an image_layout,
+    the graph is also rendered with that layout.
+
+    Raises AnalysisError if the workbook can not be loaded.
+    """
+    build_options = {
+        "as_directed": as_directed,
+        "expand_ranges": expand_ranges,
+        "reader": reader,
+        "compact": compact,
+    }
+    try:
+        if use_cache:
+            graph, stats = cached_build_graph_and_stats(
+                file_path, cache_dir, **build_options
+            )
+        else:
+            graph, stats = build_graph_and_stats(file_path, **build_options)
+    except SystemExit:
+        # build_graph_and_stats exits when the workbook can not be loaded
+        raise AnalysisError(f"Could not load workbook {os.path.basename(file_path)}")
+
+    image = None
+    if image_layout is not None:
+        from .graph_visualizer import visualize_dependency_graph
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_path = os.path.join(tmp_dir, "graph.png")
+            layout_cache = None
+            if use_cache:
+                layout_cache = LayoutCache(cache_dir, name=os.path.abspath(file_path))
+            visualize_dependency_graph(
+                graph, image_path, layout=image_layout, layout_cache=layout_cache
+            )
+            with open(image_path, "rb") as file:
+                image = file.read()
+
+    return AnalysisResult(summarize_graph(graph, stats), stats, image)
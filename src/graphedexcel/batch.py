@@ -0,0 +1,267 @@
+"""
+Batch analysis of many workbooks.
+
+Every workbook is analyzed in its own worker process, at most `workers` at a
+time. A worker that runs longer than the timeout is killed, and the address
+space of the workers can be capped, so a single pathological workbook can not
+stall or take down the whole run. A summary (and optionally an image) is written
+per workbook, together with an aggregate report of all of them.
+"""
+
+import csv
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Dict, List, NamedTuple, Optional
+
+from .analysis import AnalysisError, analyze_workbook
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm")
+
+# How often running workers are checked for timeouts, in seconds
+POLL_INTERVAL = 0.1
+
+
+class BatchResult(NamedTuple):
+    """
+    The outcome of the analysis of one workbook in a batch.
+    Status is "ok", "error", "timeout" or "memory".
+    """
+
+    file: str
+    status: str
+    seconds: float
+    nodes: Optional[int] = None
+    edges: Optional[int] = None
+    formulas: Optional[int] = None
+    error: Optional[str] = None
+    summary_path: Optional[str] = None
+    image_path: Optional[str] = None
+
+
+def find_workbooks(path_or_pattern: str) -> List[str]:
+    """
+    The workbooks in a directory and its subdirectories,
+    or the files matching a glob pattern, sorted by path.
+    """
+    if os.path.isdir(path_or_pattern):
+        files = [
+            os.path.join(folder, name)
+            for folder, _, names in os.walk(path_or_pattern)
+            for name in names
+            if name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith("~$")
+        ]
+    else:
+        files = [
+            path
+            for path in glob.glob(path_or_pattern, recursive=True)
+            if os.path.isfile(path)
+        ]
+    return sorted(files)
+
+
+def artifact_names(files: List[str]) -> Dict[str, str]:
+    """
+    A unique artifact base name per workbook, from the file names.
+    """
+    names: Dict[str, str] = {}
+    used = {"report"}  # the name of the aggregate report
+    for file in files:
+        stem = os.path.splitext(os.path.basename(file))[0]
+        name, index = stem, 1
+        while name in used:
+            index += 1
+            name = f"{stem}-{index}"
+        used.add(name)
+        names[file] = name
+    return names
+
+
+def _limit_memory(max_memory_bytes: int) -> None:
+    try:
+        import resource
+    except ImportError:
+        logger.warning("Memory caps are not supported on this platform.")
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, max_memory_bytes))
+
+
+def _analyze_in_worker(
+    connection,
+    file_path: str,
+    artifact_base: str,
+    options: dict,
+    max_memory_bytes: Optional[int],
+) -> None:
+    """
+    Entry point of a worker process: analyze one workbook, write its artifacts
+    and send (status, result fields) back through the connection.
+    """
+    if max_memory_bytes:
+        _limit_memory(max_memory_bytes)
+    try:
+        result = analyze_workbook(file_path, **options)
+        summary_path = f"{artifact_base}.json"
+        with open(summary_path, "w", encoding="utf8") as file:
+            json.dump(
+                {"file": file_path, **result.summary, "stats": result.stats.to_dict()},
+                file,
+                indent=2,
+            )
+        image_path = None
+        if result.image is not None:
+            image_path = f"{artifact_base}.png"
+            with open(image_path, "wb") as file:
+                file.write(result.image)
+        connection.send(
+            (
+                "ok",
+                {
+                    "nodes": result.summary["nodes"],
+                    "edges": result.summary["edges"],
+                    "formulas": result.stats.formula_count,
+                    "summary_path": summary_path,
+                    "image_path": image_path,
+                },
+            )
+        )
+    except MemoryError:
+        connection.send(("memory", {"error": "Memory limit exceeded"}))
+    except AnalysisError as e:
+        connection.send(("error", {"error": str(e)}))
+    except Exception as e:
+        connection.send(("error", {"error": f"{type(e).__name__}: {e}"}))
+    finally:
+        connection.close()
+
+
+def run_batch(
+    files: List[str],
+    output_dir: str,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    max_memory_bytes: Optional[int] = None,
+    **options,
+) -> List[BatchResult]:
+    """
+    Analyze the workbooks with at most `workers` worker processes at a time,
+    writing a summary per workbook to output_dir. The options are passed on to
+    analyze_workbook. Returns the results in the order of the files.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    names = artifact_names(files)
+    queue = deque(files)
+    running = {}  # connection -> (process, file, start time)
+    results: Dict[str, BatchResult] = {}
+
+    def finish(connection, status, fields):
+        process, file, start = running.pop(connection)
+        connection.close()
+        process.join()
+        results[file] = BatchResult(
+            file, status, round(time.perf_counter() - start, 3), **fields
+        )
+        logger.info(f"{status.upper():8} {file}")
+
+    while queue or running:
+        while queue and len(running) < workers:
+            file = queue.popleft()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_analyze_in_worker,
+                args=(
+                    sender,
+                    file,
+                    os.path.join(output_dir, names[file]),
+                    options,
+                    max_memory_bytes,
+                ),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (process, file, time.perf_counter())
+
+        for connection in wait(list(running), timeout=POLL_INTERVAL):
+            try:
+                status, fields = connection.recv()
+            except EOFError:
+                # the worker died without reporting, e.g. killed by the OS
+                process = running[connection][0]
+                process.join()
+                status = "error"
+                fields = {"error": f"Worker exited with code {process.exitcode}"}
+            finish(connection, status, fields)
+
+        if timeout is not None:
+            now = time.perf_counter()
+            for connection, (process, _, start) in list(running.items()):
+                if now - start > timeout:
+                    process.kill()
+                    finish(
+                        connection,
+                        "timeout",
+                        {"error": f"Timed out after {timeout:g} seconds"},
+                    )
+
+    return [results[file] for file in files]
+
+
+def write_report(
+    results: List[BatchResult], output_dir: str, formats=("json", "csv")
+) -> List[str]:
+    """
+    Write the aggregate report of a batch as report.json and/or report.csv.
+    Returns the paths of the written reports.
+    """
+    paths = []
+    if "json" in formats:
+        path = os.path.join(output_dir, "report.json")
+        statuses: Dict[str, int] = {}
+        for result in results:
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+        report = {
+            "files": len(results),
+            "statuses": statuses,
+            "nodes": sum(result.nodes or 0 for result in results),
+            "edges": sum(result.edges or 0 for result in results),
+            "formulas": sum(result.formulas or 0 for result in results),
+            "results": [result._asdict() for result in results],
+        }
+        with open(path, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2)
+        paths.append(path)
+    if "csv" in formats:
+        path = os.path.join(output_dir, "report.csv")
+        with open(path, "w", encoding="utf8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(BatchResult._fields)
+            writer.writerows(results)
+        paths.append(path)
+    return paths
+
+
+def print_batch_summary(results: List[BatchResult]) -> None:
+    """
+    Print the number of workbooks per status and the failed workbooks.
+    """
+    strpadsize = 28
+    numpadsize = 5
+
+    print()
+    print("===  Batch Summary            ===")
+    print("Workbooks".ljust(strpadsize) + str(len(results)).rjust(numpadsize))
+    for status in ["ok", "error", "timeout", "memory"]:
+        count = sum(1 for result in results if result.status == status)
+        print(status.capitalize().ljust(strpadsize) + str(count).rjust(numpadsize))
+    for result in results:
+        if result.status != "ok":
+            print(f"  {result.file}: {result.error}")
@@ -0,0 +1,104 @@
+"""
+Statistics gathered while building a dependency graph.
+
+Every build gets its own BuildStats, so builds do not share any state and can
+run concurrently in the same process.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+# Formulas kept per sheet in the counts of the most copied formulas
+TOP_TEMPLATES = 10
+
+
+@dataclass
+class SheetStats:
+    """
+    Formula statistics of a single sheet.
+    """
+
+    formulas: int = 0  # formula cells
+    references: int = 0  # cell and range references in the formulas
+    functions: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0  # time spent reading and parsing the sheet
+    template_count: int = 0  # distinct formulas, copies of a formula counted once
+    # the most copied formulas, in R1C1 notation, and their number of cells
+    templates: Dict[str, int] = field(default_factory=dict)
+
+    def record_formula(self, references: List[str], functions: List[str]) -> None:
+        """
+        Count a formula with the given references and function calls.
+        """
+        self.formulas += 1
+        self.references += len(references)
+        for function in functions:
+            self.functions[function] = self.functions.get(function, 0) + 1
+
+    def record_templates(self, counts: Dict[str, int]) -> None:
+        """
+        Keep the number of distinct formulas and the most copied ones, from the
+        formula counts of FormulaTemplates.pop_counts().
+        """
+        self.template_count = len(counts)
+        top = sorted(counts.items(), key=lambda item: -item[1])[:TOP_TEMPLATES]
+        self.templates = dict(top)
+
+
+@dataclass
+class BuildStats:
+    """
+    Statistics of a graph build: the functions used in the formulas,
+    the formula counts and sizes per sheet, and the time spent in each stage.
+    """
+
+    functions: Dict[str, int] = field(default_factory=dict)
+    templates: Dict[str, int] = field(default_factory=dict)  # most copied formulas
+    sheets: Dict[str, SheetStats] = field(default_factory=dict)
+    load_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    finalize_seconds: float = 0.0
+
+    @property
+    def formula_count(self) -> int:
+        return sum(sheet.formulas for sheet in self.sheets.values())
+
+    @property
+    def reference_count(self) -> int:
+        return sum(sheet.references for sheet in self.sheets.values())
+
+    @property
+    def template_count(self) -> int:
+        return sum(sheet.template_count for sheet in self.sheets.values())
+
+    @property
+    def total_seconds(self) -> float:
+        return self.load_seconds + self.parse_seconds + self.finalize_seconds
+
+    def add_sheet(self, sheet_name: str, sheet_stats: SheetStats) -> None:
+        """
+        Add the statistics of a sheet, summing up its function counts and the
+        counts of its most copied formulas.
+        """
+        self.sheets[sheet_name] = sheet_stats
+        for function, count in sheet_stats.functions.items():
+            self.functions[function] = self.functions.get(function, 0) + count
+        for template, count in sheet_stats.templates.items():
+            self.templates[template] = self.templates.get(template, 0) + count
+
+    def to_dict(self) -> dict:
+        """
+        The statistics as plain JSON-serializable data.
+        """
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BuildStats":
+        """
+        Load statistics written by to_dict.
+        """
+        stats = cls(**{key: value for key, value in data.items() if key != "sheets"})
+        stats.sheets = {
+            name: SheetStats(**sheet) for name, sheet in data["sheets"].items()
+        }
+        return stats
@@ -1,14 +1,30 @@
 import os
 import sys
 import argparse
+import json
 import logging
 from .graphbuilder import build_graph_and_stats
-from .graph_summarizer import print_summary
-from .graph_visualizer import visualize_dependency_graph
+from .graph_cache import cached_build_graph_and_stats
+from .incremental import incremental_build_graph_and_stats, print_changes
+from .dependency_analysis import analyze_dependencies, print_dependency_analysis
+from .edge_stream import EDGE_FORMATS, print_edge_summary, stream_edges
+from .graph_export import export_graph, import_graph
+from .graph_summarizer import SUMMARY_FORMATS, print_summary, summarize
+from .layouts import LAYOUTS, LayoutCache
+from . import profiling
+from .profiling import PROFILE_MODES, profile
+from .spill_graph import fits_in_memory, parse_memory_size
 
 logger = logging.getLogger("graphedexcel.cli")
 
 
+def memory_size(text):
+    try:
+        return parse_memory_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         prog="graphedexcel",
@@ -17,7 +33,10 @@ def parse_arguments():
 
     # Positional argument for the path to the Excel file
     parser.add_argument(
-        "path_to_excel", type=str, help="Path to the Excel file to process."
+        "path_to_excel",
+        type=str,
+        nargs="?",
+        help="Path to the Excel file to process. Not needed with --import.",
     )
 
     # Optional flags with shorthand aliases
@@ -28,6 +47,126 @@ def parse_arguments():
         help="Treat the dependency graph as directed.",
     )
 
+    parser.add_argument(
+        "--compact-ranges",
+        action="store_true",
+        help="Keep ranges as single nodes instead of expanding them into every cell.",
+    )
+
+    parser.add_argument(
+        "--compact-graph",
+        action="store_true",
+        help="Build the graph with integer-encoded nodes and edges, "
+        "which uses much less memory for large workbooks.",
+    )
+
+    parser.add_argument(
+        "--condensed-graph",
+        action="store_true",
+        help="Build a graph of sheets instead of cells, with the dependencies "
+        "between sheets weighted by the number of references.",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=memory_size,
+        default=None,
+        metavar="SIZE",
+        help="Build the graph on disk using about SIZE of memory (like 512M or 2G), "
+        "for workbooks whose graph does not fit in memory. Except with --layout grid "
+        "--renderer fast, the graph is only visualized if it fits in SIZE.",
+    )
+
+    parser.add_argument(
+        "--dependency-analysis",
+        action="store_true",
+        help="Print the recalculation depth, the widths of the depth levels, the "
+        "critical path and the circular references. Needs --as-directed-graph.",
+    )
+
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of processes used to parse the sheets (default: 1).",
+    )
+
+    parser.add_argument(
+        "--reader",
+        type=str,
+        default="openpyxl",
+        choices=["openpyxl", "xml"],
+        help="How formulas are read from the workbook. 'xml' streams them from the "
+        "worksheet XML, which is faster for large sheets (default: openpyxl).",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the cache of built graphs (default: ~/.cache/graphedexcel).",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the workbook, without reading or writing the graph cache.",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        type=str,
+        default=None,
+        metavar="STATE_FILE",
+        help="Only parse the sheets whose formulas changed since the run that wrote "
+        "STATE_FILE, and report the changes. The state file is created if missing.",
+    )
+
+    parser.add_argument(
+        "--export",
+        type=str,
+        default=None,
+        metavar="GRAPH_FILE",
+        help="Write the graph and its statistics to GRAPH_FILE (.npz) "
+        "for later runs with --import.",
+    )
+
+    parser.add_argument(
+        "--import",
+        dest="import_path",
+        type=str,
+        default=None,
+        metavar="GRAPH_FILE",
+        help="Load the graph written by --export instead of reading a workbook.",
+    )
+
+    parser.add_argument(
+        "--edges",
+        type=str,
+        default=None,
+        metavar="EDGE_FILE",
+        help="Write the dependencies to EDGE_FILE ('-' for stdout) as they are found, "
+        "without building the graph, and print a summary of them.",
+    )
+
+    parser.add_argument(
+        "--edges-format",
+        type=str,
+        default=None,
+        choices=EDGE_FORMATS,
+        help="Format of --edges (default: csv for .csv files, ndjson otherwise).",
+    )
+
+    parser.add_argument(
+        "--summary-format",
+        type=str,
+        default="text",
+        choices=SUMMARY_FORMATS,
+        help="Print the summary as text or as JSON, with the degree distribution, "
+        "nodes per sheet and connected components (default: text).",
+    )
+
     parser.add_argument(
         "--no-visualize",
         "-n",
@@ -40,8 +179,45 @@ def parse_arguments():
         "-l",
         type=str,
         default="spring",
-        choices=["spring", "circular", "kamada_kawai", "shell", "spectral"],
-        help="Layout algorithm for graph visualization (default: spring).",
+        choices=LAYOUTS,
+        help="Layout algorithm for graph visualization, grid scales to very large graphs "
+        "(default: spring).",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed of the spring layout, for reproducible images.",
+    )
+
+    parser.add_argument(
+        "--renderer",
+        type=str,
+        default="networkx",
+        choices=["networkx", "fast"],
+        help="How the graph is drawn. 'fast' draws all edges and nodes in one go "
+        "and draws the edge density of very large graphs (default: networkx).",
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="time",
+        default=None,
+        choices=PROFILE_MODES,
+        help="Print the time and memory of every stage of the run to stderr. "
+        "'cprofile' also profiles every function call and 'tracemalloc' traces "
+        "memory allocations, both written to --profile-output.",
+    )
+
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        help="File for the output of --profile cprofile (default: graphedexcel.prof) "
+        "or --profile tracemalloc (default: graphedexcel-tracemalloc.txt).",
     )
 
     parser.add_argument(
@@ -74,13 +250,395 @@ def parse_arguments():
         default=None,
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.edges and args.import_path:
+        parser.error("--edges reads a workbook, it can not be used with --import")
+    if args.max_memory is not None:
+        for option, value in [
+            ("--import", args.import_path),
+            ("--incremental", args.incremental),
+            ("--edges", args.edges),
+            ("--compact-graph", args.compact_graph),
+            ("--condensed-graph", args.condensed_graph),
+            ("--workers", args.workers > 1),
+        ]:
+            if value:
+                parser.error(f"--max-memory can not be used with {option}")
+    if args.import_path and args.path_to_excel:
+        parser.error("give either a workbook or --import, not both")
+    if not args.import_path and not args.path_to_excel:
+        parser.error("the following arguments are required: path_to_excel")
+    return args
+
+
+def parse_serve_arguments(argv):
+    from .server import DEFAULT_MAX_UPLOAD_BYTES, DEFAULT_PORT, DEFAULT_QUEUE_SIZE
+
+    parser = argparse.ArgumentParser(
+        prog="graphedexcel serve",
+        description="Run a local service that analyzes workbooks "
+        "in a pool of warm worker processes.",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Host to listen on (default: 127.0.0.1).",
+    )
+    parser.add_argument(
+        "--port",
+        "-p",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on (default: {DEFAULT_PORT}).",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="Listen on this Unix socket instead of a TCP port.",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Number of analyses that may wait for a worker before new requests "
+        f"are rejected with 503 (default: {DEFAULT_QUEUE_SIZE}).",
+    )
+    parser.add_argument(
+        "--max-upload-mb",
+        type=int,
+        default=DEFAULT_MAX_UPLOAD_BYTES // (1024 * 1024),
+        help="Largest accepted workbook upload in MB "
+        f"(default: {DEFAULT_MAX_UPLOAD_BYTES // (1024 * 1024)}).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the cache of built graphs (default: ~/.cache/graphedexcel).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the workbooks, without reading or writing the graph cache.",
+    )
+    return parser.parse_args(argv)
+
+
+def serve_main(argv):
+    from .server import serve
+
+    args = parse_serve_arguments(argv)
+    serve(
+        host=args.host,
+        port=args.port,
+        socket_path=args.socket,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        max_upload_bytes=args.max_upload_mb * 1024 * 1024,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+    )
+
+
+def parse_batch_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="graphedexcel batch",
+        description="Analyze many workbooks in parallel and write a summary per "
+        "workbook and an aggregate report.",
+    )
+    parser.add_argument(
+        "path",
+        type=str,
+        help="Directory with workbooks (searched recursively) or a glob pattern.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        "-o",
+        type=str,
+        default="graphedexcel-batch",
+        help="Directory for the summaries, images and report "
+        "(default: graphedexcel-batch).",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Number of workbooks analyzed at a time (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Stop the analysis of a workbook after this many seconds.",
+    )
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        default=None,
+        help="Limit the memory (address space) of each analysis to this many MB.",
+    )
+    parser.add_argument(
+        "--report-format",
+        type=str,
+        default="both",
+        choices=["json", "csv", "both"],
+        help="Format of the aggregate report (default: both).",
+    )
+    parser.add_argument(
+        "--images",
+        action="store_true",
+        help="Also render the graph of every workbook to an image.",
+    )
+    parser.add_argument(
+        "--layout",
+        "-l",
+        type=str,
+        default="spring",
+        choices=LAYOUTS,
+        help="Layout algorithm for the images (default: spring).",
+    )
+    parser.add_argument(
+        "--as-directed-graph",
+        "-d",
+        action="store_true",
+        help="Treat the dependency graphs as directed.",
+    )
+    parser.add_argument(
+        "--compact-ranges",
+        action="store_true",
+        help="Keep ranges as single nodes instead of expanding them into every cell.",
+    )
+    parser.add_argument(
+        "--compact-graph",
+        action="store_true",
+        help="Build the graphs with integer-encoded nodes and edges.",
+    )
+    parser.add_argument(
+        "--reader",
+        type=str,
+        default="openpyxl",
+        choices=["openpyxl", "xml"],
+        help="How formulas are read from the workbooks (default: openpyxl).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the cache of built graphs (default: ~/.cache/graphedexcel).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the workbooks, without reading or writing the graph cache.",
+    )
+    return parser.parse_args(argv)
+
+
+def batch_main(argv):
+    from .batch import find_workbooks, print_batch_summary, run_batch, write_report
+
+    args = parse_batch_arguments(argv)
+    files = find_workbooks(args.path)
+    if not files:
+        print(f"No workbooks found: {args.path}", file=sys.stderr)
+        sys.exit(1)
+
+    logger.info(f"Analyzing {len(files)} workbooks.")
+    results = run_batch(
+        files,
+        args.output_dir,
+        workers=args.workers,
+        timeout=args.timeout,
+        max_memory_bytes=(
+            args.max_memory_mb * 1024 * 1024 if args.max_memory_mb else None
+        ),
+        as_directed=args.as_directed_graph,
+        expand_ranges=not args.compact_ranges,
+        compact=args.compact_graph,
+        reader=args.reader,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        image_layout=args.layout if args.images else None,
+    )
+    formats = ("json", "csv") if args.report_format == "both" else (args.report_format,)
+    report_paths = write_report(results, args.output_dir, formats)
+
+    print_batch_summary(results)
+    print(f"Report saved to {', '.join(report_paths)}.")
+    if any(result.status != "ok" for result in results):
+        sys.exit(1)
+
+
+def parse_query_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="graphedexcel query",
+        description="Find the transitive precedents and dependents of cells. "
+        "The index is built once, so many queries are answered quickly.",
+    )
+    parser.add_argument(
+        "path_to_excel", type=str, help="Path to the Excel file to query."
+    )
+    parser.add_argument(
+        "--precedents",
+        action="append",
+        default=[],
+        metavar="NODE",
+        help="Print every cell and range the node depends on, like 'Output!Z10'. "
+        "Can be given more than once.",
+    )
+    parser.add_argument(
+        "--dependents",
+        action="append",
+        default=[],
+        metavar="NODE",
+        help="Print every cell and range that depends on the node, i.e. is affected "
+        "when it changes, like 'Inputs!B4'. Can be given more than once.",
+    )
+    parser.add_argument(
+        "--depends-on",
+        action="append",
+        default=[],
+        nargs=2,
+        metavar=("NODE", "OTHER"),
+        help="Print whether NODE depends on OTHER. Can be given more than once.",
+    )
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Also read queries from standard input, one per line, like "
+        "'dependents Inputs!B4' or 'depends-on Output!Z10 Inputs!B4'. "
+        "Quote names with spaces.",
+    )
+    parser.add_argument(
+        "--count",
+        action="store_true",
+        help="Print the number of precedents or dependents instead of the nodes.",
+    )
+    parser.add_argument(
+        "--compact-ranges",
+        action="store_true",
+        help="Keep ranges as single nodes instead of expanding them into every cell.",
+    )
+    parser.add_argument(
+        "--compact-graph",
+        action="store_true",
+        help="Build the graph with integer-encoded nodes and edges.",
+    )
+    parser.add_argument(
+        "--reader",
+        type=str,
+        default="openpyxl",
+        choices=["openpyxl", "xml"],
+        help="How formulas are read from the workbook (default: openpyxl).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for the cache of built graphs (default: ~/.cache/graphedexcel).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the workbook, without reading or writing the graph cache.",
+    )
+    return parser.parse_args(argv)
+
+
+def query_main(argv):
+    import shlex
+
+    from .reachability import QUERIES, ReachabilityIndex, run_query
+
+    args = parse_query_arguments(argv)
+    if not os.path.exists(args.path_to_excel):
+        logger.error(f"File not found: {args.path_to_excel}")
+        sys.exit(1)
+
+    build_options = {
+        "as_directed": True,
+        "expand_ranges": not args.compact_ranges,
+        "reader": args.reader,
+        "compact": args.compact_graph,
+    }
+    if args.no_cache:
+        graph, _ = build_graph_and_stats(args.path_to_excel, **build_options)
+    else:
+        graph, _ = cached_build_graph_and_stats(
+            args.path_to_excel, args.cache_dir, **build_options
+        )
+    index = ReachabilityIndex(graph)
+    logger.info(f"Indexed {len(index)} nodes.")
+
+    queries = [("precedents", [node]) for node in args.precedents]
+    queries += [("dependents", [node]) for node in args.dependents]
+    queries += [("depends-on", pair) for pair in args.depends_on]
+    for query, nodes in queries:
+        run_query(index, query, nodes, args.count)
+
+    if args.stdin:
+        for line in sys.stdin:
+            words = shlex.split(line)
+            if not words:
+                continue
+            query, nodes = words[0], words[1:]
+            if query not in QUERIES or len(nodes) != (
+                2 if query == "depends-on" else 1
+            ):
+                print(f"Invalid query: {line.strip()}", file=sys.stderr)
+                continue
+            run_query(index, query, nodes, args.count)
+            sys.stdout.flush()
+
+
+def stream_edges_main(args):
+    edges_format = args.edges_format
+    if edges_format is None:
+        edges_format = "csv" if args.edges.lower().endswith(".csv") else "ndjson"
+    options = {
+        "format": edges_format,
+        "expand_ranges": not args.compact_ranges,
+        "reader": args.reader,
+    }
+    if args.edges == "-":
+        counts, build_stats = stream_edges(args.path_to_excel, sys.stdout, **options)
+        # stdout carries the edges
+        print_edge_summary(counts, build_stats, file=sys.stderr)
+        return
+    with open(args.edges, "w", encoding="utf8", newline="") as stream:
+        counts, build_stats = stream_edges(args.path_to_excel, stream, **options)
+    print_edge_summary(counts, build_stats)
+    logger.info(f"{counts.total} dependencies written to {args.edges}.")
 
 
 def main():
+    if sys.argv[1:2] == ["query"]:
+        query_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        serve_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["batch"]:
+        batch_main(sys.argv[2:])
+        return
+
     args = parse_arguments()
+    with profile(args.profile, args.profile_output):
+        analyze_workbook(args)
+
 
-    path_to_excel = args.path_to_excel
+def analyze_workbook(args):
+    path_to_excel = args.path_to_excel or args.import_path
 
     # Check if the file exists
     if not os.path.exists(path_to_excel):
@@ -89,19 +647,104 @@ def main():
 
         sys.exit(1)
 
+    if args.dependency_analysis and not (args.as_directed_graph or args.import_path):
+        logger.error("--dependency-analysis needs --as-directed-graph.")
+        sys.exit(1)
+
+    if args.edges:
+        stream_edges_main(args)
+        sys.exit(0)
+
     # Build the dependency graph and gather statistics
-    dependency_graph, function_stats = build_graph_and_stats(
-        path_to_excel,
-        as_directed=args.as_directed_graph,
+    build_options = {
+        "as_directed": args.as_directed_graph,
+        "expand_ranges": not args.compact_ranges,
+        "workers": args.workers,
+        "reader": args.reader,
+        "compact": args.compact_graph,
+        "condensed": args.condensed_graph,
+    }
+    if args.max_memory is not None:
+        build_options["max_memory"] = args.max_memory
+    if args.import_path:
+        try:
+            with profiling.stage("import"):
+                dependency_graph, build_stats = import_graph(
+                    args.import_path, compact=args.compact_graph
+                )
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not import {args.import_path}: {e}")
+            sys.exit(1)
+        if args.dependency_analysis and not dependency_graph.is_directed():
+            logger.error("--dependency-analysis needs a graph exported as directed.")
+            sys.exit(1)
+    elif args.incremental:
+        dependency_graph, build_stats, changes = incremental_build_graph_and_stats(
+            path_to_excel,
+            args.incremental,
+            as_directed=args.as_directed_graph,
+            expand_ranges=not args.compact_ranges,
+            reader=args.reader,
+            compact=args.compact_graph,
+            condensed=args.condensed_graph,
+        )
+        print_changes(changes)
+    elif args.no_cache or args.max_memory is not None:
+        # graphs built on disk are not cached
+        dependency_graph, build_stats = build_graph_and_stats(
+            path_to_excel, **build_options
+        )
+    else:
+        dependency_graph, build_stats = cached_build_graph_and_stats(
+            path_to_excel, args.cache_dir, **build_options
+        )
+
+    if args.export:
+        with profiling.stage("export"):
+            export_graph(dependency_graph, build_stats, args.export)
+        logger.info(f"Exported the dependency graph to {args.export}")
+
+    logger.info(
+        f"Parsed {build_stats.formula_count} formulas in {len(build_stats.sheets)} "
+        f"sheets in {build_stats.total_seconds:.2f}s"
     )
 
     # Print summary of the dependency graph
-    print_summary(dependency_graph, function_stats)
+    with profiling.stage("summary"):
+        summary = summarize(dependency_graph, build_stats)
+
+    if args.summary_format == "json":
+        data = summary.to_dict()
+        if args.dependency_analysis:
+            with profiling.stage("dependency analysis"):
+                data["dependency_analysis"] = analyze_dependencies(
+                    dependency_graph
+                ).to_dict()
+        print(json.dumps(data, indent=2))
+    else:
+        print_summary(dependency_graph, build_stats, summary)
+        if args.dependency_analysis:
+            with profiling.stage("dependency analysis"):
+                print_dependency_analysis(analyze_dependencies(dependency_graph))
 
     if args.no_visualize:
         logger.info("Skipping visualization as per the '--no-visualize' flag.")
         sys.exit(0)
 
+    # a CompactGraph is only converted to networkx for the other layouts and
+    # renderers, see visualize_dependency_graph
+    from_arrays = args.layout == "grid" and args.renderer == "fast"
+    if (
+        args.max_memory is not None
+        and not from_arrays
+        and not fits_in_memory(dependency_graph, args.max_memory)
+    ):
+        logger.warning(
+            "Skipping visualization, the graph does not fit in --max-memory. "
+            "Use --layout grid --renderer fast to draw it from its arrays."
+        )
+        sys.exit(0)
+
     logger.info("Visualizing the graph of dependencies. (This might take a while...)")
 
     # Determine layout
@@ -118,9 +761,26 @@ def main():
         base_name = os.path.splitext(os.path.basename(path_to_excel))[0]
         filename = f"{base_name}_dependency_graph.png"
 
+    # Computed layouts are cached next to the graphs, so rendering the same
+    # graph with other settings skips the layout
+    layout_cache = None
+    if not args.no_cache:
+        layout_cache = LayoutCache(args.cache_dir, name=os.path.abspath(path_to_excel))
+
+    # matplotlib is only imported when the graph is visualized
+    with profiling.stage("import matplotlib"):
+        from .graph_visualizer import visualize_dependency_graph
+
     # Visualize the dependency graph
     visualize_dependency_graph(
-        dependency_graph, filename, config_path, layout, args.hide_legends
+        dependency_graph,
+        filename,
+        config_path,
+        layout,
+        args.hide_legends,
+        renderer=args.renderer,
+        seed=args.seed,
+        layout_cache=layout_cache,
     )
 
     logger.info(f"Dependency graph image saved to {filename}.")
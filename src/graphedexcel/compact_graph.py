@@ -0,0 +1,339 @@
+"""
+A compact dependency graph for very large workbooks.
+
+Sheet names are interned and every node is stored as integers
+(sheet id, kind, row and column bounds) in arrays, with the edges kept as two
+arrays of node ids. String node names like 'Sheet1!A1' are only created when
+asked for, and the graph is converted to networkx only on request.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from .excel_parser import MAX_COLUMN, MAX_ROW, range_bounds
+from .range_index import RangeIndex
+
+# Node kinds
+CELL = 0
+RANGE = 1
+COLUMN_RANGE = 2  # whole columns, like A:C
+ROW_RANGE = 3  # whole rows, like 1:3
+
+# Bits used for rows and columns when packing a node into a single integer,
+# enough for MAX_ROW and MAX_COLUMN
+_ROW_BITS = 21
+_COLUMN_BITS = 15
+
+# Node name lookups are memoized up to this many names while building
+_NAME_CACHE_SIZE = 65536
+
+
+def parse_node(node: str) -> Tuple[str, int, int, int, int, int]:
+    """
+    The sheet, kind and (row1, col1, row2, col2) bounds of a node name like
+    'Sheet1!A1' or 'Sheet1!A1:B3'. A cell has the same start and end.
+    """
+    sheet, _, reference = node.rpartition("!")
+    if ":" in reference:
+        if reference[0].isdigit():
+            kind = ROW_RANGE
+        elif reference[-1].isdigit():
+            kind = RANGE
+        else:
+            kind = COLUMN_RANGE
+        col1, row1, col2, row2 = range_bounds(reference)[1]
+    else:
+        kind = CELL
+        row1, col1 = coordinate_to_tuple(reference)
+        row2, col2 = row1, col1
+    return sheet, kind, row1, col1, row2, col2
+
+
+class CompactGraph:
+    """
+    Dependency graph with integer-encoded nodes and array-backed edges.
+
+    Nodes and edges are added with the same add_node/add_edge calls as a
+    networkx graph, so it can be passed to the graph builder directly.
+    Duplicate edges, self loops and isolated nodes are removed by finalize().
+    """
+
+    def __init__(self, directed: bool = True):
+        self.directed = directed
+        self.sheets: List[str] = []
+        self._sheet_ids: Dict[str, int] = {}
+
+        # node table, one entry per node id
+        self._kind = array("b")
+        self._sheet = array("i")
+        self._row1 = array("i")
+        self._col1 = array("i")
+        self._row2 = array("i")
+        self._col2 = array("i")
+        # edges as (source id, target id)
+        self._src = array("i")
+        self._dst = array("i")
+
+        self._node_ids: Dict[int, int] = {}
+        self._name_cache: Dict[str, int] = {}
+
+    # -- building ---------------------------------------------------------
+
+    def sheet_id(self, sheet: str) -> int:
+        """
+        The interned id of a sheet name.
+        """
+        sheet_id = self._sheet_ids.get(sheet)
+        if sheet_id is None:
+            sheet_id = self._sheet_ids[sheet] = len(self.sheets)
+            self.sheets.append(sheet)
+        return sheet_id
+
+    def add_node(self, node: str, **attr) -> int:
+        """
+        Add a node given by its name, like 'Sheet1!A1' or 'Sheet1!A1:B3', and
+        return its id. Attributes are ignored, the sheet is part of the name.
+        """
+        node_id = self._name_cache.get(node)
+        if node_id is not None:
+            return node_id
+
+        sheet, kind, row1, col1, row2, col2 = parse_node(node)
+        node_id = self._add_encoded(kind, self.sheet_id(sheet), row1, col1, row2, col2)
+        if len(self._name_cache) >= _NAME_CACHE_SIZE:
+            self._name_cache.clear()
+        self._name_cache[node] = node_id
+        return node_id
+
+    def _add_encoded(
+        self, kind: int, sheet_id: int, row1: int, col1: int, row2: int, col2: int
+    ) -> int:
+        # a larger row or column would spill into the other fields of the key
+        # and could give two nodes the same key
+        if max(row1, row2) > MAX_ROW or max(col1, col2) > MAX_COLUMN:
+            raise ValueError(
+                f"Node outside the bounds of a sheet (rows {row1}-{row2}, "
+                f"columns {col1}-{col2})"
+            )
+        key = ((sheet_id << 2 | kind) << _ROW_BITS | row1) << _COLUMN_BITS | col1
+        if kind != CELL:
+            key = (key << _ROW_BITS | row2) << _COLUMN_BITS | col2
+
+        node_id = self._node_ids.get(key)
+        if node_id is None:
+            node_id = self._node_ids[key] = len(self._kind)
+            self._kind.append(kind)
+            self._sheet.append(sheet_id)
+            self._row1.append(row1)
+            self._col1.append(col1)
+            self._row2.append(row2)
+            self._col2.append(col2)
+        return node_id
+
+    def add_nodes_from(self, nodes: Iterable) -> None:
+        for node in nodes:
+            self.add_node(node[0] if isinstance(node, tuple) else node)
+
+    def add_edge(self, u: str, v: str, **attr) -> None:
+        self._src.append(self.add_node(u))
+        self._dst.append(self.add_node(v))
+
+    def add_edges_from(self, edges: Iterable[Tuple[str, str]]) -> None:
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    def link_range_members(self, unbounded_only: bool = False) -> None:
+        """
+        Add an edge from every range node to each cell node within it,
+        without expanding the ranges. With unbounded_only=True only
+        whole-column and whole-row ranges are linked.
+        """
+        kind = np.frombuffer(self._kind, dtype=np.int8)
+        ranges = np.flatnonzero(kind > RANGE if unbounded_only else kind != CELL)
+        if not len(ranges):
+            return
+
+        index = RangeIndex()
+        for node_id in ranges.tolist():
+            bounds = (
+                self._col1[node_id],
+                self._row1[node_id],
+                self._col2[node_id],
+                self._row2[node_id],
+            )
+            index.add(self._sheet[node_id], bounds, node_id)
+
+        for node_id in np.flatnonzero(kind == CELL).tolist():
+            for range_id in index.ranges_containing(
+                self._sheet[node_id], self._row1[node_id], self._col1[node_id]
+            ):
+                self._src.append(range_id)
+                self._dst.append(node_id)
+
+    def finalize(self, as_directed: Optional[bool] = None) -> "CompactGraph":
+        """
+        Remove self loops, duplicate edges and isolated nodes, optionally
+        making the graph undirected. The graph can not be added to afterwards.
+        """
+        if as_directed is not None:
+            self.directed = as_directed
+
+        src = np.frombuffer(self._src, dtype=np.int32).astype(np.int64)
+        dst = np.frombuffer(self._dst, dtype=np.int32).astype(np.int64)
+        keep = src != dst
+        src, dst = src[keep], dst[keep]
+        if not self.directed:
+            src, dst = np.minimum(src, dst), np.maximum(src, dst)
+
+        node_count = len(self._kind)
+        _, first = np.unique(src * node_count + dst, return_index=True)
+        first.sort()
+        src, dst = src[first], dst[first]
+
+        used = np.zeros(node_count, dtype=bool)
+        used[src] = True
+        used[dst] = True
+        new_ids = np.cumsum(used) - 1
+
+        self.kind = np.frombuffer(self._kind, dtype=np.int8)[used]
+        self.sheet = np.frombuffer(self._sheet, dtype=np.int32)[used]
+        self.row1 = np.frombuffer(self._row1, dtype=np.int32)[used]
+        self.col1 = np.frombuffer(self._col1, dtype=np.int32)[used]
+        self.row2 = np.frombuffer(self._row2, dtype=np.int32)[used]
+        self.col2 = np.frombuffer(self._col2, dtype=np.int32)[used]
+        self.src = new_ids[src].astype(np.int32)
+        self.dst = new_ids[dst].astype(np.int32)
+
+        # the build-time tables are not needed anymore
+        for name in ["_kind", "_sheet", "_row1", "_col1", "_row2", "_col2"]:
+            setattr(self, name, None)
+        self._src = self._dst = None
+        self._node_ids = self._name_cache = None
+        return self
+
+    # -- queries ----------------------------------------------------------
+
+    def is_directed(self) -> bool:
+        return self.directed
+
+    def number_of_nodes(self) -> int:
+        return len(self.kind)
+
+    def number_of_edges(self) -> int:
+        return len(self.src)
+
+    def node_name(self, node_id: int) -> str:
+        """
+        The name of a node, like 'Sheet1!A1' or 'Sheet1!A1:B3'.
+        """
+        sheet = self.sheets[self.sheet[node_id]]
+        kind = self.kind[node_id]
+        row1, col1 = int(self.row1[node_id]), int(self.col1[node_id])
+        if kind == CELL:
+            return f"{sheet}!{get_column_letter(col1)}{row1}"
+
+        row2, col2 = int(self.row2[node_id]), int(self.col2[node_id])
+        if kind == COLUMN_RANGE:
+            return f"{sheet}!{get_column_letter(col1)}:{get_column_letter(col2)}"
+        if kind == ROW_RANGE:
+            return f"{sheet}!{row1}:{row2}"
+        return (
+            f"{sheet}!{get_column_letter(col1)}{row1}:{get_column_letter(col2)}{row2}"
+        )
+
+    def node_names(self) -> Iterator[str]:
+        for node_id in range(self.number_of_nodes()):
+            yield self.node_name(node_id)
+
+    def node_sheets(self) -> List[str]:
+        """
+        The sheet name of every node, in node id order.
+        """
+        return [self.sheets[sheet_id] for sheet_id in self.sheet.tolist()]
+
+    def out_degree(self) -> np.ndarray:
+        return np.bincount(self.src, minlength=self.number_of_nodes())
+
+    def in_degree(self) -> np.ndarray:
+        return np.bincount(self.dst, minlength=self.number_of_nodes())
+
+    def degree(self) -> np.ndarray:
+        """
+        Degree of every node, in node id order.
+        """
+        return self.out_degree() + self.in_degree()
+
+    def csr(self):
+        """
+        The adjacency matrix as a scipy sparse CSR array.
+        For undirected graphs, every edge is stored in both directions.
+        """
+        from scipy.sparse import csr_array
+
+        src, dst = self.src, self.dst
+        if not self.directed:
+            src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+        size = self.number_of_nodes()
+        data = np.ones(len(src), dtype=np.int8)
+        return csr_array((data, (src, dst)), shape=(size, size))
+
+    def to_networkx(self) -> nx.Graph:
+        """
+        Convert to a networkx DiGraph (or Graph if undirected), with the same
+        node names and sheet attributes as the graph builder produces.
+        """
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        names = list(self.node_names())
+        graph.add_nodes_from(
+            (name, {"sheet": sheet}) for name, sheet in zip(names, self.node_sheets())
+        )
+        graph.add_edges_from(
+            (names[u], names[v]) for u, v in zip(self.src.tolist(), self.dst.tolist())
+        )
+        return graph
+
+    @classmethod
+    def from_arrays(
+        cls,
+        sheets: List[str],
+        kind: np.ndarray,
+        sheet: np.ndarray,
+        row1: np.ndarray,
+        col1: np.ndarray,
+        row2: np.ndarray,
+        col2: np.ndarray,
+        src: np.ndarray,
+        dst: np.ndarray,
+        directed: bool = True,
+    ) -> "CompactGraph":
+        """
+        A finalized compact graph made of the node and edge arrays of another,
+        like the ones written by export_graph. The arrays are used as they are,
+        so they can be memory-mapped.
+        """
+        graph = cls(directed=directed)
+        graph.sheets = list(sheets)
+        graph.kind, graph.sheet = kind, sheet
+        graph.row1, graph.col1, graph.row2, graph.col2 = row1, col1, row2, col2
+        graph.src, graph.dst = src, dst
+        for name in ["_kind", "_sheet", "_row1", "_col1", "_row2", "_col2"]:
+            setattr(graph, name, None)
+        graph._src = graph._dst = None
+        graph._node_ids = graph._name_cache = None
+        graph._sheet_ids = {name: i for i, name in enumerate(graph.sheets)}
+        return graph
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph) -> "CompactGraph":
+        """
+        Build a compact graph from a dependency graph made by the graph builder.
+        """
+        compact = cls(directed=graph.is_directed())
+        compact.add_nodes_from(graph.nodes)
+        compact.add_edges_from(graph.edges)
+        return compact.finalize()
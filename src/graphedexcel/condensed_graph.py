@@ -0,0 +1,111 @@
+"""
+A sheet-level dependency graph for workbooks too large to look at cell by cell.
+
+The CondensedGraphBuilder takes the add_node/add_edge calls of the graph builder
+and only counts them per sheet, so no per-cell node is ever kept. The result is
+a graph with a node per sheet and an edge per pair of sheets with references
+between them, weighted by the number of references.
+"""
+
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import networkx as nx
+
+
+class CondensedGraphBuilder:
+    """
+    Collects a sheet-level graph from the calls the graph builder makes to build
+    a cell-level graph, so it can be passed to the graph builder directly.
+
+    A reference from a formula in one sheet to a cell or range in another sheet
+    counts towards the weight of the edge between the sheets, and a reference
+    within a sheet towards the "internal" count of the sheet. The edges from a
+    range to its cells are not references and are not counted. Like the edges of
+    the cell-level graph, a reference is counted once per formula cell even if
+    the formula repeats it; the edges of a cell are always added one after
+    another, so only the targets of the current cell need to be remembered.
+    """
+
+    def __init__(self):
+        self.internal: Dict[str, int] = {}  # sheet -> references within the sheet
+        self.weights: Dict[Tuple[str, str], int] = {}
+        self._source: Optional[str] = None
+        self._targets: Set[str] = set()
+
+    def add_node(self, node: str, sheet: Optional[str] = None, **attr) -> None:
+        if sheet is None:
+            sheet = node.rpartition("!")[0]
+        self.internal.setdefault(sheet, 0)
+
+    def add_nodes_from(self, nodes: Iterable) -> None:
+        for node in nodes:
+            if isinstance(node, tuple):
+                self.add_node(node[0], **node[1])
+            else:
+                self.add_node(node)
+
+    def add_edge(self, u: str, v: str, **attr) -> None:
+        if u == v:
+            return
+        source_sheet, _, reference = u.rpartition("!")
+        if ":" in reference:
+            return  # from a range to one of its cells
+        if u != self._source:
+            self._source = u
+            self._targets.clear()
+        elif v in self._targets:
+            return
+        self._targets.add(v)
+        target_sheet = v.rpartition("!")[0]
+        if source_sheet == target_sheet:
+            self.internal[source_sheet] = self.internal.get(source_sheet, 0) + 1
+        else:
+            self.internal.setdefault(source_sheet, 0)
+            self.internal.setdefault(target_sheet, 0)
+            key = (source_sheet, target_sheet)
+            self.weights[key] = self.weights.get(key, 0) + 1
+
+    def add_edges_from(self, edges: Iterable[Tuple[str, str]]) -> None:
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    def finalize(self, as_directed: bool = False) -> nx.Graph:
+        """
+        The sheet-level graph: a DiGraph, or a Graph with the weights of both
+        directions added up. Sheets without any references are left out, like
+        isolated cells in the cell-level graph.
+        """
+        return condensed_graph(self.internal, self.weights, as_directed)
+
+
+def condensed_graph(
+    internal: Dict[str, int],
+    weights: Dict[Tuple[str, str], int],
+    as_directed: bool = False,
+) -> nx.Graph:
+    """
+    Build the sheet-level graph from the internal reference count of every sheet
+    and the weights of the references between sheets. The graph is marked with
+    graph.graph["condensed"] = True.
+    """
+    graph = nx.DiGraph() if as_directed else nx.Graph()
+    graph.graph["condensed"] = True
+    connected = {sheet for pair in weights for sheet in pair}
+    graph.add_nodes_from(
+        (sheet, {"sheet": sheet, "internal": count})
+        for sheet, count in internal.items()
+        if count or sheet in connected
+    )
+    for (u, v), weight in weights.items():
+        if graph.has_edge(u, v):
+            graph[u][v]["weight"] += weight
+        else:
+            graph.add_edge(u, v, weight=weight)
+    return graph
+
+
+def is_condensed(graph) -> bool:
+    """
+    Whether the graph is a sheet-level graph made by the CondensedGraphBuilder.
+    """
+    return isinstance(graph, nx.Graph) and graph.graph.get("condensed", False)
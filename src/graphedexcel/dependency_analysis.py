@@ -0,0 +1,421 @@
+"""
+Recalculation analysis of a directed dependency graph.
+
+Edges point from a formula cell to the cells and ranges it references, so a
+cell can be calculated once everything it points to is calculated. From that
+follow the evaluation order of the cells, the depth of every cell (the longest
+chain of formulas it waits for), the critical path (the longest chain of all),
+the width of every depth level (how many cells could be calculated in parallel)
+and the circular references (the strongly connected components).
+
+Everything is computed on integer arrays: the strongly connected components
+with scipy, and the order and depths level by level over the condensation of
+the components, touching every edge once, so it runs in linear time on graphs
+with millions of edges.
+"""
+
+from dataclasses import dataclass, field
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import networkx as nx
+import numpy as np
+
+from .compact_graph import CELL, CompactGraph
+
+# Rounds of Kahn's algorithm with at least this many nodes use array operations
+VECTORIZED_ROUND_SIZE = 64
+
+
+@dataclass
+class DependencyAnalysis:
+    """
+    The result of analyze_dependencies. Nodes are referred to by id, in the
+    order of the nodes of the graph; node_name gives the node of an id.
+    """
+
+    order: np.ndarray  # node ids in a valid evaluation order
+    depth: np.ndarray  # depth per node id, 0 for cells without precedents
+    level_widths: np.ndarray  # number of cells per depth
+    critical_path: List[int]  # node ids of a longest chain, deepest first
+    cycles: List[List[int]]  # node ids of every circular reference
+    node_name: Callable[[int], Hashable] = field(repr=False)
+
+    @property
+    def max_depth(self) -> int:
+        """
+        The largest depth, -1 for an empty graph.
+        """
+        return len(self.level_widths) - 1
+
+    def evaluation_order(self) -> Iterator[Hashable]:
+        """
+        The nodes in an order in which they can be calculated. Circular
+        references are kept together.
+        """
+        return (self.node_name(i) for i in self.order.tolist())
+
+    def depths(self) -> Dict[Hashable, int]:
+        """
+        The depth of every node.
+        """
+        return {self.node_name(i): d for i, d in enumerate(self.depth.tolist())}
+
+    def to_dict(self, top: int = 10) -> dict:
+        """
+        The results as a JSON-serializable dict, with the nodes of the critical
+        path and of the largest `top` circular references.
+        """
+        cycles = sorted(self.cycles, key=len, reverse=True)
+        return {
+            "max_depth": self.max_depth,
+            "max_level_width": int(self.level_widths.max(initial=0)),
+            "level_widths": self.level_widths.tolist(),
+            "critical_path": [self.node_name(i) for i in self.critical_path],
+            "cycle_count": len(self.cycles),
+            "cycles": [[self.node_name(i) for i in cycle] for cycle in cycles[:top]],
+        }
+
+
+def analyze_dependencies(graph: Union[nx.DiGraph, CompactGraph]) -> DependencyAnalysis:
+    """
+    Analyze the recalculation of a directed dependency graph, a networkx DiGraph
+    or a directed CompactGraph. Range nodes take no calculation of their own, so
+    they add nothing to the depth of the cells that reference them.
+    """
+    count, src, dst, is_cell, node_name = graph_arrays(graph)
+    components, labels = strongly_connected_components(count, src, dst)
+    # a circular reference takes a calculation step if any of its nodes is a cell
+    weight = np.zeros(components, dtype=np.int64)
+    np.maximum.at(weight, labels, is_cell.astype(np.int64))
+
+    # the edges between components
+    csrc, cdst = labels[src], labels[dst]
+    between = csrc != cdst
+    csrc, cdst = csrc[between], cdst[between]
+
+    rounds, component_depth = dependency_levels(components, csrc, cdst, weight)
+
+    depth = component_depth[labels]
+    # evaluation order: by the round in which the component became ready
+    order = np.argsort(rounds[labels], kind="stable")
+    max_depth = int(depth.max()) if count else -1
+    level_widths = np.bincount(depth[is_cell], minlength=max_depth + 1)
+
+    sizes = np.bincount(labels, minlength=components)
+    cyclic = np.flatnonzero(sizes > 1)
+    cycles: List[List[int]] = []
+    if len(cyclic):
+        members = np.flatnonzero(sizes[labels] > 1)
+        members = members[np.argsort(labels[members], kind="stable")]
+        split = np.split(members, np.cumsum(sizes[cyclic])[:-1])
+        cycles = [cycle.tolist() for cycle in split]
+
+    path = critical_path(components, csrc, cdst, component_depth, labels, count)
+    return DependencyAnalysis(order, depth, level_widths, path, cycles, node_name)
+
+
+class GraphArrays(NamedTuple):
+    """
+    A directed dependency graph as integer arrays, with nodes numbered in the
+    order of the graph.
+    """
+
+    count: int
+    src: np.ndarray
+    dst: np.ndarray
+    is_cell: np.ndarray  # False for range nodes
+    node_name: Callable[[int], Hashable]
+
+
+def graph_arrays(graph: Union[nx.DiGraph, CompactGraph]) -> GraphArrays:
+    """
+    The nodes and edges of a directed networkx graph or CompactGraph as arrays.
+    Raises ValueError for an undirected graph.
+    """
+    if not graph.is_directed():
+        raise ValueError(
+            "The dependency analysis needs a directed graph (--as-directed-graph)."
+        )
+    if isinstance(graph, CompactGraph):
+        return GraphArrays(
+            graph.number_of_nodes(),
+            graph.src.astype(np.int64),
+            graph.dst.astype(np.int64),
+            graph.kind == CELL,
+            graph.node_name,
+        )
+
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.fromiter(
+        (index[n] for edge in graph.edges for n in edge),
+        dtype=np.int64,
+        count=2 * graph.number_of_edges(),
+    ).reshape(-1, 2)
+    is_cell = np.fromiter(
+        (not _is_range(node) for node in nodes), dtype=bool, count=len(nodes)
+    )
+    return GraphArrays(len(nodes), edges[:, 0], edges[:, 1], is_cell, nodes.__getitem__)
+
+
+def _is_range(node) -> bool:
+    return isinstance(node, str) and ":" in node.rpartition("!")[2]
+
+
+def strongly_connected_components(
+    count: int, src: np.ndarray, dst: np.ndarray
+) -> Tuple[int, np.ndarray]:
+    """
+    The number of strongly connected components of the graph with the given
+    edges, and the component of every node.
+    """
+    if not count:
+        return 0, np.zeros(0, dtype=np.int64)
+    # scipy is only imported when a graph is analyzed
+    from scipy.sparse import csr_array
+    from scipy.sparse.csgraph import connected_components
+
+    adjacency = csr_array(
+        (np.ones(len(src), dtype=bool), (src, dst)), shape=(count, count)
+    )
+    adjacency.sum_duplicates()
+    components, labels = connected_components(
+        adjacency, directed=True, connection="strong"
+    )
+    return components, labels.astype(np.int64)
+
+
+def weakly_connected_components(
+    count: int, src: np.ndarray, dst: np.ndarray, chunk_size: Optional[int] = None
+) -> Tuple[int, np.ndarray]:
+    """
+    The number of connected components of the graph with the given edges,
+    ignoring their direction, and the component of every node.
+
+    Computed with numpy alone, so summarizing a graph does not import scipy:
+    every round hooks the root of each edge's larger label onto the smaller
+    label and then jumps every node to its root, which takes a few rounds even
+    for long chains. With a chunk_size the edges are read that many at a time,
+    so memory-mapped edge arrays are never loaded as a whole.
+    """
+    parent = np.arange(count, dtype=np.int64)
+    chunk_size = chunk_size or max(len(src), 1)
+    # the edges joining different components, once they fit in a chunk
+    pending: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    while True:
+        chunks = (
+            [pending] if pending is not None else _edge_chunks(src, dst, chunk_size)
+        )
+        left_src, left_dst = [], []
+        for chunk_src, chunk_dst in chunks:
+            source_roots, target_roots = parent[chunk_src], parent[chunk_dst]
+            differ = source_roots != target_roots
+            if not differ.any():
+                continue
+            source_roots, target_roots = source_roots[differ], target_roots[differ]
+            low = np.minimum(source_roots, target_roots)
+            high = np.maximum(source_roots, target_roots)
+            np.minimum.at(parent, high, low)
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+            left_src.append(chunk_src[differ])
+            left_dst.append(chunk_dst[differ])
+        if not left_src:
+            break
+        if sum(len(chunk) for chunk in left_src) <= chunk_size:
+            pending = (np.concatenate(left_src), np.concatenate(left_dst))
+    roots, labels = np.unique(parent, return_inverse=True)
+    return len(roots), labels.astype(np.int64)
+
+
+def _edge_chunks(
+    src: np.ndarray, dst: np.ndarray, chunk_size: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    for start in range(0, len(src), chunk_size):
+        end = start + chunk_size
+        yield np.asarray(src[start:end], dtype=np.int64), np.asarray(
+            dst[start:end], dtype=np.int64
+        )
+
+
+def gather_rows(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The positions of the entries of the given CSR rows, and the row of each.
+    """
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total), np.repeat(rows, lengths)
+
+
+def csr_arrays(
+    count: int, rows: np.ndarray, columns: np.ndarray
+) -> Tuple[np.ndarray, ...]:
+    """
+    The distinct (row, column) pairs as CSR (indptr, indices).
+    """
+    # scipy is only imported when a graph is analyzed
+    from scipy.sparse import csr_array
+
+    matrix = csr_array(
+        (np.ones(len(rows), dtype=bool), (rows, columns)), shape=(count, count)
+    )
+    matrix.sum_duplicates()
+    return matrix.indptr.astype(np.int64), matrix.indices.astype(np.int64)
+
+
+def dependency_levels(
+    count: int, src: np.ndarray, dst: np.ndarray, weight: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Kahn's algorithm on a DAG with edges from dependents to precedents,
+    processing all ready nodes at once. Returns the round in which every node
+    became ready and its depth: the largest depth of its precedents plus its
+    weight, 0 for nodes without precedents. Every edge is visited once.
+
+    Large rounds are processed with array operations. Small rounds, like the
+    many rounds of a long chain of formulas, are processed one edge at a time,
+    which avoids the fixed cost of the array operations per round.
+    """
+    rounds = np.zeros(count, dtype=np.int64)
+    depth = np.zeros(count, dtype=np.int64)
+    if not count:
+        return rounds, depth
+    indptr, dependents = csr_arrays(count, dst, src)
+    waiting = np.bincount(dependents, minlength=count)  # precedents not calculated
+    # views on the same memory for fast access to single elements
+    views = [
+        memoryview(a) for a in (rounds, depth, weight, indptr, dependents, waiting)
+    ]
+    rounds_v, depth_v, weight_v, indptr_v, dependents_v, waiting_v = views
+
+    frontier = np.flatnonzero(waiting == 0)
+    current = 0
+    while len(frontier):
+        if len(frontier) >= VECTORIZED_ROUND_SIZE:
+            frontier = np.asarray(frontier)
+            rounds[frontier] = current
+            positions, precedents = gather_rows(indptr, frontier)
+            successors = dependents[positions]
+            np.maximum.at(depth, successors, depth[precedents] + weight[successors])
+            np.subtract.at(waiting, successors, 1)
+            frontier = np.unique(successors[waiting[successors] == 0])
+        else:
+            ready = []
+            for precedent in (
+                frontier.tolist() if isinstance(frontier, np.ndarray) else frontier
+            ):
+                rounds_v[precedent] = current
+                precedent_depth = depth_v[precedent]
+                for position in range(indptr_v[precedent], indptr_v[precedent + 1]):
+                    successor = dependents_v[position]
+                    successor_depth = precedent_depth + weight_v[successor]
+                    if successor_depth > depth_v[successor]:
+                        depth_v[successor] = successor_depth
+                    waiting_v[successor] -= 1
+                    if not waiting_v[successor]:
+                        ready.append(successor)
+            frontier = ready
+        current += 1
+
+    if (waiting > 0).any():
+        raise ValueError("The graph of components has a cycle.")
+    return rounds, depth
+
+
+def critical_path(
+    components: int,
+    csrc: np.ndarray,
+    cdst: np.ndarray,
+    component_depth: np.ndarray,
+    labels: np.ndarray,
+    count: int,
+) -> List[int]:
+    """
+    The node ids of a longest chain of dependencies, from the deepest node down
+    to a node without precedents, one node per component on the chain.
+    """
+    if not count:
+        return []
+    # the first node of every component represents it
+    representative = np.full(components, count, dtype=np.int64)
+    np.minimum.at(representative, labels, np.arange(count))
+
+    indptr, precedents_of = csr_arrays(components, csrc, cdst)
+    indptr_v, precedents_v = memoryview(indptr), memoryview(precedents_of)
+    depth_v = memoryview(np.ascontiguousarray(component_depth, dtype=np.int64))
+
+    component = int(np.argmax(component_depth))
+    path = [component]
+    while indptr_v[component] < indptr_v[component + 1]:
+        # follow the precedent the depth of the component comes from
+        best = -1
+        for position in range(indptr_v[component], indptr_v[component + 1]):
+            precedent = precedents_v[position]
+            if depth_v[precedent] > best:
+                best, component = depth_v[precedent], precedent
+        path.append(component)
+    return representative[path].tolist()
+
+
+def print_dependency_analysis(analysis: DependencyAnalysis, top: int = 10) -> None:
+    """
+    Print the depth and parallelism of the recalculation, the critical path and
+    the circular references. Long lists are cut to their first and last `top`.
+    """
+    strpadsize = 28
+    numpadsize = 5
+    widths = analysis.level_widths
+
+    def row(label, value):
+        print(str(label).ljust(strpadsize) + str(value).rjust(numpadsize))
+
+    print("===  Recalculation analysis   ===")
+    row("Max dependency depth", analysis.max_depth)
+    row("Widest level", int(widths.max(initial=0)))
+    row("Circular references", len(analysis.cycles))
+
+    print("\n===  Cells per depth level    ===")
+    for level in _elided(range(len(widths)), top):
+        if level is None:
+            print("...")
+        else:
+            row(f"Depth {level}", int(widths[level]))
+
+    print("\n===  Critical path            ===")
+    for i in _elided(analysis.critical_path, top):
+        if i is None:
+            print("...")
+        else:
+            row(analysis.node_name(i), int(analysis.depth[i]))
+
+    if analysis.cycles:
+        print("\n===  Circular references      ===")
+        for cycle in sorted(analysis.cycles, key=len, reverse=True)[:top]:
+            names = [str(analysis.node_name(i)) for i in cycle]
+            shown = ", ".join(names[:5]) + (", ..." if len(names) > 5 else "")
+            print(f"{len(names)} cells: {shown}")
+    print()
+
+
+def _elided(items, top: int) -> list:
+    """
+    The first and last `top` items, with None in between if any are left out.
+    """
+    items = list(items)
+    if len(items) <= 2 * top:
+        return items
+    return items[:top] + [None] + items[-top:]
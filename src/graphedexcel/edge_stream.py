@@ -0,0 +1,200 @@
+"""
+Streaming output of the dependency edges of a workbook, for workbooks too large
+to hold as a graph and for bulk loading into a graph database.
+
+The EdgeStreamWriter takes the add_node/add_edge calls of the graph builder and
+writes every edge as soon as it is found, as NDJSON or CSV, so memory use does
+not grow with the size of the workbook. Only counters are kept for the summary.
+"""
+
+import csv
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional, Set, TextIO, Tuple
+
+from .build_stats import BuildStats, SheetStats
+from .graphbuilder import FormulaGraphBuilder, sanitize_sheetname
+from .xlsx_reader import open_formula_reader
+
+logger = logging.getLogger(__name__)
+
+EDGE_FORMATS = ["ndjson", "csv"]
+EDGE_FIELDS = ["source", "target", "sheet", "kind"]
+
+# Edge kinds
+DIRECT = "direct"  # from a formula cell to a cell it references
+RANGE = "range"  # from a formula cell to a range it references
+RANGE_MEMBER = "range-member"  # from a range to a cell within it
+
+# The ranges whose cells were written are remembered up to this many ranges
+_EXPANDED_RANGES_SIZE = 4096
+
+
+@dataclass
+class EdgeCounts:
+    """
+    Counters of the edges written by an EdgeStreamWriter.
+    """
+
+    kinds: Dict[str, int] = field(
+        default_factory=lambda: {DIRECT: 0, RANGE: 0, RANGE_MEMBER: 0}
+    )
+    cross_sheet: int = 0  # references from a formula to another sheet
+    sheets: Dict[str, int] = field(default_factory=dict)  # edges by source sheet
+
+    @property
+    def total(self) -> int:
+        return sum(self.kinds.values())
+
+    def to_dict(self) -> dict:
+        return {"total": self.total, **asdict(self)}
+
+
+class EdgeStreamWriter:
+    """
+    Writes the edges the graph builder adds to a text stream instead of
+    building a graph, so it can be passed to the graph builder directly.
+
+    Self loops are skipped and, like in the graph, an edge is written once per
+    formula cell even if the formula repeats the reference: the edges of a cell
+    are always added one after another. The cells of an expanded range are
+    written once per range, as long as the range is among the last few thousand
+    ranges written. Whole-column and whole-row ranges and ranges that are not
+    expanded are only written as range edges; linking them to their cells would
+    need every cell of the workbook in memory.
+    """
+
+    def __init__(self, stream: TextIO, format: str = "ndjson"):
+        if format not in EDGE_FORMATS:
+            raise ValueError(f"Unknown edge format '{format}'")
+        self.stream = stream
+        self.format = format
+        self.counts = EdgeCounts()
+        self._csv = None
+        if format == "csv":
+            self._csv = csv.writer(stream, lineterminator="\n")
+            self._csv.writerow(EDGE_FIELDS)
+        self._source: Optional[str] = None
+        self._targets: Set[str] = set()
+        self._expanded: "OrderedDict[str, None]" = OrderedDict()
+
+    def add_node(self, node: str, **attr) -> None:
+        pass  # nodes are only written as part of their edges
+
+    def add_nodes_from(self, nodes) -> None:
+        pass
+
+    def add_edge(self, u: str, v: str, **attr) -> None:
+        if u == v:
+            return
+        sheet, _, reference = u.rpartition("!")
+        cross_sheet = False
+        if ":" in reference:
+            kind = RANGE_MEMBER
+            if u != self._source:
+                if u in self._expanded:
+                    self._expanded.move_to_end(u)
+                    return  # the cells of the range were written before
+                self._expanded[u] = None
+                if len(self._expanded) > _EXPANDED_RANGES_SIZE:
+                    self._expanded.popitem(last=False)
+        else:
+            target_sheet, _, target_reference = v.rpartition("!")
+            kind = RANGE if ":" in target_reference else DIRECT
+            cross_sheet = target_sheet != sheet
+        if u != self._source:
+            self._source = u
+            self._targets.clear()
+        elif v in self._targets:
+            return
+        self._targets.add(v)
+
+        self.counts.kinds[kind] += 1
+        self.counts.cross_sheet += cross_sheet
+        self.counts.sheets[sheet] = self.counts.sheets.get(sheet, 0) + 1
+        if self._csv is not None:
+            self._csv.writerow((u, v, sheet, kind))
+        else:
+            record = {"source": u, "target": v, "sheet": sheet, "kind": kind}
+            self.stream.write(json.dumps(record) + "\n")
+
+    def add_edges_from(self, edges) -> None:
+        for u, v in edges:
+            self.add_edge(u, v)
+
+
+def stream_edges(
+    file_path: str,
+    stream: TextIO,
+    format: str = "ndjson",
+    expand_ranges: bool = True,
+    reader: str = "openpyxl",
+) -> Tuple[EdgeCounts, BuildStats]:
+    """
+    Write the dependency edges of an Excel file to the stream as they are found,
+    without building the graph. Returns the edge counts and build statistics.
+    """
+    writer = EdgeStreamWriter(stream, format)
+    stats = BuildStats()
+    start = time.perf_counter()
+    try:
+        workbook = open_formula_reader(file_path, reader)
+    except Exception as e:
+        logger.error(f"Error loading workbook: {e}")
+        sys.exit(1)
+    stats.load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # one builder for the whole run, so references, ranges and formula
+    # templates are remembered across the sheets like in a graph build
+    builder = FormulaGraphBuilder(writer, expand_ranges)
+    for sheet_name in workbook.sheetnames:
+        sanitized_sheet_name = sanitize_sheetname(sheet_name)
+        sheet_stats = SheetStats()
+        sheet_start = time.perf_counter()
+        for coordinate, formula in workbook.iter_formula_cells(sheet_name):
+            builder.add_formula(coordinate, formula, sanitized_sheet_name, sheet_stats)
+        builder.flush()
+        sheet_stats.record_templates(builder.templates.pop_counts())
+        sheet_stats.seconds = time.perf_counter() - sheet_start
+        stats.add_sheet(sanitized_sheet_name, sheet_stats)
+    workbook.close()
+    stats.parse_seconds = time.perf_counter() - start
+    stream.flush()
+    return writer.counts, stats
+
+
+def print_edge_summary(
+    counts: EdgeCounts, stats: BuildStats, file: Optional[TextIO] = None
+) -> None:
+    """
+    Print the summary of a streamed build, from its counters, to stdout or file.
+    """
+    file = file or sys.stdout
+    strpadsize = 28
+    numpadsize = 5
+    rows = [
+        ("Formula count", stats.formula_count),
+        ("Dependency count", counts.total),
+        ("Direct references", counts.kinds[DIRECT]),
+        ("Range references", counts.kinds[RANGE]),
+        ("Range member edges", counts.kinds[RANGE_MEMBER]),
+        ("Cross-sheet references", counts.cross_sheet),
+    ]
+    print(file=file)
+    print("===  Dependency Edge Summary ===", file=file)
+    for label, value in rows:
+        print(label.ljust(strpadsize) + str(value).rjust(numpadsize), file=file)
+
+    print("\n===  Edges per sheet          ===", file=file)
+    for sheet, count in sorted(counts.sheets.items(), key=lambda item: -item[1]):
+        print(f"{sheet.ljust(strpadsize)}{str(count).rjust(numpadsize)}", file=file)
+
+    print("\n===  Most used functions      ===", file=file)
+    for function, count in sorted(stats.functions.items(), key=lambda item: -item[1]):
+        print(f"{function.ljust(strpadsize)}{str(count).rjust(numpadsize)}", file=file)
+    print(file=file)
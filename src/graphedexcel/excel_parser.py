@@ -1,45 +1,141 @@
 from openpyxl.utils import get_column_letter, range_boundaries
 import re
-from typing import List, Tuple, Dict
+from typing import List, NamedTuple, Optional, Tuple, Dict
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Regex to detect cell references like A1, B2, or ranges like A1:B2
-CELL_REF_REGEX = r"('?[A-Za-z0-9_\-\[\] ]+'?![A-Z]{1,3}[0-9]+(:[A-Z]{1,3}[0-9]+)?)|([A-Z]{1,3}[0-9]+(:[A-Z]{1,3}[0-9]+)?)"  # noqa
+# Largest row and column of a worksheet, used as the bounds of
+# whole-column (A:A) and whole-row (1:3) references
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+_SHEET = r"(?:'(?:[^']|'')+'|[A-Za-z0-9_.\[\]\u00a1-\uffff]+)!"
+_CELL = r"\$?[A-Za-z]{1,3}\$?[0-9]+"
+_AREA = (
+    rf"(?:{_CELL}(?::{_CELL})?"
+    r"|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}"
+    r"|\$?[0-9]+:\$?[0-9]+)"
+)
+_IDENTIFIER = r"[A-Za-z_\\][\w.]*"
+_BRACKETS = r"\[(?:[^\[\]]|\[[^\[\]]*\])*\]"
+
+# Single-pass lexer for formulas. Every token is consumed as a whole, so names
+# like LOG10( or MYNAME1 are never mistaken for cell references and nothing
+# inside a string literal is picked up. The groups are, in order:
+# sheet prefix, reference, identifier, call parenthesis, table brackets and
+# a structured reference without a table name.
+FORMULA_TOKEN_REGEX = re.compile(
+    rf"""
+    "(?:[^"]|"")*"
+  | ((?:{_SHEET})?)
+    (?:({_AREA})(?![\w.(\[!])|({_IDENTIFIER})(?:(\()|({_BRACKETS}))?)
+  | ({_BRACKETS})
+  | [\#0-9][\w./]*[!?]?
+    """,
+    re.VERBOSE,
+)
+
+_BOOLEANS = {"TRUE", "FALSE"}
+_FUNCTION_PREFIXES = ("_XLFN.", "_XLWS.")
+
+
+class FormulaTokens(NamedTuple):
+    """
+    The parts of a formula that matter for the dependency graph.
+    """
+
+    references: List[str]  # cells and ranges, without $ and in order of appearance
+    functions: List[str]  # function names, one entry per call
+    names: List[str]  # defined names
+    table_references: List[str]  # structured references like Table1[Column]
+
 
+def tokenize_formula(formula: str) -> FormulaTokens:
+    """
+    Scan a formula once and collect its references, functions and names.
+
+    Args:
+        formula (str): The formula to tokenize.
 
-def extract_references(formula: str) -> Tuple[List[str], List[str], Dict[str, str]]:
+    Returns:
+        FormulaTokens: The references, functions, defined names and structured
+        table references found in the formula.
     """
-    Extract all referenced cells and ranges from a formula using regular expressions.
+    references = []
+    functions = []
+    names = []
+    table_references = []
+
+    for sheet, area, identifier, call, brackets, bare in FORMULA_TOKEN_REGEX.findall(
+        formula
+    ):
+        if area:
+            references.append(sheet + area.replace("$", "").upper())
+        elif call:
+            function = identifier.upper()
+            if function.startswith(_FUNCTION_PREFIXES):
+                function = function[6:]
+            functions.append(function)
+        elif brackets:
+            table_references.append(identifier + brackets)
+        elif identifier:
+            if identifier.upper() not in _BOOLEANS:
+                names.append(sheet + identifier)
+        elif bare:
+            table_references.append(bare)
+
+    return FormulaTokens(references, functions, names, table_references)
+
+
+def extract_references(
+    formula: str, expand_ranges: bool = True
+) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """
+    Extract all referenced cells and ranges from a formula.
     This returns a list of both individual cells and range references.
 
     Args:
         formula (str): The formula to extract references from.
+        expand_ranges (bool): Whether to expand ranges into their cells.
+            When False, the dependencies dictionary is left empty and ranges
+            are only returned as range references.
 
     Returns:
         Tuple[List[str], List[str], Dict[str, str]]: A tuple containing lists of direct references,
         range references, and a dictionary of dependencies.
     """
-    formula = formula.replace("$", "")
-    matches = re.findall(CELL_REF_REGEX, formula)
-    references = [match[0] if match[0] else match[2] for match in matches]
+    return split_references(tokenize_formula(formula).references, expand_ranges)
+
+
+def split_references(
+    references: List[str], expand_ranges: bool = True
+) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """
+    Split references into direct cell references and range references,
+    optionally expanding the ranges into their cells.
 
-    # Trim the extracted references
-    references = [ref.strip() for ref in references]
+    Whole-column and whole-row ranges (A:A, 1:3) are never expanded.
 
-    expanded_references = []
+    Args:
+        references (List[str]): References as returned by tokenize_formula.
+        expand_ranges (bool): Whether to expand ranges into their cells.
+
+    Returns:
+        Tuple[List[str], List[str], Dict[str, str]]: A tuple containing lists of direct references,
+        range references, and a dictionary of dependencies.
+    """
     dependencies = {}
     direct_references = []
     range_references = []
 
     for reference in references:
         if ":" in reference:  # it's a range like A1:A3
-            expanded_cells = expand_range(reference)
-            expanded_references.extend(expanded_cells)
             range_references.append(reference)
+            if not expand_ranges or is_unbounded_range(reference):
+                continue
             # Store the range-to-cells relationship
-            for cell in expanded_cells:
+            for cell in expand_range(reference):
                 dependencies[cell] = reference
         else:  # single cell
             direct_references.append(reference)
@@ -47,6 +143,40 @@ def extract_references(formula: str) -> Tuple[List[str], List[str], Dict[str, st
     return direct_references, range_references, dependencies
 
 
+def is_unbounded_range(range_reference: str) -> bool:
+    """
+    Check if a range is a whole-column (A:A) or whole-row (1:3) reference.
+    """
+    area = range_reference.rpartition("!")[2]
+    return None in range_boundaries(area)
+
+
+def range_bounds(
+    range_reference: str,
+) -> Tuple[Optional[str], Tuple[int, int, int, int]]:
+    """
+    Split a range reference (e.g., 'Sheet2!A1:B3') into its sheet name and bounds.
+
+    Args:
+        range_reference (str): The range reference to parse.
+
+    Returns:
+        Tuple[Optional[str], Tuple[int, int, int, int]]: The sheet name (None if
+        the range is not sheet qualified) and the bounds as
+        (min_col, min_row, max_col, max_row). Whole-column and whole-row
+        ranges are bounded by the worksheet limits.
+    """
+    sheet_name, _, range_reference = range_reference.rpartition("!")
+    min_col, min_row, max_col, max_row = range_boundaries(range_reference)
+    bounds = (
+        min_col or 1,
+        min_row or 1,
+        max_col or MAX_COLUMN,
+        max_row or MAX_ROW,
+    )
+    return sheet_name or None, bounds
+
+
 def expand_range(range_reference: str) -> List[str]:
     """
     Expand a range reference (e.g., 'A1:A3') into a list of individual cell references.
@@ -0,0 +1,337 @@
+"""
+Deduplication of formulas copied across many cells.
+
+Large sheets often contain the same formula copied down thousands of rows
+(=B2*C2, =B3*C3, ...). These copies only differ in the numbers of their
+relative references, so FormulaTemplates keys its cache of parsed formulas on
+the formula with the numbers left out, together with the numbers that are not
+relative row numbers of references. A formula is tokenized once per template,
+and the references of every copy are filled in from its own row numbers.
+
+The copies of a formula are counted by that template key, the column of the
+cell and the offsets of the relative rows from the row of the cell, which
+together determine the R1C1 form (=RC[-2]*RC[-1]) in which all copies of a
+formula look the same, and are reported by that R1C1 form.
+"""
+
+import re
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from openpyxl.formula.translate import Translator
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple
+
+from .excel_parser import (
+    FORMULA_TOKEN_REGEX,
+    MAX_COLUMN,
+    MAX_ROW,
+    FormulaTokens,
+    tokenize_formula,
+)
+
+# Parsed templates kept by a FormulaTemplates, least recently used first out
+TEMPLATE_CACHE_SIZE = 4096
+
+_NUMBER_REGEX = re.compile(r"([0-9]+)")
+_SEPARATOR = "\x00"  # can not be part of a reference
+
+
+class _Template(NamedTuple):
+    references: str  # format string of the references, filled with the numbers
+    functions: Tuple[str, ...]
+    names: Tuple[str, ...]
+    table_references: Tuple[str, ...]
+
+
+class _Skeleton(NamedTuple):
+    constants: Optional[itemgetter]  # the numbers that are not relative rows
+    rows: Optional[itemgetter]  # the numbers that are relative rows of references
+    templates: Dict[tuple, _Template]  # by the values of those numbers
+
+
+class FormulaTemplates:
+    """
+    Tokenizes formulas through an LRU cache of templates, and counts the copies
+    of every formula. One instance is used for a build, sharing templates
+    between sheets; the counts are taken per sheet with pop_counts().
+    """
+
+    def __init__(self, maxsize: int = TEMPLATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._skeletons: "OrderedDict[str, _Skeleton]" = OrderedDict()
+        # (skeleton, constants, column, row offsets) -> count, and the first copy
+        self._counts: Dict[tuple, int] = {}
+        self._examples: Dict[tuple, Tuple[str, str]] = {}
+
+    def tokenize(self, formula: str, coordinate: str) -> FormulaTokens:
+        """
+        The tokens of the formula of the cell at the coordinate, the same as
+        tokenize_formula(formula) gives, and count the formula.
+        """
+        parts = _NUMBER_REGEX.split(formula)
+        numbers = parts[1::2]
+        skeleton_key = "0".join(parts[0::2])
+        skeleton = self._skeletons.get(skeleton_key)
+        if skeleton is None:
+            skeleton = self._add_skeleton(skeleton_key, formula, parts)
+        else:
+            self._skeletons.move_to_end(skeleton_key)
+
+        constants = _pick(skeleton.constants, numbers)
+        template = skeleton.templates.get(constants)
+        if template is None:
+            if len(skeleton.templates) >= self.maxsize:
+                skeleton.templates.clear()
+            template = skeleton.templates[constants] = _parse_template(formula, parts)
+
+        column = coordinate.rstrip("0123456789")
+        if skeleton.rows is None:
+            key = (skeleton_key, constants, column)
+        else:
+            digits = len(column)
+            cell_row = coordinate[digits:]
+            rows = _pick(skeleton.rows, numbers)
+            if rows.count(cell_row) == len(rows):  # all in the row of the cell
+                key = (skeleton_key, constants, column)
+            else:
+                row = int(cell_row)
+                offsets = [int(number) - row for number in rows]
+                key = (skeleton_key, constants, column, *offsets)
+        count = self._counts.get(key)
+        if count is None:
+            self._counts[key] = 1
+            self._examples[key] = (formula, coordinate)
+        else:
+            self._counts[key] = count + 1
+
+        references = template.references.format(*numbers)
+        references = references.split(_SEPARATOR) if references else []
+        return FormulaTokens(
+            references,
+            list(template.functions),
+            list(template.names),
+            list(template.table_references),
+        )
+
+    def _add_skeleton(self, key: str, formula: str, parts: List[str]) -> _Skeleton:
+        if len(self._skeletons) >= self.maxsize:
+            self._skeletons.popitem(last=False)
+        slots = _reference_row_slots(formula, parts)
+        rows = [slot for slot, relative in slots.items() if relative]
+        constants = [i for i in range(len(parts) // 2) if i not in rows]
+        skeleton = self._skeletons[key] = _Skeleton(
+            _getter(constants), _getter(rows), {}
+        )
+        return skeleton
+
+    def pop_counts(self) -> Dict[str, int]:
+        """
+        The number of cells with every formula counted since the last call,
+        by the R1C1 form of the formula, most copied first.
+        """
+        counts: Dict[str, int] = {}
+        for key, count in self._counts.items():
+            template = r1c1_formula(*self._examples[key])
+            counts[template] = counts.get(template, 0) + count
+        self._counts = {}
+        self._examples = {}
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def _getter(indices: List[int]) -> Optional[itemgetter]:
+    return itemgetter(*indices) if indices else None
+
+
+def _pick(getter: Optional[itemgetter], numbers: List[str]) -> tuple:
+    if getter is None:
+        return ()
+    picked = getter(numbers)
+    return picked if isinstance(picked, tuple) else (picked,)
+
+
+def _number_spans(parts: List[str]) -> List[Tuple[int, int]]:
+    """
+    The (start, end) of every number in the formula split by _NUMBER_REGEX.
+    """
+    spans = []
+    position = 0
+    for index, part in enumerate(parts):
+        if index % 2:
+            spans.append((position, position + len(part)))
+        position += len(part)
+    return spans
+
+
+def _reference_row_slots(formula: str, parts: List[str]) -> Dict[int, bool]:
+    """
+    The indices of the numbers that are row numbers of references, and whether
+    each is a relative row (not preceded by $).
+    """
+    areas = [
+        match.span(2)
+        for match in FORMULA_TOKEN_REGEX.finditer(formula)
+        if match.group(2)
+    ]
+    slots = {}
+    area = 0
+    for slot, (start, end) in enumerate(_number_spans(parts)):
+        while area < len(areas) and areas[area][1] <= start:
+            area += 1
+        if area < len(areas) and areas[area][0] <= start and end <= areas[area][1]:
+            slots[slot] = start == 0 or formula[start - 1] != "$"
+    return slots
+
+
+def _parse_template(formula: str, parts: List[str]) -> _Template:
+    """
+    Tokenize the formula and turn its references into a format string that is
+    filled with the numbers of a copy of the formula.
+    """
+    tokens = tokenize_formula(formula)
+    spans = _number_spans(parts)
+
+    references = []
+    for match in FORMULA_TOKEN_REGEX.finditer(formula):
+        if not match.group(2):
+            continue
+        start, end = match.span(2)
+        reference = _escape(match.group(1))
+        position = start
+        for slot, (number_start, number_end) in enumerate(spans):
+            if start <= number_start and number_end <= end:
+                area = formula[position:number_start].replace("$", "").upper()
+                reference += _escape(area) + "{" + str(slot) + "}"
+                position = number_end
+        reference += _escape(formula[position:end].replace("$", "").upper())
+        references.append(reference)
+
+    return _Template(
+        _SEPARATOR.join(references),
+        tuple(tokens.functions),
+        tuple(tokens.names),
+        tuple(tokens.table_references),
+    )
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def r1c1_formula(formula: str, coordinate: str) -> str:
+    """
+    The formula of the cell at the coordinate with its references in R1C1
+    notation, like =RC[-2]*RC[-1] for =B2*C2 in D2. Copies of a formula
+    have the same R1C1 form.
+    """
+    row, column = coordinate_to_tuple(coordinate)
+    pieces = []
+    position = 0
+    for match in FORMULA_TOKEN_REGEX.finditer(formula):
+        if not match.group(2):
+            continue
+        start, end = match.span(2)
+        pieces.append(formula[position:start])
+        pieces.append(
+            ":".join(
+                _r1c1_part(part, row, column) for part in match.group(2).split(":")
+            )
+        )
+        position = end
+    pieces.append(formula[position:])
+    return "".join(pieces)
+
+
+_PART_REGEX = re.compile(r"(\$?)([A-Za-z]*)(\$?)([0-9]*)")
+
+
+class SharedFormula:
+    """
+    A shared formula of an xlsx sheet, translated to the other cells sharing
+    it. It is parsed once, into the text between its relative rows and columns,
+    so translating it only fills those in; openpyxl's Translator tokenizes the
+    formula again for every cell.
+    """
+
+    def __init__(self, formula: str, coordinate: str):
+        self.formula = formula
+        self.coordinate = coordinate
+        self._row, self._column = coordinate_to_tuple(coordinate)
+        self._text: List[str] = []  # the text around the relative parts
+        self._slots: List[Tuple[bool, int]] = []  # (is a row, row or column)
+        position = 0
+        for match in FORMULA_TOKEN_REGEX.finditer(formula):
+            if not match.group(2):
+                continue
+            start = match.start(2)
+            for part in match.group(2).split(":"):
+                column_absolute, letters, row_absolute, digits = _PART_REGEX.fullmatch(
+                    part
+                ).groups()
+                if letters and not column_absolute:
+                    self._add_slot(formula, position, start, False, letters)
+                    position = start + len(letters)
+                start += len(column_absolute) + len(letters) + len(row_absolute)
+                if digits and not row_absolute:
+                    self._add_slot(formula, position, start, True, digits)
+                    position = start + len(digits)
+                start += len(digits) + 1
+        self._text.append(formula[position:])
+
+    def _add_slot(self, formula, position, start, is_row, value) -> None:
+        self._text.append(formula[position:start])
+        if is_row:
+            self._slots.append((True, int(value)))
+        else:
+            self._slots.append((False, column_index_from_string(value.upper())))
+
+    def translate(self, coordinate: str) -> str:
+        """
+        The formula as it is in the cell at the coordinate.
+        """
+        if not self._slots:
+            return self.formula
+        row, column = coordinate_to_tuple(coordinate)
+        rows, columns = row - self._row, column - self._column
+        pieces = [self._text[0]]
+        for (is_row, value), text in zip(self._slots, self._text[1:]):
+            if is_row:
+                value += rows
+                if not 0 < value <= MAX_ROW:
+                    break
+                pieces.append(str(value))
+            else:
+                value += columns
+                if not 0 < value <= MAX_COLUMN:
+                    break
+                pieces.append(get_column_letter(value))
+            pieces.append(text)
+        else:
+            return "".join(pieces)
+        # a reference moved off the sheet, which openpyxl turns into #REF!
+        return Translator(self.formula, self.coordinate).translate_formula(coordinate)
+
+
+def _r1c1_part(part: str, row: int, column: int) -> str:
+    """
+    One side of a reference (A1, $A$1, A or 1) in R1C1 notation.
+    """
+    column_absolute, letters, row_absolute, digits = _PART_REGEX.fullmatch(
+        part
+    ).groups()
+    r1c1 = ""
+    if digits:
+        r1c1 += _r1c1_offset("R", int(digits), row, bool(row_absolute))
+    if letters:
+        index = column_index_from_string(letters.upper())
+        r1c1 += _r1c1_offset("C", index, column, bool(column_absolute))
+    return r1c1
+
+
+def _r1c1_offset(axis: str, value: int, origin: int, absolute: bool) -> str:
+    if absolute:
+        return f"{axis}{value}"
+    if value == origin:
+        return axis
+    return f"{axis}[{value - origin}]"
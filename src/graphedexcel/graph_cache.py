@@ -0,0 +1,259 @@
+"""
+Persistent on-disk cache of built dependency graphs, so that repeated runs on an
+unchanged workbook skip loading and parsing it.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from importlib import metadata
+from typing import Optional, Tuple, Union
+
+import networkx as nx
+
+from . import profiling
+from .build_stats import BuildStats
+from .compact_graph import CompactGraph
+from .condensed_graph import condensed_graph, is_condensed
+from .graphbuilder import build_graph_and_stats
+
+logger = logging.getLogger(__name__)
+
+# The cache directory is trimmed to this size after each write
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Part of every cache key. Bump it whenever a change to the parsing or the graph
+# builder changes the graphs or statistics that are built, so that graphs built
+# by older code are not loaded; source and development installs all have the
+# same package version.
+CACHE_FORMAT = 3
+
+
+def default_cache_dir() -> str:
+    """
+    The default cache directory, following the XDG base directory convention.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "graphedexcel")
+
+
+def package_version() -> str:
+    """
+    The installed version of graphedexcel, part of every cache key.
+    """
+    try:
+        return metadata.version("graphedexcel")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def file_hash(file_path: str) -> str:
+    """
+    SHA-256 of the contents of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    A directory of cache entries keyed by strings.
+
+    Reading an entry marks it as recently used, and after each write the least
+    recently used entries are removed until the directory is below max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Return the data stored for the key, or None if it is not cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store data for the key and evict old entries if the cache is too big.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                logger.debug(f"Evicted {path} from the cache")
+            except FileNotFoundError:
+                pass  # removed by another process
+            total -= size
+
+
+def graph_cache_key(
+    file_path: str,
+    as_directed: bool = False,
+    expand_ranges: bool = True,
+    compact: bool = False,
+    condensed: bool = False,
+    reader: str = "openpyxl",
+) -> str:
+    """
+    Cache key for the graph of a workbook, built with the given options.
+    """
+    parts = [
+        file_hash(file_path),
+        package_version(),
+        f"format={CACHE_FORMAT}",
+        f"directed={as_directed}",
+        f"expand_ranges={expand_ranges}",
+        f"reader={reader}",
+    ]
+    if compact:
+        parts.append("compact")
+    if condensed:
+        parts.append("condensed")
+    return hashlib.sha256("|".join(parts).encode("utf8")).hexdigest() + ".json.gz"
+
+
+def serialize_graph(graph: Union[nx.Graph, CompactGraph], stats: BuildStats) -> bytes:
+    """
+    Serialize a dependency graph and its build statistics to compressed JSON.
+    """
+    if isinstance(graph, CompactGraph):
+        names = list(graph.node_names())
+        nodes = list(zip(names, graph.node_sheets()))
+        edges = [
+            (names[u], names[v]) for u, v in zip(graph.src.tolist(), graph.dst.tolist())
+        ]
+    elif is_condensed(graph):
+        nodes = [(sheet, internal) for sheet, internal in graph.nodes(data="internal")]
+        edges = list(graph.edges(data="weight"))
+    else:
+        nodes = list(graph.nodes(data="sheet"))
+        edges = list(graph.edges)
+    data = {
+        "directed": graph.is_directed(),
+        "nodes": nodes,
+        "edges": edges,
+        "stats": stats.to_dict(),
+    }
+    if is_condensed(graph):
+        # nodes are (sheet, internal references), edges (sheet, sheet, weight)
+        data["condensed"] = True
+    return gzip.compress(json.dumps(data).encode("utf8"), compresslevel=1)
+
+
+def deserialize_graph(
+    data: bytes, compact: bool = False
+) -> Tuple[Union[nx.Graph, CompactGraph], BuildStats]:
+    """
+    Load a dependency graph and its build statistics from serialize_graph output.
+    """
+    data = json.loads(gzip.decompress(data))
+    stats = BuildStats.from_dict(data["stats"])
+    # a condensed graph is built as a networkx graph, even with compact
+    if data.get("condensed"):
+        internal = dict(data["nodes"])
+        weights = {(u, v): weight for u, v, weight in data["edges"]}
+        return condensed_graph(internal, weights, data["directed"]), stats
+
+    if compact:
+        graph = CompactGraph(directed=data["directed"])
+        graph.add_nodes_from(node for node, _ in data["nodes"])
+        graph.add_edges_from(data["edges"])
+        return graph.finalize(), stats
+
+    graph = nx.DiGraph() if data["directed"] else nx.Graph()
+    graph.add_nodes_from((node, {"sheet": sheet}) for node, sheet in data["nodes"])
+    graph.add_edges_from(data["edges"])
+    return graph, stats
+
+
+def cached_build_graph_and_stats(
+    file_path: str,
+    cache_dir: Optional[str] = None,
+    as_directed: bool = False,
+    expand_ranges: bool = True,
+    workers: int = 1,
+    reader: str = "openpyxl",
+    compact: bool = False,
+    condensed: bool = False,
+) -> Tuple[Union[nx.Graph, CompactGraph], BuildStats]:
+    """
+    build_graph_and_stats backed by the on-disk cache.
+
+    The graph is loaded from the cache when the workbook contents, the
+    graphedexcel version, the cache format and the build options match an
+    earlier run.
+    """
+    cache = DiskCache(cache_dir or default_cache_dir())
+    key = graph_cache_key(
+        file_path, as_directed, expand_ranges, compact, condensed, reader
+    )
+
+    data = cache.get(key)
+    if data is not None:
+        try:
+            with profiling.stage("load graph cache"):
+                graph, stats = deserialize_graph(data, compact)
+            logger.info(f"Loaded dependency graph from cache {cache.cache_dir}")
+            return graph, stats
+        except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+
+    graph, stats = build_graph_and_stats(
+        file_path,
+        as_directed=as_directed,
+        expand_ranges=expand_ranges,
+        workers=workers,
+        reader=reader,
+        compact=compact,
+        condensed=condensed,
+    )
+    try:
+        with profiling.stage("write graph cache"):
+            cache.put(key, serialize_graph(graph, stats))
+    except OSError as e:
+        logger.warning(f"Could not write to cache {cache.cache_dir}: {e}")
+    return graph, stats
@@ -0,0 +1,154 @@
+"""
+Export and import of dependency graphs in a compact binary format.
+
+A graph is stored as an uncompressed NumPy .npz archive of columns: the sheet
+names, the kind, sheet id and row and column bounds of every node, the source
+and target node ids of every edge and the build statistics as JSON. There are
+no strings per node, so the file is a fraction of the size of GraphML or a
+pickled networkx graph, and the arrays are memory-mapped when it is imported,
+so even a graph of millions of cells is loaded without reading it all.
+"""
+
+import json
+import struct
+import zipfile
+from typing import Dict, Tuple, Union
+
+import networkx as nx
+import numpy as np
+
+from .build_stats import BuildStats
+from .compact_graph import CompactGraph
+from .condensed_graph import condensed_graph, is_condensed
+
+# Written into every export, and checked on import
+FORMAT_VERSION = 1
+
+_NODE_COLUMNS = ["kind", "sheet", "row1", "col1", "row2", "col2"]
+
+
+def export_graph(
+    graph: Union[nx.Graph, CompactGraph], stats: BuildStats, path: str
+) -> None:
+    """
+    Write a dependency graph and its build statistics to an .npz file.
+    A networkx graph is converted to a CompactGraph first.
+    """
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "directed": np.array(graph.is_directed()),
+        "stats": _json_array(stats.to_dict()),
+    }
+    if is_condensed(graph):
+        sheets = list(graph.nodes)
+        sheet_ids = {sheet: i for i, sheet in enumerate(sheets)}
+        edges = list(graph.edges(data="weight"))
+        arrays["condensed"] = np.array(True)
+        arrays["sheets"] = np.array(sheets, dtype=str)
+        arrays["internal"] = np.array(
+            [internal for _, internal in graph.nodes(data="internal")], dtype=np.int64
+        )
+        arrays["src"] = np.array([sheet_ids[u] for u, _, _ in edges], dtype=np.int32)
+        arrays["dst"] = np.array([sheet_ids[v] for _, v, _ in edges], dtype=np.int32)
+        arrays["weight"] = np.array([weight for _, _, weight in edges], dtype=np.int64)
+    else:
+        if not isinstance(graph, CompactGraph):
+            graph = CompactGraph.from_networkx(graph)
+        arrays["sheets"] = np.array(graph.sheets, dtype=str)
+        for column in _NODE_COLUMNS + ["src", "dst"]:
+            arrays[column] = getattr(graph, column)
+
+    # uncompressed, so the arrays can be memory-mapped on import
+    with open(path, "wb") as file:
+        np.savez(file, **arrays)
+
+
+def import_graph(
+    path: str, compact: bool = False, mmap: bool = True
+) -> Tuple[Union[nx.Graph, CompactGraph], BuildStats]:
+    """
+    Load a dependency graph and its build statistics written by export_graph,
+    as a networkx graph or, with compact=True, as a CompactGraph backed by the
+    (memory-mapped) arrays of the file. Raises ValueError if the file is not an
+    export of a supported version.
+    """
+    arrays = load_npz(path, mmap)
+    try:
+        version = int(arrays["format_version"])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported format version {version}")
+        directed = bool(arrays["directed"])
+        stats = BuildStats.from_dict(json.loads(arrays["stats"].tobytes()))
+        sheets = arrays["sheets"].tolist()
+        src, dst = arrays["src"], arrays["dst"]
+
+        if "condensed" in arrays:
+            internal = dict(zip(sheets, arrays["internal"].tolist()))
+            weights = {
+                (sheets[u], sheets[v]): weight
+                for u, v, weight in zip(
+                    src.tolist(), dst.tolist(), arrays["weight"].tolist()
+                )
+            }
+            return condensed_graph(internal, weights, directed), stats
+
+        columns = [arrays[column] for column in _NODE_COLUMNS]
+    except KeyError as e:
+        raise ValueError(f"{path} is not a graphedexcel export: missing {e}") from e
+
+    graph = CompactGraph.from_arrays(sheets, *columns, src, dst, directed=directed)
+    if not compact:
+        return graph.to_networkx(), stats
+    return graph, stats
+
+
+def load_npz(path: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    The arrays of an .npz file by name. Arrays stored uncompressed are
+    memory-mapped (np.load only maps .npy files), the others are read.
+    """
+    arrays = {}
+    try:
+        with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+            for info in archive.infolist():
+                name = info.filename
+                if name.endswith(".npy"):
+                    name = name[: -len(".npy")]
+                if mmap and info.compress_type == zipfile.ZIP_STORED:
+                    arrays[name] = _memmap_member(path, file, info)
+                else:
+                    with archive.open(info) as member:
+                        arrays[name] = np.lib.format.read_array(member)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"{path} is not a graphedexcel export: {e}") from e
+    return arrays
+
+
+def _memmap_member(path: str, file, info: zipfile.ZipInfo) -> np.ndarray:
+    """
+    Memory-map an .npy file stored uncompressed in a zip archive.
+    """
+    # the local file header has a fixed size of 30 bytes, followed by the
+    # file name and an extra field, whose lengths are at offset 26
+    file.seek(info.header_offset + 26)
+    name_length, extra_length = struct.unpack("<HH", file.read(4))
+    file.seek(info.header_offset + 30 + name_length + extra_length)
+
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    if dtype.hasobject:
+        raise ValueError(f"{path} contains Python objects")
+    if not shape or 0 in shape:
+        # nothing to map (and mmap can not map empty files)
+        return np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    order = "F" if fortran_order else "C"
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=file.tell(), shape=shape, order=order
+    )
+
+
+def _json_array(data) -> np.ndarray:
+    return np.frombuffer(json.dumps(data).encode("utf8"), dtype=np.uint8)
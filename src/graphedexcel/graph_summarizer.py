@@ -1,44 +1,376 @@
-from collections import Counter
+"""
+Summary of a dependency graph: node and edge counts, the most connected nodes,
+the degree distribution, the nodes and edges per sheet, the connected
+components and the most used functions and most copied formulas of the build.
+
+The graph is turned into arrays once (node degrees, the sheet of every node and
+the edges as two id arrays) and everything is computed from those arrays with
+numpy, so graphs with millions of nodes are summarized without repeated passes
+over networkx's dicts. A CompactGraph already is a set of arrays.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, Union
+
 import networkx as nx
+import numpy as np
+
+from .build_stats import BuildStats
+from .compact_graph import CompactGraph
+from .condensed_graph import is_condensed
+from .dependency_analysis import weakly_connected_components
+
+SUMMARY_FORMATS = ["text", "json"]
+
+# Edges are summarized this many at a time
+EDGE_CHUNK_SIZE = 1 << 22
+
+
+@dataclass
+class GraphSummary:
+    """
+    The summary of a dependency graph and its build, as made by summarize().
+    Nodes are given by name, and lists are sorted from the largest count down.
+    """
+
+    nodes: int
+    edges: int
+    directed: bool
+    condensed: bool
+    # (node, degree); for a sheet-level graph weighted by the references
+    most_connected: List[Tuple[str, int]]
+    # the most referenced nodes and the nodes with the most references,
+    # for directed graphs only
+    most_in_degree: List[Tuple[str, int]]
+    most_out_degree: List[Tuple[str, int]]
+    degree_distribution: Dict[int, int]  # degree -> number of nodes
+    max_degree: int
+    mean_degree: float
+    # sheet -> nodes and edges from the sheet, or with an end in it if undirected
+    sheets: Dict[str, Dict[str, int]]
+    cross_sheet_edges: int
+    component_count: int  # connected components, ignoring edge directions
+    largest_components: List[int]  # number of nodes of the largest components
+    functions: Dict[str, int]
+    template_count: Optional[int] = None  # only with build statistics
+    templates: Dict[str, int] = field(default_factory=dict)
+    # (sheet, sheet, references), for sheet-level graphs only
+    sheet_dependencies: List[Tuple[str, str, int]] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        """
+        The summary as JSON-serializable data.
+        """
+        data = asdict(self)
+        for key in ["most_connected", "most_in_degree", "most_out_degree"]:
+            data[key] = [list(pair) for pair in data[key]]
+        data["sheet_dependencies"] = [list(edge) for edge in data["sheet_dependencies"]]
+        if not self.condensed:
+            del data["sheet_dependencies"]
+        if self.template_count is None:
+            del data["template_count"], data["templates"]
+        return data
+
+
+class SummaryArrays(NamedTuple):
+    """
+    A graph as arrays: the edges as node ids, the optional edge weights, the
+    sheet id of every node and a function giving the name of a node id.
+    """
+
+    count: int
+    src: np.ndarray
+    dst: np.ndarray
+    weight: Optional[np.ndarray]
+    sheet: np.ndarray
+    sheets: List[str]
+    node_name: Callable[[int], Hashable]
+
+
+def summary_arrays(graph: Union[nx.Graph, CompactGraph]) -> SummaryArrays:
+    """
+    The arrays of a networkx graph or CompactGraph needed for its summary,
+    in one pass over the nodes and one over the edges.
+    """
+    if isinstance(graph, CompactGraph):
+        return SummaryArrays(
+            graph.number_of_nodes(),
+            graph.src,
+            graph.dst,
+            None,
+            graph.sheet,
+            graph.sheets,
+            graph.node_name,
+        )
+
+    nodes = []
+    index: Dict[Hashable, int] = {}
+    sheet_ids: Dict[str, int] = {}
+    node_sheets = []
+    for node, sheet in graph.nodes(data="sheet"):
+        index[node] = len(nodes)
+        nodes.append(node)
+        if sheet is None:
+            sheet = node.rpartition("!")[0] if isinstance(node, str) else ""
+        node_sheets.append(sheet_ids.setdefault(sheet, len(sheet_ids)))
+    edges = np.fromiter(
+        (index[n] for edge in graph.edges for n in edge),
+        dtype=np.int64,
+        count=2 * graph.number_of_edges(),
+    ).reshape(-1, 2)
+    weight = None
+    if is_condensed(graph):
+        weight = np.fromiter(
+            (w for _, _, w in graph.edges(data="weight", default=1)),
+            dtype=np.int64,
+            count=graph.number_of_edges(),
+        )
+    return SummaryArrays(
+        len(nodes),
+        edges[:, 0],
+        edges[:, 1],
+        weight,
+        np.array(node_sheets, dtype=np.int64),
+        list(sheet_ids),
+        nodes.__getitem__,
+    )
+
+
+def top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    The indices of the k largest values, largest first and the lowest index
+    first among equal values, found by partial selection instead of sorting.
+    """
+    if k <= 0 or not len(values):
+        return np.zeros(0, dtype=np.int64)
+    candidates = np.arange(len(values))
+    if len(values) > k:
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[: k - len(above)]
+        candidates = np.concatenate([above, ties])
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order]
+
+
+def summarize(
+    graph: Union[nx.Graph, CompactGraph],
+    stats: Union[BuildStats, Dict[str, int]],
+    top: int = 10,
+) -> GraphSummary:
+    """
+    Summarize a dependency graph and its build statistics, or a dict of
+    function counts, keeping the `top` entries of every list.
+    """
+    arrays = summary_arrays(graph)
+    count, src, dst = arrays.count, arrays.src, arrays.dst
+    condensed = is_condensed(graph)
+    directed = graph.is_directed()
+
+    sheet_count = len(arrays.sheets)
+    out_degree = np.zeros(count, dtype=np.int64)
+    in_degree = np.zeros(count, dtype=np.int64)
+    weighted = np.zeros(count) if arrays.weight is not None else None
+    sheet_edges = np.zeros(sheet_count, dtype=np.int64)
+    cross_sheet = 0
+    # the edges are read a chunk at a time, so memory-mapped edge arrays of a
+    # graph built with a memory limit are never loaded as a whole
+    for start in range(0, len(src), EDGE_CHUNK_SIZE):
+        end = start + EDGE_CHUNK_SIZE
+        chunk_src, chunk_dst = np.asarray(src[start:end]), np.asarray(dst[start:end])
+        out_degree += np.bincount(chunk_src, minlength=count)
+        in_degree += np.bincount(chunk_dst, minlength=count)
+        if weighted is not None:
+            chunk_weight = arrays.weight[start:end]
+            weighted += np.bincount(chunk_src, chunk_weight, count)
+            weighted += np.bincount(chunk_dst, chunk_weight, count)
+        if not condensed:
+            source_sheets = arrays.sheet[chunk_src]
+            target_sheets = arrays.sheet[chunk_dst]
+            sheet_edges += np.bincount(source_sheets, minlength=sheet_count)
+            cross = source_sheets != target_sheets
+            cross_sheet += int(np.count_nonzero(cross))
+            if not directed:
+                sheet_edges += np.bincount(target_sheets[cross], minlength=sheet_count)
+    degree = out_degree + in_degree
+    connected = degree if weighted is None else weighted.astype(np.int64)
+
+    def top_nodes(values):
+        return [
+            (arrays.node_name(i), int(values[i])) for i in top_k(values, top).tolist()
+        ]
+
+    distribution = np.bincount(degree)
+    degrees = np.flatnonzero(distribution)
 
+    sheets = {}
+    if not condensed and count:
+        sheet_nodes = np.bincount(arrays.sheet, minlength=sheet_count)
+        order = np.lexsort((np.array(arrays.sheets), -sheet_nodes))
+        sheets = {
+            arrays.sheets[i]: {
+                "nodes": int(sheet_nodes[i]),
+                "edges": int(sheet_edges[i]),
+            }
+            for i in order.tolist()
+            if sheet_nodes[i]
+        }
 
-def print_summary(graph: nx.Graph, functionsdict: dict[str, int]) -> None:
+    component_count, labels = weakly_connected_components(
+        count, src, dst, EDGE_CHUNK_SIZE
+    )
+    sizes = np.bincount(labels, minlength=component_count)
+
+    functions = stats.functions if isinstance(stats, BuildStats) else stats
+    summary = GraphSummary(
+        nodes=count,
+        edges=len(src),
+        directed=directed,
+        condensed=condensed,
+        most_connected=top_nodes(connected),
+        most_in_degree=top_nodes(in_degree) if directed else [],
+        most_out_degree=top_nodes(out_degree) if directed else [],
+        degree_distribution={
+            int(d): int(n) for d, n in zip(degrees, distribution[degrees])
+        },
+        max_degree=int(degree.max(initial=0)),
+        mean_degree=float(degree.mean()) if count else 0.0,
+        sheets=sheets,
+        cross_sheet_edges=cross_sheet,
+        component_count=component_count,
+        largest_components=sizes[top_k(sizes, top)].tolist(),
+        functions=dict(
+            sorted(functions.items(), key=lambda item: item[1], reverse=True)
+        ),
+    )
+    if isinstance(stats, BuildStats):
+        summary.template_count = stats.template_count
+        summary.templates = dict(most_copied_formulas(stats, top))
+    if condensed:
+        summary.sheet_dependencies = heaviest_sheet_dependencies(graph, top)
+    return summary
+
+
+def print_summary(
+    graph: Union[nx.Graph, CompactGraph],
+    stats: Union[BuildStats, Dict[str, int]],
+    summary: Optional[GraphSummary] = None,
+) -> None:
     """
     Summarize a networkx DiGraph representing a dependency
     graph and print the most used functions in the formulas.
+    The functions are taken from the build statistics or a dict of function counts.
+    For a sheet-level graph the heaviest dependencies between sheets are printed too,
+    and with build statistics the formulas copied to the most cells.
+    A summary already made with summarize() is printed as is.
     """
+    if summary is None:
+        summary = summarize(graph, stats)
     strpadsize = 28
     numpadsize = 5
 
     print()
-    print_basic_info(graph, strpadsize, numpadsize)
-    print_highest_degree_nodes(graph, strpadsize, numpadsize)
-    print_most_used_functions(functionsdict, strpadsize, numpadsize)
+    print_basic_info(graph, summary, strpadsize, numpadsize)
+    print_highest_degree_nodes(summary, strpadsize, numpadsize)
+    if summary.condensed:
+        print_heaviest_sheet_dependencies(graph, summary, strpadsize, numpadsize)
+    elif summary.sheets:
+        print_sheets(summary, strpadsize, numpadsize)
+    print_most_used_functions(summary.functions, strpadsize, numpadsize)
+    if summary.templates:
+        print_most_copied_formulas(summary, strpadsize, numpadsize)
     print()
 
 
-def print_basic_info(graph, strpadsize, numpadsize):
+def summarize_graph(
+    graph: Union[nx.Graph, CompactGraph],
+    stats: Union[BuildStats, Dict[str, int]],
+    top: int = 10,
+) -> dict:
+    """
+    The data of print_summary as a JSON-serializable dict.
+    """
+    return summarize(graph, stats, top).to_dict()
+
+
+def highest_degree_nodes(graph, count: int = 10) -> List[Tuple[str, int]]:
+    """
+    The nodes with the highest degree, highest first.
+    For a sheet-level graph the degree counts the references to and from other sheets.
+    """
+    return summarize(graph, {}, count).most_connected
+
+
+def most_copied_formulas(stats: BuildStats, count: int = 10) -> List[Tuple[str, int]]:
+    """
+    The formulas, in R1C1 notation, copied to the most cells, most first.
+    """
+    templates = sorted(stats.templates.items(), key=lambda item: -item[1])
+    return templates[:count]
+
+
+def heaviest_sheet_dependencies(graph: nx.Graph, count: int = 10) -> List[tuple]:
+    """
+    The (sheet, sheet, references) edges of a sheet-level graph with the most
+    references, most first.
+    """
+    edges = sorted(graph.edges(data="weight"), key=lambda edge: edge[2], reverse=True)
+    return edges[:count]
+
+
+def print_basic_info(graph, summary, strpadsize, numpadsize):
     print("===  Dependency Graph Summary ===")
-    print(
-        "Cell/Node count".ljust(strpadsize, " ")
-        + str(graph.number_of_nodes()).rjust(numpadsize, " ")
-    )
-    print(
-        "Dependency count".ljust(strpadsize, " ")
-        + str(graph.number_of_edges()).rjust(numpadsize, " ")
-    )
+    if summary.condensed:
+        rows = [
+            ("Sheet count", summary.nodes),
+            ("Sheet dependency count", summary.edges),
+            ("Cross-sheet references", graph.size(weight="weight")),
+            ("In-sheet references", sum(dict(graph.nodes(data="internal")).values())),
+        ]
+    else:
+        rows = [
+            ("Cell/Node count", summary.nodes),
+            ("Dependency count", summary.edges),
+            ("Cross-sheet dependencies", summary.cross_sheet_edges),
+            ("Connected components", summary.component_count),
+            ("Largest component", max(summary.largest_components, default=0)),
+            ("Max degree", summary.max_degree),
+            ("Mean degree", f"{summary.mean_degree:.2f}"),
+        ]
+    for label, value in rows:
+        print(label.ljust(strpadsize, " ") + str(value).rjust(numpadsize, " "))
     print()
 
 
-def print_highest_degree_nodes(graph, strpadsize, numpadsize):
-    print("\n===  Most connected nodes     ===")
-    degree_view = graph.degree()
-    degree_counts = Counter(dict(degree_view))
-    max_degree_node = degree_counts.most_common(10)
+def print_highest_degree_nodes(summary, strpadsize, numpadsize):
+    if summary.condensed:
+        print("\n===  Most connected sheets    ===")
+    else:
+        print("\n===  Most connected nodes     ===")
 
-    for node, degree in max_degree_node:
+    for node, degree in summary.most_connected:
         print(f"{node.ljust(strpadsize)}{str(degree).rjust(numpadsize, ' ')} ")
 
+    if summary.directed and not summary.condensed:
+        print("\n===  Most referenced nodes    ===")
+        for node, degree in summary.most_in_degree:
+            print(f"{node.ljust(strpadsize)}{str(degree).rjust(numpadsize, ' ')} ")
+
+
+def print_heaviest_sheet_dependencies(graph, summary, strpadsize, numpadsize):
+    print("\n===  Heaviest sheet dependencies ===")
+    arrow = " -> " if graph.is_directed() else " - "
+    for u, v, weight in summary.sheet_dependencies:
+        print(
+            f"{(u + arrow + v).ljust(strpadsize)}{str(weight).rjust(numpadsize, ' ')}"
+        )
+
+
+def print_sheets(summary, strpadsize, numpadsize):
+    print("\n===  Nodes per sheet          ===")
+    for sheet, counts in summary.sheets.items():
+        print(f"{sheet.ljust(strpadsize)}{str(counts['nodes']).rjust(numpadsize, ' ')}")
+
 
 def print_most_used_functions(functionsdict, strpadsize, numpadsize):
     print("\n===  Most used functions      ===")
@@ -48,3 +380,13 @@ def print_most_used_functions(functionsdict, strpadsize, numpadsize):
 
     for function, count in sorted_functions.items():
         print(f"{function.ljust(strpadsize, ' ')}{str(count).rjust(numpadsize, ' ')}")
+
+
+def print_most_copied_formulas(summary, strpadsize, numpadsize):
+    print("\n===  Most copied formulas     ===")
+    print(
+        "Distinct formulas".ljust(strpadsize, " ")
+        + str(summary.template_count).rjust(numpadsize, " ")
+    )
+    for template, count in summary.templates.items():
+        print(f"{template.ljust(strpadsize, ' ')}{str(count).rjust(numpadsize, ' ')}")
@@ -2,8 +2,15 @@ import json
 import matplotlib
 import matplotlib.patches as mpatches
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import logging
+from typing import Optional
+from .compact_graph import CompactGraph
+from .condensed_graph import is_condensed
+from . import profiling
+from .layouts import LayoutCache, compact_grid_positions, compute_layout
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +28,13 @@ base_graph_settings = {
     "font_size": 10,  # the size of the node labels
     "cmap": "tab20b",  # the color map to use for coloring nodes
     "hide_legends": False,  # whether to show the legend
+    # fast renderer: above this many edges, draw edge density instead of lines
+    "raster_threshold": 50000,
+    "raster_size": 1024,  # width and height in pixels of the edge density image
 }
 
+RENDERERS = ["networkx", "fast"]
+
 # Sized-based settings for small, medium, and large graphs
 small_graph_settings = {"with_labels": False, "alpha": 0.8}
 
@@ -38,6 +50,15 @@ large_graph_settings = {
     "alpha": 0.2,
 }
 
+# Settings for sheet-level graphs, where node_size and width are those of the
+# sheet and the sheet dependency with the most references
+condensed_graph_settings = {
+    "node_size": 1500,
+    "width": 6,
+    "with_labels": True,
+    "alpha": 0.8,
+}
+
 
 def load_json_config(config_path: str) -> dict:
     """
@@ -66,7 +87,9 @@ def merge_configs(default_config: dict, custom_config: dict) -> dict:
     return merged_config
 
 
-def get_graph_default_settings(graph_size: int, config_path: str = None) -> dict:
+def get_graph_default_settings(
+    graph_size: int, config_path: str = None, condensed: bool = False
+) -> dict:
     """
     Gets the default settings for the graph visualization based on the number of nodes.
     Optionally merges with a user-provided JSON config.
@@ -74,11 +97,14 @@ def get_graph_default_settings(graph_size: int, config_path: str = None) -> dict
     Args:
         graph_size (int): Number of nodes in the graph.
         config_path (str, optional): Path to a JSON configuration file.
+        condensed (bool, optional): Whether the graph is a sheet-level graph.
 
     Returns:
         dict: Merged graph settings.
     """
-    if graph_size < 200:
+    if condensed:
+        plot_settings = merge_configs(base_graph_settings, condensed_graph_settings)
+    elif graph_size < 200:
         plot_settings = merge_configs(base_graph_settings, small_graph_settings)
     elif graph_size < 500:
         plot_settings = merge_configs(base_graph_settings, medium_graph_settings)
@@ -148,23 +174,48 @@ def visualize_dependency_graph(
     config_path: str = None,
     layout: str = "spring",
     hide_legends_override: bool = None,
+    renderer: str = "networkx",
+    seed: Optional[int] = None,
+    layout_cache: Optional[LayoutCache] = None,
 ):
     """
     Render the dependency graph using matplotlib and networkx.
+
+    The node positions are computed with the layout and seed, or taken from the
+    layout cache if one is given, so changing only the visualization settings
+    does not compute the layout again.
+
+    The "networkx" renderer draws the graph with nx.draw. The "fast" renderer
+    draws all edges as one LineCollection and all nodes with one scatter call,
+    and above raster_threshold edges draws the density of the edges as an image
+    instead, which keeps large graphs fast to render and readable.
+
+    A CompactGraph is drawn straight from its arrays with the grid layout and
+    the fast renderer. The other layouts and nx.draw need a networkx graph, so
+    for those it is converted with to_networkx() first.
     """
+    from_arrays = isinstance(graph, CompactGraph)
+    if from_arrays and not (layout == "grid" and renderer == "fast"):
+        logger.info("Converting the graph to networkx for the layout.")
+        graph = graph.to_networkx()
+        from_arrays = False
+    node_count = graph.number_of_nodes()
 
     # Set the default settings for the graph visualization based on the number of nodes
-    graph_settings = get_graph_default_settings(len(graph.nodes), config_path)
+    condensed = is_condensed(graph)
+    graph_settings = get_graph_default_settings(node_count, config_path, condensed)
 
     logger.info(
         f"Using the following settings for the graph visualization: {graph_settings}"
     )
 
     hide_legends = graph_settings.pop("hide_legends")
+    raster_threshold = graph_settings.pop("raster_threshold")
+    raster_size = graph_settings.pop("raster_size")
     if hide_legends_override is not None:
         hide_legends = hide_legends_override
 
-    fig_size = calculate_fig_size(len(graph.nodes))
+    fig_size = calculate_fig_size(node_count)
     logger.info(f"Calculated figure size: {fig_size}")
 
     figsize_override = graph_settings.pop("fig_size", None)
@@ -174,35 +225,247 @@ def visualize_dependency_graph(
         fig_size = figsize_override
     plt.figure(figsize=fig_size)
 
-    # Choose layout based on input
-    if layout == "spring":
-        pos = nx.spring_layout(graph)
-    elif layout == "kamada_kawai":
-        pos = nx.kamada_kawai_layout(graph)
-    elif layout == "circular":
-        pos = nx.circular_layout(graph)
-    elif layout == "shell":
-        pos = nx.shell_layout(graph)
-    elif layout == "spectral":
-        pos = nx.spectral_layout(graph)
-    else:
-        logger.warning(f"Unknown layout '{layout}'. Falling back to spring layout.")
-        pos = nx.spring_layout(graph)
+    if from_arrays:
+        draw_compact_graph(
+            graph, graph_settings, hide_legends, raster_threshold, raster_size
+        )
+        with profiling.stage("savefig"):
+            plt.savefig(output_path, bbox_inches="tight")
+        plt.close()
+        return
+
+    with profiling.stage("layout"):
+        if layout_cache is not None:
+            pos = layout_cache.layout(graph, layout, seed)
+        else:
+            pos = compute_layout(graph, layout, seed)
+
+    if condensed:
+        graph_settings.update(condensed_sizes(graph, graph_settings))
 
     # Assign colors and get legend patches
     node_colors, legend_patches = get_node_colors_and_legend(
         graph, graph_settings.pop("cmap", "tab20b")
     )
 
-    nx.draw(
-        graph,
-        pos,
-        node_color=node_colors,
-        **graph_settings,
-    )
+    with profiling.stage("draw"):
+        if renderer == "fast":
+            draw_fast(
+                graph, pos, node_colors, graph_settings, raster_threshold, raster_size
+            )
+        else:
+            if renderer != "networkx":
+                logger.warning(f"Unknown renderer '{renderer}'. Using networkx.")
+            nx.draw(
+                graph,
+                pos,
+                node_color=node_colors,
+                **graph_settings,
+            )
 
-    if not hide_legends:
-        plt.legend(handles=legend_patches, title="Sheets", loc="upper left")
+        if not hide_legends:
+            plt.legend(handles=legend_patches, title="Sheets", loc="upper left")
 
-    plt.savefig(output_path, bbox_inches="tight")
+    with profiling.stage("savefig"):
+        plt.savefig(output_path, bbox_inches="tight")
     plt.close()  # Close the figure to free memory
+
+
+def draw_compact_graph(
+    graph: CompactGraph,
+    graph_settings: dict,
+    hide_legends: bool,
+    raster_threshold: int = 50000,
+    raster_size: int = 1024,
+) -> None:
+    """
+    Draw a CompactGraph with the grid layout and the fast renderer, from its
+    node and edge arrays, without creating a networkx graph or node names
+    (unless the settings ask for labels).
+    """
+    with profiling.stage("layout"):
+        xy = compact_grid_positions(graph)
+
+    color_map = plt.get_cmap(graph_settings.pop("cmap", "tab20b"), len(graph.sheets))
+    node_colors = color_map(graph.sheet)
+    labels = None
+    if graph_settings.get("with_labels"):
+        labels = list(graph.node_names())
+
+    with profiling.stage("draw"):
+        edges = np.stack([graph.src, graph.dst], axis=1).astype(np.int64)
+        draw_arrays(
+            xy, edges, node_colors, graph_settings, raster_threshold, raster_size
+        )
+        if labels is not None:
+            ax = plt.gca()
+            for (x, y), label in zip(xy, labels):
+                ax.text(
+                    x,
+                    y,
+                    label,
+                    fontsize=graph_settings.get("font_size", 12),
+                    ha="center",
+                    va="center",
+                )
+        if not hide_legends:
+            legend_patches = [
+                mpatches.Patch(color=color_map(sheet), label=graph.sheets[sheet])
+                for sheet in np.unique(graph.sheet).tolist()
+            ]
+            plt.legend(handles=legend_patches, title="Sheets", loc="upper left")
+
+
+def condensed_sizes(graph: nx.Graph, graph_settings: dict) -> dict:
+    """
+    Node sizes and edge widths of a sheet-level graph, scaled by the number of
+    references of each sheet and sheet dependency on a square-root scale, up to
+    the node_size and width of the settings.
+    """
+    references = np.array(
+        [
+            internal + degree
+            for (_, internal), (_, degree) in zip(
+                graph.nodes(data="internal", default=0),
+                graph.degree(weight="weight"),
+            )
+        ],
+        dtype=float,
+    )
+    weights = np.array([weight for _, _, weight in graph.edges(data="weight")], float)
+
+    def scaled(values, largest):
+        if not len(values) or values.max() <= 0:
+            return largest
+        return list(largest * np.sqrt(np.maximum(values, 1) / values.max()))
+
+    return {
+        "node_size": scaled(references, graph_settings.get("node_size", 300)),
+        "width": scaled(weights, graph_settings.get("width", 1)),
+    }
+
+
+def draw_fast(
+    graph: nx.Graph,
+    pos: dict,
+    node_colors: list,
+    graph_settings: dict,
+    raster_threshold: int = 50000,
+    raster_size: int = 1024,
+) -> None:
+    """
+    Draw the graph on the current axes with one artist for all edges and one for
+    all nodes. With more than raster_threshold edges, the edges are drawn as an
+    image of the edge density. Arrows are not drawn.
+    """
+    index = {node: i for i, node in enumerate(graph.nodes)}
+    xy = np.array([pos[node] for node in graph.nodes], dtype=float).reshape(-1, 2)
+    edges = np.array(
+        [(index[u], index[v]) for u, v in graph.edges], dtype=np.int64
+    ).reshape(-1, 2)
+    draw_arrays(xy, edges, node_colors, graph_settings, raster_threshold, raster_size)
+    if graph_settings.get("with_labels"):
+        nx.draw_networkx_labels(
+            graph, pos, font_size=graph_settings.get("font_size", 12), ax=plt.gca()
+        )
+
+
+def draw_arrays(
+    xy: np.ndarray,
+    edges: np.ndarray,
+    node_colors,
+    graph_settings: dict,
+    raster_threshold: int = 50000,
+    raster_size: int = 1024,
+) -> None:
+    """
+    Draw nodes at the (n, 2) positions xy and the (m, 2) edges between them, as
+    indices into xy, on the current axes, like draw_fast.
+    """
+    ax = plt.gca()
+    alpha = graph_settings.get("alpha")
+
+    if len(edges) > raster_threshold:
+        logger.info(f"Rasterizing {len(edges)} edges to a density image.")
+        extent = _padded_extent(xy)
+        density = rasterize_edges(xy[edges[:, 0]], xy[edges[:, 1]], extent, raster_size)
+        ax.imshow(
+            np.log1p(density),
+            extent=extent,
+            origin="lower",
+            cmap="Greys",
+            interpolation="bilinear",
+            aspect="auto",
+        )
+    elif len(edges):
+        ax.add_collection(
+            LineCollection(
+                xy[edges],
+                linewidths=graph_settings.get("width", 1.0),
+                colors=graph_settings.get("edge_color", "black"),
+                alpha=alpha,
+            )
+        )
+
+    ax.scatter(
+        xy[:, 0],
+        xy[:, 1],
+        s=graph_settings.get("node_size", 300),
+        c=node_colors,
+        linewidths=graph_settings.get("linewidths", 0),
+        alpha=alpha,
+        zorder=2,
+        rasterized=len(xy) > raster_threshold,
+    )
+    ax.set_axis_off()
+    ax.autoscale_view()
+
+
+def _padded_extent(xy: np.ndarray) -> list:
+    low = xy.min(axis=0)
+    high = xy.max(axis=0)
+    padding = np.maximum((high - low) * 0.02, 1e-9)
+    low, high = low - padding, high + padding
+    return [low[0], high[0], low[1], high[1]]
+
+
+def rasterize_edges(
+    start: np.ndarray,
+    end: np.ndarray,
+    extent: list,
+    size: int = 1024,
+    chunk_size: int = 1 << 22,
+) -> np.ndarray:
+    """
+    Accumulate line segments from start to end into a size x size image, counting
+    how many segments cross each pixel. The extent is [xmin, xmax, ymin, ymax]
+    of the image and rows go from ymin to ymax.
+    """
+    scale_x = (size - 1) / (extent[1] - extent[0])
+    scale_y = (size - 1) / (extent[3] - extent[2])
+    x = ((start[:, 0] - extent[0]) * scale_x).astype(np.float32)
+    y = ((start[:, 1] - extent[2]) * scale_y).astype(np.float32)
+    dx = ((end[:, 0] - extent[0]) * scale_x).astype(np.float32) - x
+    dy = ((end[:, 1] - extent[2]) * scale_y).astype(np.float32) - y
+    # one sample per pixel along the longest axis of each segment
+    samples = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+
+    counts = np.zeros(size * size, dtype=np.int64)
+    first = 0
+    while first < len(samples):
+        # take as many segments as fit in a chunk of samples, at least one
+        cumulative = np.cumsum(samples[first:])
+        last = first + max(1, int(np.searchsorted(cumulative, chunk_size)))
+        n = samples[first:last]
+        segment = np.repeat(np.arange(first, last, dtype=np.int32), n)
+        step = np.arange(len(segment), dtype=np.float32)
+        step -= np.repeat((np.cumsum(n) - n).astype(np.float32), n)
+        t = step / np.repeat(np.maximum(n - 1, 1).astype(np.float32), n)
+        px = np.rint(x[segment] + dx[segment] * t).astype(np.int32)
+        py = np.rint(y[segment] + dy[segment] * t).astype(np.int32)
+        np.clip(px, 0, size - 1, out=px)
+        np.clip(py, 0, size - 1, out=py)
+        counts += np.bincount(py * size + px, minlength=size * size)
+        first = last
+
+    return counts.reshape(size, size)
@@ -2,55 +2,342 @@
 This script extracts formulas from an Excel file and builds a dependency graph.
 """
 
-from typing import List, Dict
-from openpyxl import load_workbook
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from math import isqrt
+from typing import Iterable, List, Dict, NamedTuple, Optional, Set, Tuple, Union
+from openpyxl.utils.cell import coordinate_to_tuple
 import networkx as nx
-import re
 import sys
-from .excel_parser import extract_references
+import time
+from . import profiling
+from .build_stats import BuildStats, SheetStats
+from .compact_graph import CompactGraph
+from .condensed_graph import CondensedGraphBuilder
+from .excel_parser import (
+    expand_range,
+    is_unbounded_range,
+    range_bounds,
+    split_references,
+    tokenize_formula,
+)
+from .formula_templates import TEMPLATE_CACHE_SIZE, FormulaTemplates
+from .range_index import RangeIndex
+from .spill_graph import SpillGraph
+from .xlsx_reader import iter_formula_cells, open_formula_reader
 import logging
 
 logger = logging.getLogger(__name__)
 
+# References and ranges remembered by a FormulaGraphBuilder, cleared when full
+_MEMO_SIZE = 1 << 18
 
-# Dictionary that stores the unique functions used in the formulas
-# The key will be the function name and the value will be the number of times it was used
-functions_dict: Dict[str, int] = {}
+# Nodes and edges are inserted into the graph in batches of about this many edges
+_BATCH_SIZE = 8192
+
+# Share of a memory limit used for the memos and the formula templates, and
+# their rough memory use per remembered reference and per parsed template
+_MEMO_SHARE = 8
+_MEMO_ENTRY_BYTES = 300
+_TEMPLATE_BYTES = 1024
+
+
+class SheetGraph(NamedTuple):
+    """
+    The part of the dependency graph contributed by the formulas of one sheet,
+    as plain lists in insertion order so it is cheap to send between processes.
+    """
+
+    sheet_name: str
+    nodes: List[Tuple[str, str]]  # (node, sheet)
+    edges: List[Tuple[str, str]]
+    stats: SheetStats
+    unlinked: List[str]  # formula cells added without edges
 
 
 def build_graph_and_stats(
     file_path: str,
     as_directed: bool = False,
-) -> tuple[nx.DiGraph, Dict[str, int]]:
+    expand_ranges: bool = True,
+    workers: int = 1,
+    reader: str = "openpyxl",
+    compact: bool = False,
+    condensed: bool = False,
+    max_memory: Optional[int] = None,
+) -> tuple[Union[nx.Graph, CompactGraph], BuildStats]:
     """
     Extract formulas from an Excel file and build a dependency graph.
+    Returns the graph and the statistics of this build.
+
+    The reader is either "openpyxl" or "xml". The xml reader streams the formulas
+    out of the worksheet XML, which is faster and uses less memory for sheets
+    with many constant cells.
+
+    With expand_ranges=False, ranges are kept as single nodes and are only
+    connected to the cells of the range that are already part of the graph,
+    instead of adding a node for every cell in the range.
+
+    With workers > 1, the sheets are parsed in a pool of processes and merged
+    in sheet order, giving the same graph as the serial build.
+
+    With compact=True the graph is built as a CompactGraph, which stores the
+    nodes and edges as integer arrays and uses far less memory than networkx
+    for large workbooks. Its to_networkx() gives the same graph as compact=False.
+
+    With condensed=True the graph has a node per sheet instead of per cell, and
+    an edge per pair of sheets weighted by the number of references between them.
+    No per-cell nodes are kept while parsing, so this works for workbooks whose
+    cell-level graph would not fit in memory.
+
+    With max_memory (in bytes) the cell-level graph is built on disk within about
+    that much memory and returned as a CompactGraph of memory-mapped arrays,
+    for workbooks whose graph does not fit in memory even as a CompactGraph.
+    The memos of the graph builder are sized to the limit too. Parsing with
+    workers keeps the graph of every sheet in memory, so it does not stay
+    within the limit.
     """
+    stats = BuildStats()
+    start = time.perf_counter()
     try:
-        wb = load_workbook(file_path, data_only=False, read_only=True)
+        with profiling.stage("open workbook"):
+            workbook = open_formula_reader(file_path, reader)
     except Exception as e:
         logger.error(f"Error loading workbook: {e}")
         sys.exit(1)
+    stats.load_seconds = time.perf_counter() - start
 
-    graph = nx.DiGraph()
+    graph = new_graph(compact, condensed, max_memory, as_directed)
+    start = time.perf_counter()
+    try:
+        with profiling.stage("parse sheets"):
+            unlinked = parse_sheets(
+                file_path,
+                workbook,
+                graph,
+                stats,
+                expand_ranges,
+                workers,
+                reader,
+                max_memory,
+            )
+    except BaseException:
+        if isinstance(graph, SpillGraph):
+            graph.close()
+        raise
+    stats.parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    graph = finalize_graph(graph, as_directed, expand_ranges, unlinked)
+    stats.finalize_seconds = time.perf_counter() - start
+
+    return graph, stats
+
+
+def parse_sheets(
+    file_path: str,
+    workbook,
+    graph: Union[nx.Graph, CompactGraph, CondensedGraphBuilder, SpillGraph],
+    stats: BuildStats,
+    expand_ranges: bool = True,
+    workers: int = 1,
+    reader: str = "openpyxl",
+    max_memory: Optional[int] = None,
+) -> List[str]:
+    """
+    Add the formulas of all sheets of the open workbook to the graph and their
+    statistics to the build statistics, and close the workbook. With max_memory
+    the memos of the graph builder are sized to fit a share of it.
+    Returns the formula cells that were added without edges, see finalize_graph.
+    """
+    unlinked = []
+    if workers > 1 and len(workbook.sheetnames) > 1:
+        sheet_names = workbook.sheetnames
+        workbook.close()
+        logger.info(f"Parsing {len(sheet_names)} sheets with {workers} workers.")
+        with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names))) as pool:
+            sheet_graphs = pool.map(
+                build_sheet_graph,
+                repeat(file_path),
+                sheet_names,
+                repeat(expand_ranges),
+                repeat(reader),
+            )
+            for sheet_graph in sheet_graphs:
+                merge_sheet_graph(graph, sheet_graph, stats)
+                unlinked.extend(sheet_graph.unlinked)
+    else:
+        builder = FormulaGraphBuilder(graph, expand_ranges, *memo_sizes(max_memory))
+        for sheet_name in workbook.sheetnames:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"========== Analyzing sheet: {sheet_name} ==========")
+            sanitized_sheet_name = sanitize_sheetname(sheet_name)
+            sheet_stats = SheetStats()
+            sheet_start = time.perf_counter()
+            for coordinate, formula in workbook.iter_formula_cells(sheet_name):
+                builder.add_formula(
+                    coordinate, formula, sanitized_sheet_name, sheet_stats
+                )
+            if builder.profiler is not None:
+                builder.profiler.lap("read rows")
+            builder.flush()
+            sheet_stats.record_templates(builder.templates.pop_counts())
+            sheet_stats.seconds = time.perf_counter() - sheet_start
+            stats.add_sheet(sanitized_sheet_name, sheet_stats)
+        workbook.close()
+        unlinked = builder.unlinked
+    return unlinked
+
+
+def memo_sizes(max_memory: Optional[int] = None) -> Tuple[int, int]:
+    """
+    The memo size and template cache size of a FormulaGraphBuilder for a build
+    within max_memory bytes, or the defaults without a limit. A FormulaTemplates
+    keeps up to its maxsize templates for each of up to maxsize formulas, so
+    the square of the template cache size is what must fit.
+    """
+    if max_memory is None:
+        return _MEMO_SIZE, TEMPLATE_CACHE_SIZE
+    share = max_memory // _MEMO_SHARE
+    memo_size = min(_MEMO_SIZE, max(1024, share // _MEMO_ENTRY_BYTES))
+    template_cache_size = min(
+        TEMPLATE_CACHE_SIZE, max(16, isqrt(share // _TEMPLATE_BYTES))
+    )
+    return memo_size, template_cache_size
 
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        logger.debug(f"========== Analyzing sheet: {sheet_name} ==========")
-        sanitized_sheet_name = sanitize_sheetname(sheet_name)
-        process_sheet(ws, sanitized_sheet_name, graph)
 
-    if not as_directed:
-        # Convert the graph to an undirected graph
-        graph = graph.to_undirected()
-    else:
+def new_graph(
+    compact: bool = False,
+    condensed: bool = False,
+    max_memory: Optional[int] = None,
+    as_directed: bool = True,
+) -> Union[nx.Graph, CompactGraph, CondensedGraphBuilder, SpillGraph]:
+    """
+    The graph the sheets are added to while parsing. A networkx graph is built
+    as the final graph type, so an undirected graph is never copied.
+    """
+    if condensed:
+        return CondensedGraphBuilder()
+    if max_memory is not None:
+        return SpillGraph(max_memory)
+    if compact:
+        return CompactGraph()
+    return nx.DiGraph() if as_directed else nx.Graph()
+
+
+def finalize_graph(
+    graph: Union[nx.Graph, CompactGraph, CondensedGraphBuilder, SpillGraph],
+    as_directed: bool = False,
+    expand_ranges: bool = True,
+    unlinked: Optional[List[str]] = None,
+) -> Union[nx.Graph, CompactGraph]:
+    """
+    Turn the merged graph of all sheets into the final dependency graph:
+    link unexpanded ranges to their cells and remove isolated nodes, and for a
+    CompactGraph or SpillGraph also self loops and the direction of the edges.
+
+    A networkx graph is already of its final type and has no self loops, as
+    the FormulaGraphBuilder leaves them out. The only nodes it adds without
+    edges are formula cells without references, which may still be linked to
+    a range here; they are passed as unlinked, and only they are checked for
+    being isolated. Without unlinked, every node is checked.
+    """
+    if isinstance(graph, CondensedGraphBuilder):
+        # links from ranges to their cells stay within a sheet,
+        # so they would not change the sheet-level graph
+        return graph.finalize(as_directed)
+    if isinstance(graph, SpillGraph):
+        compact = graph.finalize(as_directed, expand_ranges)
+        spill = graph.stats
+        logger.info(
+            f"Spilled {spill.node_rows} nodes and {spill.edge_rows} edges to disk "
+            f"in {spill.spills} batches, {spill.disk_bytes / 1e6:.1f} MB on disk."
+        )
+        return compact
+    if isinstance(graph, CompactGraph):
+        with profiling.stage("link ranges"):
+            graph.link_range_members(unbounded_only=expand_ranges)
+        with profiling.stage("finalize compact graph"):
+            return graph.finalize(as_directed)
+
+    # Whole-column and whole-row ranges are never expanded,
+    # so they are always linked to their cells through the range index
+    with profiling.stage("link ranges"):
+        add_range_memberships(graph, unbounded_only=expand_ranges)
+
+    if as_directed:
         logger.info("Preserving the graph as a directed graph.")
 
-    # remove selfloops
-    graph.remove_edges_from(nx.selfloop_edges(graph))
+    with profiling.stage("remove isolates"):
+        if unlinked is None:
+            isolates = list(nx.isolates(graph))
+        else:
+            degree = graph.degree
+            isolates = [node for node in unlinked if node in graph and not degree[node]]
+        graph.remove_nodes_from(isolates)
+
+    return graph
 
-    graph.remove_nodes_from(list(nx.isolates(graph)))
 
-    return graph, functions_dict
+def build_sheet_graph(
+    file_path: str,
+    sheet_name: str,
+    expand_ranges: bool = True,
+    reader: str = "openpyxl",
+) -> SheetGraph:
+    """
+    Build the part of the dependency graph for a single sheet of a workbook.
+    This is the unit of work of the process pool in build_graph_and_stats.
+    """
+    workbook = open_formula_reader(file_path, reader)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"========== Analyzing sheet: {sheet_name} ==========")
+    sheet_graph = sheet_graph_from_cells(
+        sanitize_sheetname(sheet_name),
+        workbook.iter_formula_cells(sheet_name),
+        expand_ranges,
+    )
+    workbook.close()
+    return sheet_graph
+
+
+def sheet_graph_from_cells(
+    sheet_name: str, cells: Iterable[Tuple[str, str]], expand_ranges: bool = True
+) -> SheetGraph:
+    """
+    Build the part of the dependency graph for the (coordinate, formula)
+    pairs of a sheet.
+    """
+    graph = nx.DiGraph()
+    stats = SheetStats()
+    start = time.perf_counter()
+    builder = FormulaGraphBuilder(graph, expand_ranges)
+    for coordinate, formula in cells:
+        builder.add_formula(coordinate, formula, sheet_name, stats)
+    builder.flush()
+    stats.record_templates(builder.templates.pop_counts())
+    stats.seconds = time.perf_counter() - start
+
+    return SheetGraph(
+        sheet_name,
+        list(graph.nodes(data="sheet")),
+        list(graph.edges),
+        stats,
+        builder.unlinked,
+    )
+
+
+def merge_sheet_graph(
+    graph: Union[nx.Graph, CompactGraph, CondensedGraphBuilder, SpillGraph],
+    sheet_graph: SheetGraph,
+    stats: BuildStats,
+) -> None:
+    """
+    Add the nodes and edges of a sheet to the full graph,
+    and the statistics of the sheet to the build statistics.
+    """
+    graph.add_nodes_from((node, {"sheet": sheet}) for node, sheet in sheet_graph.nodes)
+    graph.add_edges_from(sheet_graph.edges)
+    stats.add_sheet(sheet_graph.sheet_name, sheet_graph.stats)
 
 
 def sanitize_sheetname(sheetname: str) -> str:
@@ -78,53 +365,220 @@ def sanitize_range(rangestring: str) -> str:
     return rangestring
 
 
-def stat_functions(cellvalue: str) -> None:
+def stat_functions(
+    cellvalue: str, counts: Optional[Dict[str, int]] = None
+) -> Dict[str, int]:
     """
-    Extract the functions used in the formula and store them in a dictionary.
-    This will be used to print the most used functions in the formulas.
+    Count the functions used in the formula, adding to counts if given.
+    Returns the counts.
     """
-    cellfuncs = re.findall(r"[A-Z]+\(", cellvalue)
-    logger.debug(f"  Functions used: {functions_dict}")
-    for function in cellfuncs:
-        function = function[:-1]  # Remove the "(" from the function name
-        functions_dict[function] = functions_dict.get(function, 0) + 1
+    if counts is None:
+        counts = {}
+    record_functions(tokenize_formula(cellvalue).functions, counts)
+    return counts
+
+
+def record_functions(functions: List[str], counts: Dict[str, int]) -> None:
+    """
+    Count the function names of a tokenized formula in the counts dictionary.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"  Functions used: {functions}")
+    for function in functions:
+        counts[function] = counts.get(function, 0) + 1
 
 
 def add_node(graph: nx.DiGraph, node: str, sheet: str) -> None:
     """
     Add a node to the graph with the specified sheet name.
     """
-    logger.debug(f"Adding node: {node} in sheet: {sheet}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Adding node: {node} in sheet: {sheet}")
     sheet = sanitize_sheetname(sheet)
     node = sanitize_nodename(node)
     graph.add_node(node, sheet=sheet)
 
 
-def process_sheet(ws, sheet_name: str, graph: nx.DiGraph) -> None:
+def process_sheet(
+    ws,
+    sheet_name: str,
+    graph: nx.DiGraph,
+    expand_ranges: bool = True,
+    stats: Optional[SheetStats] = None,
+) -> None:
     """
     Process a sheet and add references to the graph.
     """
-    for row in ws.iter_rows():
-        for cell in row:
-            if isinstance(cell.value, str) and cell.value.startswith("="):
-                process_formula_cell(cell, sheet_name, graph)
+    for coordinate, formula in iter_formula_cells(ws):
+        process_formula(coordinate, formula, sheet_name, graph, expand_ranges, stats)
 
 
-def process_formula_cell(cell, sheet_name: str, graph: nx.DiGraph) -> None:
+def process_formula_cell(
+    cell,
+    sheet_name: str,
+    graph: nx.DiGraph,
+    expand_ranges: bool = True,
+    stats: Optional[SheetStats] = None,
+) -> None:
     """
     Process a cell containing a formula.
     """
-    stat_functions(cell.value)
-    cell_reference = f"{sheet_name}!{cell.coordinate}"
-    logger.debug(f"Formula in {cell_reference}: {cell.value}")
-    add_node(graph, cell_reference, sheet_name)
-
-    direct_references, range_references, range_dependencies = extract_references(
-        cell.value
+    process_formula(
+        cell.coordinate, cell.value, sheet_name, graph, expand_ranges, stats
     )
-    add_references_to_graph(direct_references, cell_reference, sheet_name, graph)
-    add_ranges_to_graph(range_references, cell_reference, sheet_name, graph)
-    add_range_dependencies_to_graph(range_dependencies, sheet_name, graph)
+
+
+def process_formula(
+    coordinate: str,
+    formula: str,
+    sheet_name: str,
+    graph: nx.DiGraph,
+    expand_ranges: bool = True,
+    stats: Optional[SheetStats] = None,
+) -> None:
+    """
+    Process the formula of the cell at the coordinate and add its references to the graph.
+    The formula is counted in the sheet statistics, if given.
+
+    To add many formulas, use a FormulaGraphBuilder, which remembers the
+    references and ranges it has added.
+    """
+    builder = FormulaGraphBuilder(graph, expand_ranges)
+    builder.add_formula(coordinate, formula, sheet_name, stats)
+    builder.flush()
+
+
+class FormulaGraphBuilder:
+    """
+    Adds formulas to a graph (or anything with add_nodes_from/add_edges_from,
+    like a CompactGraph), remembering what it has added during the build.
+
+    A reference seen before is not formatted, sanitized and added again, and the
+    cells of a range are expanded and linked to the range only the first time
+    the range is used, instead of once per formula using it. Nodes and edges are
+    collected in order and inserted with add_nodes_from/add_edges_from in
+    batches, so flush() must be called after the last formula. The memos are
+    cleared when they reach memo_size entries, which only costs adding a node
+    or the cells of a range again; adding them is idempotent.
+
+    Formulas are tokenized through FormulaTemplates, so a formula copied to many
+    cells is only tokenized once, and its copies are counted.
+
+    The time of its steps is added to the stages of the profiler that is active
+    when the builder is created, if any.
+
+    References of a cell to itself are left out, so no self loops are added.
+    Formula cells that get no edges are still added, as a range may contain
+    them, and are listed in unlinked.
+    """
+
+    def __init__(
+        self,
+        graph,
+        expand_ranges: bool = True,
+        memo_size: int = _MEMO_SIZE,
+        template_cache_size: int = TEMPLATE_CACHE_SIZE,
+    ):
+        self.graph = graph
+        self.expand_ranges = expand_ranges
+        self.memo_size = memo_size
+        # the profiler of the build, taken once rather than for every formula
+        self.profiler = profiling.active_profiler()
+        self.templates = FormulaTemplates(template_cache_size)
+        # (sheet of the formula, reference) -> node
+        self._node_names: Dict[Tuple[str, str], str] = {}
+        self._expanded: Set[str] = set()  # range nodes linked to their cells
+        self._nodes: List[Tuple[str, dict]] = []
+        self._edges: List[Tuple[str, str]] = []
+        self.unlinked: List[str] = []
+
+    def add_formula(
+        self,
+        coordinate: str,
+        formula: str,
+        sheet_name: str,
+        stats: Optional[SheetStats] = None,
+    ) -> None:
+        """
+        Add the formula of the cell at the coordinate of the (sanitized) sheet and
+        its references. The formula is counted in the sheet statistics, if given.
+        """
+        # the time of every step is added to the stages of the profiler
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap("read rows")
+        tokens = self.templates.tokenize(formula, coordinate)
+        if stats is not None:
+            stats.record_formula(tokens.references, tokens.functions)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Formula in {sheet_name}!{coordinate}: {formula}")
+            logger.debug(f"  Functions used: {tokens.functions}")
+        if profiler is not None:
+            profiler.lap("extract references")
+
+        cell = self._node(coordinate, sheet_name)
+        direct_references, range_references, _ = split_references(
+            tokens.references, expand_ranges=False
+        )
+        edges = self._edges
+        edge_count = len(edges)
+        for reference in direct_references:
+            node = self._node(reference, sheet_name)
+            if node != cell:
+                edges.append((cell, node))
+        if len(edges) == edge_count and not range_references:
+            self.unlinked.append(cell)
+        new_ranges = []
+        for reference in range_references:
+            range_node = self._node(reference, sheet_name)
+            edges.append((cell, range_node))
+            if (
+                self.expand_ranges
+                and range_node not in self._expanded
+                and not is_unbounded_range(reference)
+            ):
+                new_ranges.append((reference, range_node))
+        for reference, range_node in new_ranges:
+            if len(self._expanded) >= self.memo_size:
+                self._expanded.clear()
+            self._expanded.add(range_node)
+            for member in expand_range(reference):
+                edges.append((range_node, self._node(member, sheet_name)))
+        if profiler is not None:
+            profiler.lap("expand ranges")
+
+        if len(edges) >= _BATCH_SIZE:
+            self.flush()
+
+    def _node(self, reference: str, sheet_name: str) -> str:
+        """
+        The node of a reference in a formula of the sheet, added if it is new.
+        """
+        key = (sheet_name, reference)
+        node = self._node_names.get(key)
+        if node is None:
+            if len(self._node_names) >= self.memo_size:
+                self._node_names.clear()
+            node_sheet = sanitize_sheetname(get_range_sheet_name(reference, sheet_name))
+            node = sanitize_nodename(format_reference(reference, sheet_name))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Adding node: {node} in sheet: {node_sheet}")
+            self._node_names[key] = node
+            self._nodes.append((node, {"sheet": node_sheet}))
+        return node
+
+    def flush(self) -> None:
+        """
+        Insert the collected nodes and edges into the graph.
+        """
+        if self._nodes:
+            self.graph.add_nodes_from(self._nodes)
+            self._nodes = []
+        if self._edges:
+            self.graph.add_edges_from(self._edges)
+            self._edges = []
+        if self.profiler is not None:
+            self.profiler.lap("insert into graph")
 
 
 def add_references_to_graph(
@@ -133,10 +587,13 @@ def add_references_to_graph(
     """
     Add direct cell references to the graph.
     """
+    debug = logger.isEnabledFor(logging.DEBUG)
     for cell_reference in references:
+        cell_sheet_name = get_range_sheet_name(cell_reference, sheet_name)
         cell_reference = format_reference(cell_reference, sheet_name)
-        logger.debug(f"  Cell: {cell_reference}")
-        add_node(graph, cell_reference, sheet_name)
+        if debug:
+            logger.debug(f"  Cell: {cell_reference}")
+        add_node(graph, cell_reference, cell_sheet_name)
         graph.add_edge(current_cell, cell_reference)
 
 
@@ -146,10 +603,12 @@ def add_ranges_to_graph(
     """
     Add range references to the graph.
     """
+    debug = logger.isEnabledFor(logging.DEBUG)
     for range_reference in ranges:
         range_sheet_name = get_range_sheet_name(range_reference, sheet_name)
         range_reference = format_reference(range_reference, sheet_name)
-        logger.debug(f"  Range: {range_reference}")
+        if debug:
+            logger.debug(f"  Range: {range_reference}")
         add_node(graph, range_reference, range_sheet_name)
         graph.add_edge(current_cell, range_reference)
 
@@ -171,6 +630,37 @@ def add_range_dependencies_to_graph(
         graph.add_edge(range_reference, cell_reference)
 
 
+def add_range_memberships(graph: nx.DiGraph, unbounded_only: bool = False) -> None:
+    """
+    Connect range nodes to the cells of the graph that lie within them.
+
+    Used for ranges that are not expanded: instead of adding every cell of a range,
+    the ranges are put in a RangeIndex and each cell node is looked up in it.
+    With unbounded_only=True only whole-column and whole-row ranges are linked.
+    """
+    index = RangeIndex()
+    cells = []
+    for node in graph.nodes:
+        sheet, _, reference = node.rpartition("!")
+        if ":" in reference:
+            if not unbounded_only or is_unbounded_range(reference):
+                index.add(sheet, range_bounds(reference)[1], node)
+        else:
+            cells.append((node, sheet, reference))
+
+    if not len(index):
+        return
+
+    membership_edges = []
+    for node, sheet, reference in cells:
+        row, col = coordinate_to_tuple(reference)
+        for range_node in index.ranges_containing(sheet, row, col):
+            membership_edges.append((range_node, node))
+
+    logger.debug(f"Adding {len(membership_edges)} range membership edges")
+    graph.add_edges_from(membership_edges)
+
+
 def format_reference(reference: str, sheet_name: str) -> str:
     """
     Format a cell or range reference to include the sheet name if not already present.
@@ -0,0 +1,261 @@
+"""
+Incremental rebuilds of the dependency graph. The graph parts of every sheet
+are kept in a state file together with a fingerprint of the sheet's formulas,
+and only the sheets whose formulas changed since the last run are parsed again.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+import networkx as nx
+
+from .build_stats import BuildStats, SheetStats
+from .compact_graph import CompactGraph
+from .graph_cache import CACHE_FORMAT, package_version
+from .graphbuilder import (
+    SheetGraph,
+    finalize_graph,
+    merge_sheet_graph,
+    new_graph,
+    sanitize_sheetname,
+    sheet_graph_from_cells,
+)
+from .xlsx_reader import open_formula_reader
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT = 4
+
+
+class BuildChanges(NamedTuple):
+    """
+    What changed in the workbook since the previous incremental build.
+    Node and edge counts are taken before the final clean-up of the graph.
+    """
+
+    added_sheets: List[str]
+    removed_sheets: List[str]
+    changed_sheets: List[str]
+    unchanged_sheets: List[str]
+    nodes_added: int
+    nodes_removed: int
+    edges_added: int
+    edges_removed: int
+
+
+def fingerprint_formulas(cells: List[Tuple[str, str]]) -> str:
+    """
+    Fingerprint of the formula cells of a sheet.
+    """
+    digest = hashlib.sha256()
+    for coordinate, formula in cells:
+        digest.update(f"{coordinate}\t{formula}\n".encode("utf8"))
+    return digest.hexdigest()
+
+
+def state_options(expand_ranges: bool, reader: str) -> dict:
+    """
+    The options a state file is written with. A state file written with other
+    options, or by a build that parses formulas differently (see
+    graph_cache.CACHE_FORMAT), is not used.
+    """
+    return {
+        "version": package_version(),
+        "cache_format": CACHE_FORMAT,
+        "expand_ranges": expand_ranges,
+        "reader": reader,
+    }
+
+
+def load_state(
+    state_path: str, expand_ranges: bool, reader: str = "openpyxl"
+) -> Dict[str, Tuple[str, SheetGraph]]:
+    """
+    Load the fingerprints and graph parts of the sheets from a state file.
+    Returns an empty state if there is no usable state file.
+    """
+    try:
+        with gzip.open(state_path, "rt", encoding="utf8") as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state file {state_path}: {e}")
+        return {}
+
+    if state.get("format") != STATE_FORMAT or state.get("options") != state_options(
+        expand_ranges, reader
+    ):
+        logger.info("State file was written with other options, rebuilding all sheets.")
+        return {}
+
+    return {
+        sheet["name"]: (
+            sheet["fingerprint"],
+            SheetGraph(
+                sheet["name"],
+                [tuple(node) for node in sheet["nodes"]],
+                [tuple(edge) for edge in sheet["edges"]],
+                SheetStats(**sheet["stats"]),
+                sheet["unlinked"],
+            ),
+        )
+        for sheet in state["sheets"]
+    }
+
+
+def save_state(
+    state_path: str,
+    sheets: List[Tuple[str, SheetGraph]],
+    expand_ranges: bool,
+    reader: str = "openpyxl",
+) -> None:
+    """
+    Write the fingerprints and graph parts of the sheets to a state file.
+    """
+    state = {
+        "format": STATE_FORMAT,
+        "options": state_options(expand_ranges, reader),
+        "sheets": [
+            {
+                "name": sheet_graph.sheet_name,
+                "fingerprint": fingerprint,
+                "nodes": sheet_graph.nodes,
+                "edges": sheet_graph.edges,
+                "stats": asdict(sheet_graph.stats),
+                "unlinked": sheet_graph.unlinked,
+            }
+            for fingerprint, sheet_graph in sheets
+        ],
+    }
+    tmp_path = f"{state_path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf8", compresslevel=1) as file:
+        json.dump(state, file)
+    os.replace(tmp_path, state_path)
+
+
+def incremental_build_graph_and_stats(
+    file_path: str,
+    state_path: str,
+    as_directed: bool = False,
+    expand_ranges: bool = True,
+    reader: str = "openpyxl",
+    compact: bool = False,
+    condensed: bool = False,
+) -> Tuple[Union[nx.Graph, CompactGraph], BuildStats, BuildChanges]:
+    """
+    Build the dependency graph like build_graph_and_stats, but reuse the graph
+    parts of the sheets whose formulas are unchanged since the run that wrote
+    the state file. The state file is updated afterwards.
+    The statistics of unchanged sheets are the ones of the run that parsed them.
+    """
+    stats = BuildStats()
+    start = time.perf_counter()
+    try:
+        workbook = open_formula_reader(file_path, reader)
+    except Exception as e:
+        logger.error(f"Error loading workbook: {e}")
+        sys.exit(1)
+    stats.load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+
+    previous = load_state(state_path, expand_ranges, reader)
+    sheets = []
+    added, changed, unchanged = [], [], []
+
+    for sheet_name in workbook.sheetnames:
+        sanitized_sheet_name = sanitize_sheetname(sheet_name)
+        cells = list(workbook.iter_formula_cells(sheet_name))
+        fingerprint = fingerprint_formulas(cells)
+
+        if sanitized_sheet_name not in previous:
+            added.append(sanitized_sheet_name)
+        elif previous[sanitized_sheet_name][0] == fingerprint:
+            unchanged.append(sanitized_sheet_name)
+            sheets.append(previous[sanitized_sheet_name])
+            continue
+        else:
+            changed.append(sanitized_sheet_name)
+
+        logger.debug(f"========== Analyzing sheet: {sheet_name} ==========")
+        sheets.append(
+            (
+                fingerprint,
+                sheet_graph_from_cells(sanitized_sheet_name, cells, expand_ranges),
+            )
+        )
+    workbook.close()
+
+    current_names = {sheet_graph.sheet_name for _, sheet_graph in sheets}
+    removed = [name for name in previous if name not in current_names]
+
+    old_nodes, old_edges = _nodes_and_edges(
+        sheet_graph for _, sheet_graph in previous.values()
+    )
+    new_nodes, new_edges = _nodes_and_edges(sheet_graph for _, sheet_graph in sheets)
+    changes = BuildChanges(
+        added,
+        removed,
+        changed,
+        unchanged,
+        len(new_nodes - old_nodes),
+        len(old_nodes - new_nodes),
+        len(new_edges - old_edges),
+        len(old_edges - new_edges),
+    )
+
+    graph = new_graph(compact, condensed, as_directed=as_directed)
+    unlinked = []
+    for _, sheet_graph in sheets:
+        merge_sheet_graph(graph, sheet_graph, stats)
+        unlinked.extend(sheet_graph.unlinked)
+    stats.parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    graph = finalize_graph(graph, as_directed, expand_ranges, unlinked)
+    stats.finalize_seconds = time.perf_counter() - start
+
+    save_state(state_path, sheets, expand_ranges, reader)
+    return graph, stats, changes
+
+
+def _nodes_and_edges(sheet_graphs) -> Tuple[set, set]:
+    nodes, edges = set(), set()
+    for sheet_graph in sheet_graphs:
+        nodes.update(node for node, _ in sheet_graph.nodes)
+        edges.update(sheet_graph.edges)
+    return nodes, edges
+
+
+def print_changes(changes: BuildChanges) -> None:
+    """
+    Print what changed since the previous incremental build.
+    """
+    strpadsize = 28
+    numpadsize = 5
+
+    print()
+    print("===  Changes since last run   ===")
+    for label, sheets in [
+        ("Added sheets", changes.added_sheets),
+        ("Removed sheets", changes.removed_sheets),
+        ("Changed sheets", changes.changed_sheets),
+    ]:
+        print(label.ljust(strpadsize) + str(len(sheets)).rjust(numpadsize))
+        for sheet in sheets:
+            print(f"  {sheet}")
+    for label, count in [
+        ("Unchanged sheets", len(changes.unchanged_sheets)),
+        ("Nodes added", changes.nodes_added),
+        ("Nodes removed", changes.nodes_removed),
+        ("Dependencies added", changes.edges_added),
+        ("Dependencies removed", changes.edges_removed),
+    ]:
+        print(label.ljust(strpadsize) + str(count).rjust(numpadsize))
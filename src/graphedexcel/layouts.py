@@ -0,0 +1,349 @@
+"""
+Node layouts for the graph visualization.
+
+Besides the networkx layouts, which take quadratic time or worse and do not
+scale beyond a few thousand nodes, there is a sheet-aware "grid" layout that
+places every node where it lives in the workbook: sheets as blocks, and cells
+by row and column within their sheet. It runs in linear time, so it can lay out
+graphs with hundreds of thousands of nodes in seconds.
+
+Computed layouts can be kept in a LayoutCache, keyed by the structure of the
+graph, the layout and the seed, so rendering the same graph again with other
+colors or node sizes does not compute the layout again. A spring layout of a
+slightly changed graph is warm-started from the positions of the previous one.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import math
+from typing import Dict, Hashable, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from .compact_graph import CELL, CompactGraph
+from .excel_parser import MAX_COLUMN, MAX_ROW, range_bounds
+from .graph_cache import (
+    DEFAULT_MAX_BYTES,
+    DiskCache,
+    default_cache_dir,
+    package_version,
+)
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = ["spring", "circular", "kamada_kawai", "shell", "spectral", "grid"]
+
+# Space between the blocks of the sheets in the grid layout, relative to a block
+GRID_SHEET_GAP = 0.2
+
+# Layouts slow enough to be worth caching, the others are cheaper to recompute
+# than to hash the graph and read the cache entry
+CACHED_LAYOUTS = {"spring", "kamada_kawai", "spectral"}
+
+# A spring layout is warm-started from the previous positions when at least
+# this fraction of the nodes had one, and then runs only a few iterations
+WARM_START_MIN_OVERLAP = 0.5
+WARM_START_ITERATIONS = 15
+
+
+def compute_layout(
+    graph: nx.Graph, layout: str = "spring", seed: Optional[int] = None
+) -> Dict[Hashable, np.ndarray]:
+    """
+    The positions of the nodes of the graph with the given layout, falling back
+    to the spring layout for an unknown layout name. The seed makes the spring
+    layout reproducible.
+    """
+    if layout == "spring":
+        return nx.spring_layout(graph, seed=seed)
+    if layout == "kamada_kawai":
+        return nx.kamada_kawai_layout(graph)
+    if layout == "circular":
+        return nx.circular_layout(graph)
+    if layout == "shell":
+        return nx.shell_layout(graph)
+    if layout == "spectral":
+        return nx.spectral_layout(graph)
+    if layout == "grid":
+        return grid_layout(graph)
+    logger.warning(f"Unknown layout '{layout}'. Falling back to spring layout.")
+    return nx.spring_layout(graph, seed=seed)
+
+
+def graph_structure_hash(graph: nx.Graph) -> str:
+    """
+    SHA-256 of the nodes and edges of a graph, independent of the order in which
+    they were added and of node attributes like the sheet.
+    """
+    digest = hashlib.sha256(b"directed" if graph.is_directed() else b"undirected")
+    for node in sorted(map(repr, graph.nodes)):
+        digest.update(node.encode("utf8"))
+        digest.update(b"\n")
+    digest.update(b"\0")
+    if graph.is_directed():
+        edges = (f"{u!r}\t{v!r}" for u, v in graph.edges)
+    else:
+        edges = ("\t".join(sorted((repr(u), repr(v)))) for u, v in graph.edges)
+    for edge in sorted(edges):
+        digest.update(edge.encode("utf8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class LayoutCache:
+    """
+    Computed node positions, stored in a DiskCache.
+
+    Entries are keyed by the structure hash of the graph, the layout and the
+    seed. With a name, like the path of the workbook, the last layout computed
+    under that name is remembered, and a spring layout of a changed graph with
+    the same name is warm-started from it.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        name: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.cache = DiskCache(cache_dir or default_cache_dir(), max_bytes)
+        self.name = name
+
+    @staticmethod
+    def _key(*parts) -> str:
+        text = "|".join(str(part) for part in (package_version(), *parts))
+        return hashlib.sha256(text.encode("utf8")).hexdigest() + ".layout.json.gz"
+
+    def _latest_key(self, layout: str, seed: Optional[int]) -> str:
+        return self._key("latest", self.name, layout, seed)
+
+    def get(self, key: str) -> Optional[Dict[Hashable, np.ndarray]]:
+        """
+        The positions stored for the key, or None if they are not cached.
+        """
+        data = self.cache.get(key)
+        if data is None:
+            return None
+        try:
+            data = json.loads(gzip.decompress(data))
+            nodes = [
+                tuple(node) if isinstance(node, list) else node
+                for node in data["nodes"]
+            ]
+            return dict(zip(nodes, np.array(data["positions"], dtype=float)))
+        except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable layout cache entry {key}: {e}")
+            return None
+
+    def put(self, key: str, pos: Dict[Hashable, np.ndarray]) -> None:
+        """
+        Store positions for the key.
+        """
+        data = {
+            "nodes": list(pos),
+            "positions": [[float(x), float(y)] for x, y in pos.values()],
+        }
+        try:
+            self.cache.put(key, gzip.compress(json.dumps(data).encode("utf8"), 1))
+        except (OSError, TypeError) as e:
+            # TypeError for nodes that can not be stored as JSON
+            logger.warning(
+                f"Could not write layout to cache {self.cache.cache_dir}: {e}"
+            )
+
+    def layout(
+        self, graph: nx.Graph, layout: str = "spring", seed: Optional[int] = None
+    ) -> Dict[Hashable, np.ndarray]:
+        """
+        compute_layout backed by the cache.
+        """
+        if layout not in CACHED_LAYOUTS:
+            return compute_layout(graph, layout, seed)
+
+        key = self._key(graph_structure_hash(graph), layout, seed)
+        pos = self.get(key)
+        if pos is not None:
+            logger.info("Loaded the layout from the cache.")
+            return pos
+
+        previous = None
+        if layout == "spring" and self.name is not None:
+            latest = self.cache.get(self._latest_key(layout, seed))
+            if latest is not None:
+                previous = self.get(latest.decode("utf8"))
+        if previous is not None and warm_start_overlap(graph, previous) >= (
+            WARM_START_MIN_OVERLAP
+        ):
+            logger.info("Warm-starting the spring layout from the previous layout.")
+            pos = warm_spring_layout(graph, previous, seed)
+        else:
+            pos = compute_layout(graph, layout, seed)
+
+        self.put(key, pos)
+        if self.name is not None:
+            self.cache.put(self._latest_key(layout, seed), key.encode("utf8"))
+        return pos
+
+
+def warm_start_overlap(graph: nx.Graph, previous: Dict[Hashable, np.ndarray]) -> float:
+    """
+    The fraction of the nodes of the graph that have a previous position.
+    """
+    if not len(graph):
+        return 0.0
+    return sum(1 for node in graph if node in previous) / len(graph)
+
+
+def warm_spring_layout(
+    graph: nx.Graph,
+    previous: Dict[Hashable, np.ndarray],
+    seed: Optional[int] = None,
+    iterations: int = WARM_START_ITERATIONS,
+) -> Dict[Hashable, np.ndarray]:
+    """
+    A spring layout starting from the previous positions, running only a few
+    iterations. New nodes start at the center of their positioned neighbors.
+    """
+    initial = {node: previous[node] for node in graph if node in previous}
+    for node in graph:
+        if node not in initial:
+            neighbors = [
+                initial[neighbor]
+                for neighbor in nx.all_neighbors(graph, node)
+                if neighbor in initial
+            ]
+            if neighbors:
+                initial[node] = np.mean(neighbors, axis=0)
+    return nx.spring_layout(graph, pos=initial, iterations=iterations, seed=seed)
+
+
+def grid_layout(graph) -> Dict[Hashable, np.ndarray]:
+    """
+    Place the nodes by (sheet, row, column) in linear time.
+
+    Every sheet is scaled into a unit block, with the first row at the top and
+    the first column on the left, and the blocks are arranged in a square grid
+    in the order the sheets first appear. Ranges are placed at the center of
+    the cells they cover, with whole-column and whole-row ranges clipped to the
+    used area of the sheet. Nodes that are not cell or range names, like
+    'Sheet1!MyName' or integers, are placed in a column of their own after the
+    last sheet. Works on networkx graphs and on a CompactGraph.
+    """
+    if isinstance(graph, CompactGraph):
+        return dict(zip(graph.node_names(), compact_grid_positions(graph)))
+
+    nodes = list(graph.nodes)
+    sheet, row1, col1, row2, col2, is_cell = _parse_node_names(nodes)
+    xy = grid_positions(sheet, row1, col1, row2, col2, is_cell)
+    return dict(zip(nodes, xy))
+
+
+def compact_grid_positions(graph: CompactGraph) -> np.ndarray:
+    """
+    The (n, 2) grid layout positions of the nodes of a CompactGraph, in node id
+    order, computed from its node arrays without creating the node names.
+    """
+    return grid_positions(
+        graph.sheet.astype(np.int64),
+        graph.row1.astype(np.int64),
+        graph.col1.astype(np.int64),
+        graph.row2.astype(np.int64),
+        graph.col2.astype(np.int64),
+        graph.kind == CELL,
+    )
+
+
+def _parse_node_names(nodes: list) -> Tuple[np.ndarray, ...]:
+    """
+    The sheet ids (-1 for nodes that are not cell or range names), bounds and
+    whether each node is a cell, from node names like 'Sheet1!A1:B3'.
+    """
+    count = len(nodes)
+    sheet = np.full(count, -1, dtype=np.int64)
+    bounds = np.ones((count, 4), dtype=np.int64)  # row1, col1, row2, col2
+    is_cell = np.zeros(count, dtype=bool)
+    sheet_ids: Dict[str, int] = {}
+
+    for i, node in enumerate(nodes):
+        if not isinstance(node, str) or "!" not in node:
+            continue
+        sheet_name, _, reference = node.rpartition("!")
+        try:
+            if ":" in reference:
+                col1, row1, col2, row2 = range_bounds(reference)[1]
+            else:
+                row1, col1 = coordinate_to_tuple(reference)
+                row2, col2 = row1, col1
+                is_cell[i] = True
+        except (ValueError, TypeError):
+            continue
+        sheet[i] = sheet_ids.setdefault(sheet_name, len(sheet_ids))
+        bounds[i] = row1, col1, row2, col2
+
+    return sheet, bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3], is_cell
+
+
+def grid_positions(
+    sheet: np.ndarray,
+    row1: np.ndarray,
+    col1: np.ndarray,
+    row2: np.ndarray,
+    col2: np.ndarray,
+    is_cell: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    The (n, 2) grid layout positions of nodes given as arrays of sheet ids
+    (-1 for nodes without a place in a sheet) and row and column bounds.
+    """
+    count = len(sheet)
+    xy = np.zeros((count, 2))
+    if not count:
+        return xy
+    if is_cell is None:
+        is_cell = (row1 == row2) & (col1 == col2)
+
+    placed = sheet >= 0
+    sheets = int(sheet.max()) + 1 if placed.any() else 0
+    sheet, is_cell = sheet[placed], is_cell[placed]
+    row1, col1, row2, col2 = row1[placed], col1[placed], row2[placed], col2[placed]
+
+    # the used area of every sheet: the extent of its cells, or of its
+    # ranges if it has no cells, with unbounded ranges counting by their start
+    max_row = np.ones(sheets, dtype=np.int64)
+    max_col = np.ones(sheets, dtype=np.int64)
+    np.maximum.at(max_row, sheet[is_cell], row2[is_cell])
+    np.maximum.at(max_col, sheet[is_cell], col2[is_cell])
+    has_cells = np.bincount(sheet[is_cell], minlength=sheets) > 0
+    ranges = ~is_cell & ~has_cells[sheet]
+    row_end = np.where(row2 < MAX_ROW, row2, row1)
+    col_end = np.where(col2 < MAX_COLUMN, col2, col1)
+    np.maximum.at(max_row, sheet[ranges], row_end[ranges])
+    np.maximum.at(max_col, sheet[ranges], col_end[ranges])
+
+    row_max, col_max = max_row[sheet], max_col[sheet]
+    row = (row1 + np.minimum(row2, row_max)) / 2
+    col = (col1 + np.minimum(col2, col_max)) / 2
+    # scale into the unit block of the sheet, keeping single rows and columns centered
+    x = np.where(col_max > 1, (col - 1) / np.maximum(col_max - 1, 1), 0.5)
+    y = np.where(row_max > 1, (row - 1) / np.maximum(row_max - 1, 1), 0.5)
+
+    blocks_per_row = max(1, math.ceil(math.sqrt(sheets + int((~placed).any()))))
+    step = 1 + GRID_SHEET_GAP
+    block_x = (sheet % blocks_per_row) * step
+    block_y = (sheet // blocks_per_row) * step
+    xy[placed, 0] = block_x + x
+    xy[placed, 1] = -(block_y + y)
+
+    unplaced = np.flatnonzero(~placed)
+    if len(unplaced):
+        # one more block for the rest, stacked in a column
+        block_x = (sheets % blocks_per_row) * step
+        block_y = (sheets // blocks_per_row) * step
+        xy[unplaced, 0] = block_x + 0.5
+        y = np.arange(len(unplaced)) / max(len(unplaced) - 1, 1)
+        xy[unplaced, 1] = -(block_y + (y if len(unplaced) > 1 else 0.5))
+    return xy
@@ -1,7 +1,9 @@
 # logger_config.py
 
+import copy
 import logging
 import logging.config
+from typing import Optional
 
 logging_config = {
     "version": 1,
@@ -26,23 +28,34 @@ logging_config = {
             "formatter": "minimal",
             "class": "logging.StreamHandler",
         },
-        "file": {
-            "level": "DEBUG",
-            "formatter": "standard",
-            "class": "logging.FileHandler",
-            "filename": "app.log",
-            "encoding": "utf8",
-            "mode": "w",  # 'a' for append, 'w' for overwrite
-        },
     },
     "loggers": {
         "graphedexcel": {
-            "handlers": ["console", "file"],
-            "level": "DEBUG",
+            "handlers": ["console"],
+            "level": "INFO",
             "propagate": False,
         },
     },
     "root": {"handlers": ["minimalconsole"], "level": "WARNING"},
 }
 
-logging.config.dictConfig(logging_config)
+
+def configure_logging(log_file: Optional[str] = None) -> None:
+    """
+    Configure logging for the command line tool. Nothing is configured on import.
+
+    With a log_file, the debug log of graphedexcel is also written to that file.
+    """
+    config = copy.deepcopy(logging_config)
+    if log_file:
+        config["handlers"]["file"] = {
+            "level": "DEBUG",
+            "formatter": "standard",
+            "class": "logging.FileHandler",
+            "filename": log_file,
+            "encoding": "utf8",
+            "mode": "w",  # 'a' for append, 'w' for overwrite
+        }
+        config["loggers"]["graphedexcel"]["handlers"].append("file")
+        config["loggers"]["graphedexcel"]["level"] = "DEBUG"
+    logging.config.dictConfig(config)
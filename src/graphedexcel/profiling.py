@@ -0,0 +1,256 @@
+"""
+Stage timing and memory profiling of a run, for --profile.
+
+The stages of a run are marked with profiling.stage(name), which does nothing
+unless a Profiler is active. Work done per formula cell is too fine-grained for
+a context manager per step, so the graph builder takes the active profiler when
+it is created and calls lap(name) on it instead, which adds the time since the
+previous lap to the stage.
+
+The active profiler is kept in a context variable, so builds in other threads
+(or other contexts, like the requests of a server) are not timed by it. The
+cprofile and tracemalloc modes still trace the whole process.
+"""
+
+import cProfile
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PROFILE_MODES = ["time", "cprofile", "tracemalloc"]
+
+# The profiler of the current run, if any, see active_profiler()
+_active: ContextVar[Optional["Profiler"]] = ContextVar(
+    "graphedexcel_profiler", default=None
+)
+
+# Number of allocation sites written by the tracemalloc mode
+TRACEMALLOC_TOP = 30
+
+DEFAULT_PROFILE_OUTPUT = {
+    "cprofile": "graphedexcel.prof",
+    "tracemalloc": "graphedexcel-tracemalloc.txt",
+}
+
+
+@dataclass
+class StageStats:
+    """
+    The time spent in a stage and the memory used during it.
+    """
+
+    parent: Optional[str] = None
+    calls: int = 0
+    seconds: float = 0.0
+    # with tracemalloc the peak of traced memory during the stage,
+    # otherwise the peak RSS of the process at the end of the stage
+    peak_bytes: Optional[int] = None
+
+
+class Profiler:
+    """
+    Collects the time and memory of the stages of a run.
+
+    The mode is "time" for the stage table alone, "cprofile" to also profile
+    every function call with cProfile, and "tracemalloc" to trace the memory
+    allocated in each stage and by each line of code.
+    """
+
+    def __init__(self, mode: str = "time"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        self.mode = mode
+        self.stages: Dict[str, StageStats] = {}
+        self.total_seconds = 0.0
+        self._stack: List[list] = []  # [name, peak bytes] of the open stages
+        self._last = 0.0
+        self._start = 0.0
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._token: Optional[Token] = None
+
+    def start(self) -> None:
+        """
+        Start profiling and make this the active profiler of the current
+        context.
+        """
+        self._token = _active.set(self)
+        if self.mode == "tracemalloc":
+            tracemalloc.start()
+        elif self.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = self._last = time.perf_counter()
+
+    def stop(self) -> None:
+        self.total_seconds = time.perf_counter() - self._start
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.mode == "tracemalloc":
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        if self._token is not None:
+            _active.reset(self._token)
+            self._token = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the stage in the with block and record the memory used during it.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            if self._stack:
+                parent = self._stack[-1]
+                parent[1] = max(parent[1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append([name, 0])
+        start = self._last = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self._stats(name)
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+            _, peak = self._stack.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+            else:
+                peak = peak_rss_bytes()
+            if peak is not None:
+                stats.peak_bytes = max(stats.peak_bytes or 0, peak)
+            self._last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        """
+        Add the time since the previous lap, or the start or end of a stage,
+        to the stage.
+        """
+        now = time.perf_counter()
+        stats = self._stats(name)
+        stats.seconds += now - self._last
+        stats.calls += 1
+        self._last = now
+
+    def _stats(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            parent = self._stack[-1][0] if self._stack else None
+            if parent == name:
+                parent = self._stack[-2][0] if len(self._stack) > 1 else None
+            stats = self.stages[name] = StageStats(parent)
+        return stats
+
+    def print_table(self, file: Optional[TextIO] = None) -> None:
+        """
+        Print the time, share of the run and memory of every stage.
+        """
+        file = file or sys.stderr
+        memory = "Traced peak MB" if self.mode == "tracemalloc" else "Peak RSS MB"
+        print(file=file)
+        print("===  Profile                  ===", file=file)
+        print(
+            f"{'Stage'.ljust(28)}{'Calls':>9}{'Seconds':>10}{'%':>7}{memory:>16}",
+            file=file,
+        )
+        total = self.total_seconds or 1.0
+        for name, stats in self._ordered():
+            label = ("  " + name) if stats.parent else name
+            peak = "-" if stats.peak_bytes is None else f"{stats.peak_bytes / 1e6:.1f}"
+            print(
+                f"{label.ljust(28)}{stats.calls:>9}{stats.seconds:>10.3f}"
+                f"{100 * stats.seconds / total:>7.1f}{peak:>16}",
+                file=file,
+            )
+        print(f"{'Total'.ljust(28)}{'':>9}{self.total_seconds:>10.3f}", file=file)
+        print(file=file)
+
+    def _ordered(self) -> List[tuple]:
+        # every stage is followed by the stages within it
+        children: Dict[Optional[str], List[str]] = {}
+        for name, stats in self.stages.items():
+            children.setdefault(stats.parent, []).append(name)
+        ordered = []
+
+        def add(parent):
+            for name in children.get(parent, []):
+                ordered.append((name, self.stages[name]))
+                add(name)
+
+        add(None)
+        return ordered
+
+    def dump(self, path: str) -> None:
+        """
+        Write the cProfile statistics (for pstats or snakeviz) or the
+        allocation sites using the most memory, depending on the mode.
+        """
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(path)
+        elif self._snapshot is not None:
+            top = self._snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+            with open(path, "w", encoding="utf8") as file:
+                for statistic in top:
+                    print(statistic, file=file)
+
+
+def active_profiler() -> Optional[Profiler]:
+    """
+    The profiler started in the current context, if any.
+    """
+    return _active.get()
+
+
+def stage(name: str):
+    """
+    Time the with block as a stage of the active profiler, if there is one.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    The peak resident set size of the process, if the platform reports it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def profile(mode: Optional[str], output_path: Optional[str] = None) -> Iterator[None]:
+    """
+    Profile the with block if a mode is given, then print the stage table to
+    stderr and, for the cprofile and tracemalloc modes, write their output to
+    output_path (by default graphedexcel.prof or graphedexcel-tracemalloc.txt).
+    """
+    if mode is None:
+        yield
+        return
+    profiler = Profiler(mode)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        profiler.print_table()
+        if mode in DEFAULT_PROFILE_OUTPUT:
+            path = output_path or DEFAULT_PROFILE_OUTPUT[mode]
+            profiler.dump(path)
+            print(f"Profile written to {path}.", file=sys.stderr)
@@ -0,0 +1,97 @@
+"""
+A small rectangle index used to find the ranges that contain a given cell,
+without expanding the ranges into individual cells.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+# (min_col, min_row, max_col, max_row, node)
+RangeEntry = Tuple[int, int, int, int, str]
+
+
+class _IntervalNode:
+    """
+    Node of a centered interval tree over the row span of the ranges.
+    Ranges overlapping the center row are kept sorted by start and by end,
+    so a stabbing query only touches the ranges that actually contain the row.
+    """
+
+    def __init__(self, entries: List[RangeEntry]):
+        rows = sorted(row for entry in entries for row in (entry[1], entry[3]))
+        self.center = rows[len(rows) // 2]
+
+        left, right, here = [], [], []
+        for entry in entries:
+            if entry[3] < self.center:
+                left.append(entry)
+            elif entry[1] > self.center:
+                right.append(entry)
+            else:
+                here.append(entry)
+
+        self.by_start = sorted(here, key=lambda entry: entry[1])
+        self.by_end = sorted(here, key=lambda entry: entry[3], reverse=True)
+        self.left = _IntervalNode(left) if left else None
+        self.right = _IntervalNode(right) if right else None
+
+    def stab(self, row: int, col: int, found: List[str]) -> None:
+        node: Optional[_IntervalNode] = self
+        while node is not None:
+            if row < node.center:
+                for min_col, min_row, max_col, _, name in node.by_start:
+                    if min_row > row:
+                        break
+                    if min_col <= col <= max_col:
+                        found.append(name)
+                node = node.left
+            else:
+                for min_col, _, max_col, max_row, name in node.by_end:
+                    if max_row < row:
+                        break
+                    if min_col <= col <= max_col:
+                        found.append(name)
+                node = node.right if row > node.center else None
+
+
+class RangeIndex:
+    """
+    Index of rectangular ranges per sheet.
+
+    Ranges are added with their bounds as returned by
+    openpyxl.utils.range_boundaries (min_col, min_row, max_col, max_row)
+    and can be queried for the ranges that contain a given cell.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, List[RangeEntry]] = {}
+        self._trees: Dict[str, _IntervalNode] = {}
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def add(self, sheet: str, bounds: Tuple[int, int, int, int], node: str) -> None:
+        """
+        Add a range on a sheet. The node is what will be returned by queries.
+        """
+        min_col, min_row, max_col, max_row = bounds
+        self._entries.setdefault(sheet, []).append(
+            (min_col, min_row, max_col, max_row, node)
+        )
+        # the tree for the sheet is rebuilt on the next query
+        self._trees.pop(sheet, None)
+
+    def ranges_containing(self, sheet: str, row: int, col: int) -> List[str]:
+        """
+        Return the ranges on the sheet that contain the cell at (row, col).
+        """
+        entries = self._entries.get(sheet)
+        if not entries:
+            return []
+
+        tree = self._trees.get(sheet)
+        if tree is None:
+            tree = self._trees[sheet] = _IntervalNode(entries)
+
+        found: List[str] = []
+        tree.stab(row, col, found)
+        return found
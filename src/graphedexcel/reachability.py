@@ -0,0 +1,238 @@
+"""
+Reachability queries on a directed dependency graph.
+
+The ReachabilityIndex is built once per graph and answers the two questions
+asked again and again when working on a model: which cells does a cell feed
+(its dependents, everything affected by changing it) and which cells feed a
+cell (its precedents). The graph is condensed to its strongly connected
+components, so circular references are handled as one node, and the component
+DAG is stored as CSR arrays in both directions. Every component also gets two
+topological levels, which rule out most pairs in depends_on without searching.
+"""
+
+from typing import Dict, Hashable, List, Optional, Union
+
+import networkx as nx
+import numpy as np
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from .compact_graph import CompactGraph
+from .dependency_analysis import (
+    VECTORIZED_ROUND_SIZE,
+    csr_arrays,
+    dependency_levels,
+    gather_rows,
+    graph_arrays,
+    strongly_connected_components,
+)
+from .excel_parser import range_bounds
+from .range_index import RangeIndex
+
+
+class ReachabilityIndex:
+    """
+    Index of a directed dependency graph (networkx DiGraph or CompactGraph)
+    for transitive precedent and dependent queries.
+
+    Nodes are given by name, like 'Sheet1!A1'; quotes and $ signs are ignored.
+    A cell that is not a node of the graph, like a constant within a range that
+    was not expanded, is affected through the ranges that contain it.
+    """
+
+    def __init__(self, graph: Union[nx.DiGraph, CompactGraph]):
+        count, src, dst, is_cell, node_name = graph_arrays(graph)
+        self.node_name = node_name
+        self._ids: Dict[Hashable, int] = {node_name(i): i for i in range(count)}
+        self._is_cell = is_cell
+        self._range_index: Optional[RangeIndex] = None
+
+        components, labels = strongly_connected_components(count, src, dst)
+        self.labels = labels
+        csrc, cdst = labels[src], labels[dst]
+        between = csrc != cdst
+        csrc, cdst = csrc[between], cdst[between]
+
+        # component -> components it depends on, and -> components depending on it
+        self._precedents = csr_arrays(components, csrc, cdst)
+        self._dependents = csr_arrays(components, cdst, csrc)
+        # members of every component, in node order
+        self._members = np.argsort(labels, kind="stable")
+        self._member_ptr = np.zeros(components + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=components), out=self._member_ptr[1:])
+
+        # longest paths to a component without precedents and from a component
+        # without dependents: a component can only depend on components with a
+        # lower first level and a higher second level
+        ones = np.ones(components, dtype=np.int64)
+        self._level = dependency_levels(components, csrc, cdst, ones)[0]
+        self._level_from_top = dependency_levels(components, cdst, csrc, ones)[0]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, node) -> bool:
+        return self._node_id(node) is not None
+
+    def _node_id(self, node) -> Optional[int]:
+        node_id = self._ids.get(node)
+        if node_id is None and isinstance(node, str):
+            node_id = self._ids.get(normalize_node_name(node))
+        return node_id
+
+    def precedents(self, node) -> List[Hashable]:
+        """
+        All nodes the node depends on, directly or indirectly.
+        """
+        node_id = self._node_id(node)
+        if node_id is None:
+            return []  # a cell without a formula depends on nothing
+        return self._reachable([node_id], self._precedents)
+
+    def dependents(self, node) -> List[Hashable]:
+        """
+        All nodes that depend on the node, directly or indirectly:
+        everything that is affected when it changes.
+        """
+        node_id = self._node_id(node)
+        if node_id is not None:
+            return self._reachable([node_id], self._dependents)
+        ranges = self._ranges_containing(node)
+        if not ranges:
+            return []
+        return self._reachable(ranges, self._dependents, include_starts=True)
+
+    def depends_on(self, node, other) -> bool:
+        """
+        Whether the node depends on the other node, directly or indirectly.
+        """
+        node_id, other_id = self._node_id(node), self._node_id(other)
+        if node_id is None:
+            return False
+        if other_id is None:
+            ranges = self._ranges_containing(other)
+            return any(self.depends_on(node, self.node_name(r)) for r in ranges)
+        source, target = self.labels[node_id], self.labels[other_id]
+        if source == target:
+            # within a circular reference everything depends on everything
+            size = self._member_ptr[source + 1] - self._member_ptr[source]
+            return node_id != other_id or size > 1
+
+        level, level_from_top = self._level, self._level_from_top
+        target_level, target_level_from_top = level[target], level_from_top[target]
+        indptr, indices = self._precedents
+        indptr, indices = memoryview(indptr), memoryview(indices)
+        stack, seen = [source], {source}
+        while stack:
+            component = stack.pop()
+            start, end = indptr[component], indptr[component + 1]
+            for precedent in indices[start:end]:
+                if precedent == target:
+                    return True
+                if (
+                    precedent not in seen
+                    and level[precedent] > target_level
+                    and level_from_top[precedent] < target_level_from_top
+                ):
+                    seen.add(precedent)
+                    stack.append(precedent)
+        return False
+
+    def _reachable(
+        self, start_ids: List[int], csr: tuple, include_starts: bool = False
+    ) -> List[Hashable]:
+        """
+        The nodes in the components reachable from the components of the start
+        nodes, and the other members of those components, in node order.
+        """
+        indptr, indices = csr
+        reached = np.zeros(len(indptr) - 1, dtype=bool)
+        indptr_v, indices_v, reached_v = (
+            memoryview(a) for a in (indptr, indices, reached)
+        )
+        frontier = np.unique(self.labels[start_ids])
+        starts = frontier
+        while len(frontier):
+            if len(frontier) >= VECTORIZED_ROUND_SIZE:
+                positions, _ = gather_rows(indptr, frontier)
+                successors = indices[positions]
+                successors = np.unique(successors[~reached[successors]])
+                reached[successors] = True
+                frontier = successors
+            else:
+                # one edge at a time, through views for fast single elements
+                following = []
+                for component in frontier.tolist():
+                    start, end = indptr_v[component], indptr_v[component + 1]
+                    for successor in indices_v[start:end]:
+                        if not reached_v[successor]:
+                            reached_v[successor] = True
+                            following.append(successor)
+                frontier = np.array(following, dtype=np.int64)
+        reached[starts] = True
+
+        components = np.flatnonzero(reached)
+        positions, _ = gather_rows(self._member_ptr, components)
+        nodes = np.sort(self._members[positions])
+        if not include_starts:
+            nodes = nodes[~np.isin(nodes, start_ids)]
+        return [self.node_name(i) for i in nodes.tolist()]
+
+    def _ranges_containing(self, node) -> List[int]:
+        """
+        The ids of the range nodes that contain the cell, given by name.
+        """
+        if not isinstance(node, str):
+            return []
+        sheet, _, reference = normalize_node_name(node).rpartition("!")
+        try:
+            row, col = coordinate_to_tuple(reference)
+        except (ValueError, TypeError):
+            return []
+        if self._range_index is None:
+            self._range_index = RangeIndex()
+            for node_id in np.flatnonzero(~self._is_cell).tolist():
+                name = self.node_name(node_id)
+                range_sheet, _, range_reference = name.rpartition("!")
+                self._range_index.add(
+                    range_sheet, range_bounds(range_reference)[1], node_id
+                )
+        return list(self._range_index.ranges_containing(sheet, row, col))
+
+
+def normalize_node_name(node: str) -> str:
+    """
+    The node name of a reference as typed in Excel: 'My Sheet'!$b$4 becomes
+    My Sheet!B4.
+    """
+    sheet, separator, reference = node.rpartition("!")
+    return (
+        f"{sheet.replace(chr(39), '')}{separator}{reference.replace('$', '').upper()}"
+    )
+
+
+QUERIES = ("precedents", "dependents", "depends-on")
+
+
+def run_query(
+    index: ReachabilityIndex, query: str, nodes: List[str], count_only: bool = False
+) -> None:
+    """
+    Answer a query ("precedents" or "dependents" of a node, or whether a node
+    "depends-on" another) and print the result.
+    """
+    if query == "depends-on":
+        node, other = nodes
+        answer = "yes" if index.depends_on(node, other) else "no"
+        print(f"{node} depends on {other}: {answer}")
+        return
+
+    (node,) = nodes
+    result = getattr(index, query)(node)
+    if not result and node not in index:
+        print(f"{node} is not in the graph.")
+    if count_only:
+        print(f"{query.capitalize()} of {node}: {len(result)}")
+        return
+    print(f"{query.capitalize()} of {node} ({len(result)}):")
+    for name in result:
+        print(f"  {name}")
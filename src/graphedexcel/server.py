@@ -0,0 +1,389 @@
+"""
+A long-running analysis service.
+
+Workbooks are analyzed in a pool of worker processes that is started and warmed
+up once, so the import and start-up costs are not paid for every workbook.
+The service speaks HTTP over TCP or a Unix socket:
+
+    GET  /health    status and number of pending analyses
+    POST /analyze   analyze a workbook, given as a JSON body {"path": "..."}
+                    or uploaded as the raw xlsx file
+
+The build options are given as query parameters of /analyze: directed,
+compact_ranges, compact_graph, reader, and format=json|png with layout
+for images. At most workers + queue_size analyses are accepted at a time;
+when the queue is full the request is answered with 503 and Retry-After.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .analysis import AnalysisError, AnalysisResult, analyze_workbook, warm_up
+from .layouts import LAYOUTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+READERS = ("openpyxl", "xml")
+
+
+class ServerBusy(Exception):
+    """
+    The queue of pending analyses is full.
+    """
+
+
+class RequestError(Exception):
+    """
+    The request can not be served, answered with the given HTTP status.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisService:
+    """
+    A warm pool of worker processes with a bounded number of pending analyses.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        cache_dir: Optional[str] = None,
+        use_cache: bool = True,
+        images: bool = True,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.images = images
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # a broken pool is replaced while the server threads are running, when
+        # forking the server process is unsafe, so workers come from a forkserver
+        context = None
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=warm_up,
+            initargs=(self.images,),
+        )
+
+    def warm(self) -> None:
+        """
+        Start all worker processes and wait until they have imported everything.
+        """
+        futures = [self._pool.submit(warm_up, self.images) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @contextmanager
+    def reserve(self):
+        """
+        Context manager holding a place in the queue.
+        Raises ServerBusy right away if the queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ServerBusy()
+        with self._lock:
+            self._pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def run(self, file_path: str, **options) -> AnalysisResult:
+        """
+        Analyze a workbook in the pool and wait for the result,
+        in a place of the queue reserved with reserve().
+
+        If a worker process dies, e.g. killed for running out of memory, the
+        pool is broken: the analyses it was running fail with BrokenProcessPool
+        and the pool is replaced, so later analyses run in a new one.
+        """
+        pool = self._pool
+        try:
+            future = pool.submit(
+                analyze_workbook,
+                file_path,
+                cache_dir=self.cache_dir,
+                use_cache=self.use_cache,
+                **options,
+            )
+            return future.result()
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            raise
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Replace the broken pool, unless another request already did.
+        """
+        with self._lock:
+            if self._pool is not broken:
+                return
+            logger.warning("A worker process died, starting a new pool.")
+            self._pool = self._new_pool()
+        broken.shutdown(wait=False)
+
+    def analyze(self, file_path: str, **options) -> AnalysisResult:
+        """
+        Analyze a workbook in the pool and wait for the result.
+        Raises ServerBusy right away if the queue is full.
+        """
+        with self.reserve():
+            return self.run(file_path, **options)
+
+    def close(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP front end of the AnalysisService of the server.
+    """
+
+    server_version = "graphedexcel"
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+        service = self.server.service
+        self._send_json(
+            HTTPStatus.OK,
+            {"status": "ok", "workers": service.workers, "pending": service.pending},
+        )
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/analyze":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+        service = self.server.service
+        try:
+            options, image_format = parse_options(parse_qs(url.query))
+            # reserve a place before reading the upload, so a full queue
+            # rejects new workbooks without receiving them
+            with service.reserve():
+                with self._request_workbook() as file_path:
+                    result = service.run(file_path, **options)
+        except RequestError as e:
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+            return
+        except ServerBusy:
+            self.close_connection = True
+            self._send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "Too many pending analyses, try again later"},
+                {"Retry-After": "1"},
+            )
+            return
+        except AnalysisError as e:
+            self._send_json(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.exception("Analysis failed")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+            return
+
+        if image_format == "png":
+            self._send(HTTPStatus.OK, "image/png", result.image)
+        else:
+            self._send_json(
+                HTTPStatus.OK,
+                {"summary": result.summary, "stats": result.stats.to_dict()},
+            )
+
+    def _request_workbook(self):
+        """
+        Context manager giving the path of the workbook of the request:
+        the path in a JSON body, or a temporary copy of an uploaded workbook.
+        """
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.server.max_upload_bytes:
+            raise RequestError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"Uploads are limited to {self.server.max_upload_bytes} bytes",
+            )
+        body = self.rfile.read(length)
+
+        if self.headers.get_content_type() == "application/json":
+            try:
+                file_path = json.loads(body)["path"]
+            except (ValueError, KeyError, TypeError):
+                raise RequestError(
+                    HTTPStatus.BAD_REQUEST, 'Expected a JSON body like {"path": "..."}'
+                )
+            if not os.path.isfile(file_path):
+                raise RequestError(HTTPStatus.NOT_FOUND, f"File not found: {file_path}")
+            return nullcontext(file_path)
+        return _uploaded_workbook(body)
+
+    def _send_json(self, status: HTTPStatus, data: dict, headers=None) -> None:
+        body = json.dumps(data).encode("utf8")
+        self._send(status, "application/json", body, headers)
+
+    def _send(self, status: HTTPStatus, content_type: str, body: bytes, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # client_address is empty for Unix sockets, so address_string() can't be used
+        logger.info(format % args)
+
+
+@contextmanager
+def _uploaded_workbook(data: bytes):
+    """
+    Write an uploaded workbook to a temporary file, removed afterwards.
+    """
+    fd, file_path = tempfile.mkstemp(suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        yield file_path
+    finally:
+        os.unlink(file_path)
+
+
+def parse_options(query: dict) -> tuple:
+    """
+    The analyze_workbook options and the response format ("json" or "png")
+    from the query parameters of an /analyze request.
+    """
+
+    def value(name, default, choices=None):
+        result = query.get(name, [default])[-1]
+        if choices is not None and result not in choices:
+            raise RequestError(
+                HTTPStatus.BAD_REQUEST,
+                f"Invalid {name} '{result}', use one of {', '.join(choices)}",
+            )
+        return result
+
+    def flag(name):
+        return value(name, "0").lower() in ("1", "true", "yes")
+
+    image_format = value("format", "json", ("json", "png"))
+    options = {
+        "as_directed": flag("directed"),
+        "expand_ranges": not flag("compact_ranges"),
+        "compact": flag("compact_graph"),
+        "reader": value("reader", "openpyxl", READERS),
+    }
+    if image_format == "png":
+        options["image_layout"] = value("layout", "spring", LAYOUTS)
+    return options, image_format
+
+
+class AnalysisHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: AnalysisService, max_upload_bytes: int):
+        self.service = service
+        self.max_upload_bytes = max_upload_bytes
+        super().__init__(address, AnalysisRequestHandler)
+
+
+class UnixAnalysisHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def __init__(self, socket_path, service: AnalysisService, max_upload_bytes: int):
+        self.service = service
+        self.max_upload_bytes = max_upload_bytes
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, AnalysisRequestHandler)
+
+
+def create_server(
+    service: AnalysisService,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None,
+    max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+):
+    """
+    Create the HTTP server for the service, on a Unix socket if a socket path
+    is given and on host:port otherwise.
+    """
+    if socket_path:
+        return UnixAnalysisHTTPServer(socket_path, service, max_upload_bytes)
+    return AnalysisHTTPServer((host, port), service, max_upload_bytes)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+    cache_dir: Optional[str] = None,
+    use_cache: bool = True,
+) -> None:
+    """
+    Run the analysis service until interrupted.
+    """
+    service = AnalysisService(workers, queue_size, cache_dir, use_cache)
+    logger.info(f"Starting {service.workers} worker processes...")
+    service.warm()
+    server = create_server(service, host, port, socket_path, max_upload_bytes)
+    address = socket_path or f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Serving workbook analyses on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
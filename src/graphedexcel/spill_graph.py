@@ -0,0 +1,331 @@
+"""
+Memory-bounded graph builds for workbooks whose graph does not fit in memory,
+for --max-memory.
+
+The SpillGraph takes the add_node/add_edge calls of the graph builder and
+buffers them up to a share of the memory limit, then writes them to a SQLite
+database on disk. SQLite keeps the nodes in a B-tree sorted by name and sorts
+and deduplicates the edges on disk when the build is finalized, so neither
+ever has to be held in memory. The result is a CompactGraph whose node and edge
+arrays are memory-mapped files, which the summary reads a chunk at a time.
+A networkx graph is only made from it for visualization, if it fits.
+"""
+
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import weakref
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import profiling
+from .compact_graph import CELL, RANGE, CompactGraph, parse_node
+
+logger = logging.getLogger(__name__)
+
+# Rough memory use of a buffered node or edge: the tuple and its strings
+_BUFFERED_ROW_BYTES = 200
+
+# Share of the memory limit used for buffering and for SQLite's page cache
+_BUFFER_SHARE = 8
+_CACHE_SHARE = 4
+
+# Rows read from SQLite at a time when writing the arrays
+_FETCH_SIZE = 1 << 16
+
+# The edges between node ids, without self loops, keeping the first of each
+# pair; undirected edges are stored with the smaller id first
+_INSERT_FINAL = (
+    "INSERT INTO final SELECT a, b, MIN(first) FROM ("
+    "SELECT s.id AS a, d.id AS b, e.rowid AS first FROM edges e "
+    "JOIN ids s ON s.name = e.src JOIN ids d ON d.name = e.dst "
+    "WHERE s.id != d.id) GROUP BY a, b"
+)
+_INSERT_FINAL_UNDIRECTED = (
+    "INSERT INTO final SELECT a, b, MIN(first) FROM ("
+    "SELECT MIN(s.id, d.id) AS a, MAX(s.id, d.id) AS b, e.rowid AS first FROM edges e "
+    "JOIN ids s ON s.name = e.src JOIN ids d ON d.name = e.dst "
+    "WHERE s.id != d.id) GROUP BY a, b"
+)
+
+# Edges from the ranges to the cells within them, with the kind of a cell and
+# of a cell (all ranges) or a bounded range (unbounded ranges only) as parameters
+_LINK_ALL_RANGES = (
+    "INSERT INTO edges SELECT r.name, c.name FROM nodes r JOIN nodes c "
+    "ON c.sheet = r.sheet AND c.kind = ? "
+    "AND c.col1 BETWEEN r.col1 AND r.col2 AND c.row1 BETWEEN r.row1 AND r.row2 "
+    "WHERE r.kind != ?"
+)
+_LINK_UNBOUNDED_RANGES = (
+    "INSERT INTO edges SELECT r.name, c.name FROM nodes r JOIN nodes c "
+    "ON c.sheet = r.sheet AND c.kind = ? "
+    "AND c.col1 BETWEEN r.col1 AND r.col2 AND c.row1 BETWEEN r.row1 AND r.row2 "
+    "WHERE r.kind > ?"
+)
+
+# The node columns written to arrays, in the order of _SELECT_NODES
+_NODE_COLUMNS = ["kind", "sheet", "row1", "col1", "row2", "col2"]
+_SELECT_NODES = "SELECT kind, sheet, row1, col1, row2, col2 FROM nodes ORDER BY seq"
+
+# Rough memory use of a node and of an edge of a networkx graph
+NETWORKX_NODE_BYTES = 600
+NETWORKX_EDGE_BYTES = 300
+
+_MEMORY_SIZE_REGEX = re.compile(r"\s*([0-9]+(?:\.[0-9]+)?)\s*([kmgt]?)i?b?\s*", re.I)
+_MEMORY_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_memory_size(text: str) -> int:
+    """
+    The number of bytes of a size like '512M', '2G' or '1.5GB'; a plain number
+    is in bytes. Raises ValueError for anything else.
+    """
+    match = _MEMORY_SIZE_REGEX.fullmatch(text)
+    if match is None:
+        raise ValueError(f"Invalid memory size '{text}', use e.g. 512M or 2G.")
+    number, unit = match.groups()
+    return int(float(number) * _MEMORY_UNITS[unit.lower()])
+
+
+@dataclass
+class SpillStats:
+    """
+    What a memory-bounded build wrote to disk.
+    """
+
+    spills: int = 0  # times the buffers were written to the database
+    node_rows: int = 0  # nodes written, including repeats
+    edge_rows: int = 0  # edges written, including repeats and range links
+    disk_bytes: int = 0  # size of the database and arrays at the end
+
+
+class SpillGraph:
+    """
+    Collects a graph on disk from the calls the graph builder makes to build a
+    graph in memory, so it can be passed to the graph builder directly.
+
+    Nodes must be added before their edges, as the graph builder does; like in
+    a CompactGraph, the sheet is part of the node name and attributes are
+    ignored. finalize() turns it into a CompactGraph with memory-mapped arrays.
+    """
+
+    def __init__(self, max_memory: int, directory: Optional[str] = None):
+        self.max_memory = max_memory
+        self.directory = tempfile.mkdtemp(prefix="graphedexcel-", dir=directory)
+        self.stats = SpillStats()
+        self.sheets: List[str] = []
+        self._sheet_ids = {}
+        self._nodes: List[tuple] = []
+        self._edges: List[Tuple[str, str]] = []
+        self._buffer_size = max(
+            1024, max_memory // _BUFFER_SHARE // _BUFFERED_ROW_BYTES
+        )
+        self._sequence = 0
+        self._profiler = profiling.active_profiler()
+
+        self._db = sqlite3.connect(os.path.join(self.directory, "graph.sqlite"))
+        cache_kib = max(2048, max_memory // _CACHE_SHARE // 1024)
+        for pragma in [
+            "journal_mode = OFF",
+            "synchronous = OFF",
+            "temp_store = FILE",  # sorts spill to disk too
+            f"cache_size = -{cache_kib}",
+        ]:
+            self._db.execute(f"PRAGMA {pragma}")
+        self._db.execute(
+            "CREATE TABLE nodes (name TEXT PRIMARY KEY, seq INTEGER, sheet INTEGER, "
+            "kind INTEGER, row1 INTEGER, col1 INTEGER, row2 INTEGER, col2 INTEGER) "
+            "WITHOUT ROWID"
+        )
+        self._db.execute("CREATE TABLE edges (src TEXT, dst TEXT)")
+
+    def add_node(self, node: str, **attr) -> None:
+        sheet, kind, row1, col1, row2, col2 = parse_node(node)
+        sheet_id = self._sheet_ids.get(sheet)
+        if sheet_id is None:
+            sheet_id = self._sheet_ids[sheet] = len(self.sheets)
+            self.sheets.append(sheet)
+        self._nodes.append(
+            (node, self._sequence, sheet_id, kind, row1, col1, row2, col2)
+        )
+        self._sequence += 1
+        if len(self._nodes) >= self._buffer_size:
+            self.spill()
+
+    def add_nodes_from(self, nodes: Iterable) -> None:
+        for node in nodes:
+            self.add_node(node[0] if isinstance(node, tuple) else node)
+
+    def add_edge(self, u: str, v: str, **attr) -> None:
+        self._edges.append((u, v))
+        if len(self._edges) >= self._buffer_size:
+            self.spill()
+
+    def add_edges_from(self, edges: Iterable[Tuple[str, str]]) -> None:
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    def spill(self) -> None:
+        """
+        Write the buffered nodes and edges to the database.
+        """
+        if self._nodes:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._nodes,
+            )
+            self.stats.node_rows += len(self._nodes)
+            self._nodes = []
+        if self._edges:
+            self._db.executemany("INSERT INTO edges VALUES (?, ?)", self._edges)
+            self.stats.edge_rows += len(self._edges)
+            self._edges = []
+        self.stats.spills += 1
+        if self._profiler is not None:
+            self._profiler.lap("spill to disk")
+
+    def finalize(
+        self, as_directed: bool = False, expand_ranges: bool = True
+    ) -> CompactGraph:
+        """
+        Link ranges to their cells, remove self loops, duplicate edges and
+        isolated nodes, optionally making the graph undirected, and return it
+        as a CompactGraph of memory-mapped arrays, like CompactGraph.finalize().
+        The arrays are deleted when the graph is.
+        """
+        self.spill()
+        db = self._db
+        with profiling.stage("link ranges"):
+            self._link_range_members(unbounded_only=expand_ranges)
+
+        with profiling.stage("sort edges on disk"):
+            db.execute(
+                "CREATE TABLE ids (name TEXT PRIMARY KEY, id INTEGER) WITHOUT ROWID"
+            )
+            db.execute(
+                "INSERT INTO ids SELECT name, ROW_NUMBER() OVER (ORDER BY seq) - 1 "
+                "FROM nodes"
+            )
+            db.execute(
+                "CREATE TABLE final (a INTEGER, b INTEGER, first INTEGER, "
+                "PRIMARY KEY (a, b)) WITHOUT ROWID"
+            )
+            db.execute(_INSERT_FINAL if as_directed else _INSERT_FINAL_UNDIRECTED)
+            db.execute("DROP TABLE edges")
+
+        with profiling.stage("write arrays"):
+            graph = self._write_arrays(as_directed)
+        db.close()
+        os.remove(os.path.join(self.directory, "graph.sqlite"))
+        weakref.finalize(graph, shutil.rmtree, self.directory, True)
+        return graph
+
+    def _link_range_members(self, unbounded_only: bool) -> None:
+        self._db.execute("CREATE INDEX cells ON nodes (sheet, kind, col1, row1)")
+        if unbounded_only:
+            cursor = self._db.execute(_LINK_UNBOUNDED_RANGES, (CELL, RANGE))
+        else:
+            cursor = self._db.execute(_LINK_ALL_RANGES, (CELL, CELL))
+        self.stats.edge_rows += max(cursor.rowcount, 0)
+
+    def _write_arrays(self, directed: bool) -> CompactGraph:
+        """
+        Write the edges, in the order they were first added, and the nodes with
+        edges to .npy files and map them into memory.
+        """
+        db = self._db
+        (node_count,) = db.execute("SELECT COUNT(*) FROM nodes").fetchone()
+        (edge_count,) = db.execute("SELECT COUNT(*) FROM final").fetchone()
+
+        src = self._new_array("src", np.int32, edge_count)
+        dst = self._new_array("dst", np.int32, edge_count)
+        used = np.zeros(node_count, dtype=bool)
+        cursor = db.execute("SELECT a, b FROM final ORDER BY first")
+        start = 0
+        for rows in iter(lambda: cursor.fetchmany(_FETCH_SIZE), []):
+            pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            end = start + len(pairs)
+            used[pairs[:, 0]] = True
+            used[pairs[:, 1]] = True
+            src[start:end], dst[start:end] = pairs[:, 0], pairs[:, 1]
+            start = end
+
+        # renumber the nodes that have edges
+        new_ids = (np.cumsum(used) - 1).astype(np.int32)
+        for start in range(0, edge_count, _FETCH_SIZE):
+            end = start + _FETCH_SIZE
+            src[start:end] = new_ids[src[start:end]]
+            dst[start:end] = new_ids[dst[start:end]]
+
+        columns = _NODE_COLUMNS
+        kept = int(used.sum())
+        nodes = {
+            column: self._new_array(
+                column, np.int8 if column == "kind" else np.int32, kept
+            )
+            for column in columns
+        }
+        cursor = db.execute(_SELECT_NODES)
+        start = 0
+        position = 0
+        for rows in iter(lambda: cursor.fetchmany(_FETCH_SIZE), []):
+            table = np.array(rows, dtype=np.int64).reshape(-1, len(columns))
+            end = start + len(table)
+            table = table[used[start:end]]
+            start = end
+            stop = position + len(table)
+            for i, column in enumerate(columns):
+                nodes[column][position:stop] = table[:, i]
+            position = stop
+
+        for array in [src, dst, *nodes.values()]:
+            array.flush()
+        del src, dst, nodes
+        arrays = {
+            name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+            for name in ["src", "dst", *columns]
+        }
+        self.stats.disk_bytes = directory_size(self.directory)
+        return CompactGraph.from_arrays(
+            self.sheets,
+            arrays["kind"],
+            arrays["sheet"],
+            arrays["row1"],
+            arrays["col1"],
+            arrays["row2"],
+            arrays["col2"],
+            arrays["src"],
+            arrays["dst"],
+            directed,
+        )
+
+    def _new_array(self, name: str, dtype, length: int) -> np.memmap:
+        path = os.path.join(self.directory, f"{name}.npy")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(length,))
+
+    def close(self) -> None:
+        """
+        Remove the files of a graph that was not finalized.
+        """
+        self._db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def directory_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def fits_in_memory(graph: CompactGraph, max_memory: int) -> bool:
+    """
+    Whether the graph would fit within max_memory as a networkx graph.
+    """
+    estimate = (
+        graph.number_of_nodes() * NETWORKX_NODE_BYTES
+        + graph.number_of_edges() * NETWORKX_EDGE_BYTES
+    )
+    return estimate <= max_memory
@@ -0,0 +1,229 @@
+"""
+Readers that yield the formula cells of the sheets of a workbook.
+
+The openpyxl reader goes through openpyxl's read-only worksheets. The xml reader
+streams the worksheet XML straight out of the xlsx archive with expat and only
+looks at <f> elements, so no cell objects are created for the constant cells
+and the shared strings are never loaded.
+"""
+
+import posixpath
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.parsers import expat
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.formula import ArrayFormula
+
+from .formula_templates import SharedFormula
+
+# Chunk size used when feeding the worksheet XML to the parser
+CHUNK_SIZE = 64 * 1024
+
+_RELATIONSHIPS_NS = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+
+
+def iter_formula_cells(ws) -> Iterator[Tuple[str, str]]:
+    """
+    Yield the coordinate and formula of every formula cell in an openpyxl sheet.
+    """
+    for row in ws.iter_rows():
+        for cell in row:
+            value = cell.value
+            if isinstance(value, ArrayFormula):
+                value = value.text
+            if isinstance(value, str) and value.startswith("="):
+                yield cell.coordinate, value
+
+
+class OpenpyxlFormulaReader:
+    """
+    Formula cells of a workbook, read with openpyxl in read-only mode.
+    """
+
+    def __init__(self, file_path: str):
+        self._wb = load_workbook(file_path, data_only=False, read_only=True)
+        self.sheetnames: List[str] = self._wb.sheetnames
+
+    def iter_formula_cells(self, sheet_name: str) -> Iterator[Tuple[str, str]]:
+        return iter_formula_cells(self._wb[sheet_name])
+
+    def close(self) -> None:
+        self._wb.close()
+
+
+class XmlFormulaReader:
+    """
+    Formula cells of a workbook, streamed from the worksheet XML in the archive.
+    Shared formulas are expanded to the formula of each cell.
+    """
+
+    def __init__(self, file_path: str):
+        self._archive = zipfile.ZipFile(file_path)
+        try:
+            self._sheet_paths = self._read_sheet_paths()
+        except BaseException:
+            self._archive.close()
+            raise
+        self.sheetnames: List[str] = list(self._sheet_paths)
+
+    def _read_relationships(self, path: str) -> Dict[str, Tuple[str, str]]:
+        """
+        Map the relationship ids of a .rels part to (type, archive path).
+        """
+        relationships = {}
+        base = posixpath.dirname(posixpath.dirname(path))
+
+        def start_element(name, attrs):
+            if _local_name(name) == "Relationship":
+                target = attrs["Target"]
+                if target.startswith("/"):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(base, target))
+                relationships[attrs["Id"]] = (attrs.get("Type", ""), target)
+
+        _parse_part(self._archive, path, start_element)
+        return relationships
+
+    def _read_sheet_paths(self) -> Dict[str, str]:
+        """
+        Map the worksheet names, in workbook order, to their archive paths.
+        """
+        workbook_path = "xl/workbook.xml"
+        for rel_type, target in self._read_relationships("_rels/.rels").values():
+            if rel_type.endswith("/officeDocument"):
+                workbook_path = target
+
+        folder, name = posixpath.split(workbook_path)
+        relationships = self._read_relationships(f"{folder}/_rels/{name}.rels")
+
+        sheet_paths = {}
+
+        def start_element(name, attrs):
+            if _local_name(name) == "sheet":
+                rel_type, target = relationships[attrs[f"{_RELATIONSHIPS_NS} id"]]
+                if rel_type.endswith("/worksheet"):
+                    sheet_paths[attrs["name"]] = target
+
+        _parse_part(self._archive, workbook_path, start_element)
+        return sheet_paths
+
+    def iter_formula_cells(self, sheet_name: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yield the coordinate and formula of every formula cell in a sheet.
+        """
+        return iter_sheet_xml_formulas(self._archive, self._sheet_paths[sheet_name])
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+def open_formula_reader(file_path: str, reader: str = "openpyxl"):
+    """
+    Open a workbook with the named formula reader, "openpyxl" or "xml".
+    """
+    if reader == "openpyxl":
+        return OpenpyxlFormulaReader(file_path)
+    if reader == "xml":
+        return XmlFormulaReader(file_path)
+    raise ValueError(f"Unknown reader '{reader}'. Use 'openpyxl' or 'xml'.")
+
+
+def iter_sheet_xml_formulas(
+    archive: zipfile.ZipFile, sheet_path: str
+) -> Iterator[Tuple[str, str]]:
+    """
+    Stream a worksheet part and yield (coordinate, formula) for every cell
+    with a formula, translating shared formulas to the cell they belong to.
+    """
+    found: List[Tuple[str, str]] = []
+    shared: Dict[str, SharedFormula] = {}
+    # state of the element being parsed
+    row = 0
+    column = 0
+    coordinate: Optional[str] = None
+    formula_attrs: Optional[dict] = None
+    formula_text: List[str] = []
+
+    def start_element(name, attrs):
+        nonlocal row, column, coordinate, formula_attrs
+        name = _local_name(name)
+        if name == "c":
+            reference = attrs.get("r")
+            if reference is None:
+                column += 1
+                reference = f"{get_column_letter(column)}{row}"
+            else:
+                column = _column_index(reference)
+            coordinate = reference
+        elif name == "f":
+            formula_attrs = attrs
+            formula_text.clear()
+        elif name == "row":
+            row = int(attrs["r"]) if "r" in attrs else row + 1
+            column = 0
+
+    def character_data(data):
+        if formula_attrs is not None:
+            formula_text.append(data)
+
+    def end_element(name):
+        nonlocal formula_attrs
+        if formula_attrs is None or _local_name(name) != "f":
+            return
+        formula = "=" + "".join(formula_text)
+        formula_type = formula_attrs.get("t")
+        if formula_type == "shared":
+            index = formula_attrs.get("si")
+            if index in shared:
+                formula = shared[index].translate(coordinate)
+            elif formula != "=":
+                shared[index] = SharedFormula(formula, coordinate)
+        if formula_type != "dataTable" and formula != "=":
+            found.append((coordinate, formula))
+        formula_attrs = None
+
+    parser = _create_parser()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    with archive.open(sheet_path) as part:
+        while True:
+            chunk = part.read(CHUNK_SIZE)
+            parser.Parse(chunk, not chunk)
+            yield from found
+            found.clear()
+            if not chunk:
+                break
+
+
+def _create_parser():
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_NEVER)
+    parser.buffer_text = True
+    return parser
+
+
+def _parse_part(archive: zipfile.ZipFile, path: str, start_element) -> None:
+    parser = _create_parser()
+    parser.StartElementHandler = start_element
+    with archive.open(path) as part:
+        parser.ParseFile(part)
+
+
+def _local_name(name: str) -> str:
+    return name.rpartition(" ")[2]
+
+
+def _column_index(reference: str) -> int:
+    index = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index
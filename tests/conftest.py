@@ -1,5 +1,48 @@
 import sys
 from pathlib import Path
 
+from openpyxl import Workbook
+import pytest
+
 # Add the src directory to the Python path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+# The sheets of the workbook_path workbook, as sheet name -> rows
+WORKBOOK = {"Sheet": [["1", "2", "=SUM(A1:B1)"], ["=A1*2", "=C1+A2"]]}
+
+
+@pytest.fixture
+def create_excel_file(tmp_path):
+    """
+    A function that saves a workbook with the given sheets (sheet name -> rows)
+    and returns its path, test.xlsx in tmp_path unless a path is given.
+    """
+
+    def _create_excel_file(data, file_path=None):
+        file_path = file_path or tmp_path / "test.xlsx"
+        wb = Workbook()
+        for index, (sheet_name, sheet_data) in enumerate(data.items()):
+            if index == 0:
+                ws = wb.active
+                ws.title = sheet_name
+            else:
+                ws = wb.create_sheet(title=sheet_name)
+            for row in sheet_data:
+                ws.append(row)
+        wb.save(file_path)
+        return file_path
+
+    return _create_excel_file
+
+
+@pytest.fixture
+def workbook_path(request, create_excel_file):
+    """
+    The path of a saved workbook with the sheets given by indirect
+    parametrization, or else by the WORKBOOK of the test module, or else by
+    the WORKBOOK above.
+    """
+    sheets = getattr(request, "param", None)
+    if sheets is None:
+        sheets = getattr(request.module, "WORKBOOK", WORKBOOK)
+    return str(create_excel_file(sheets))
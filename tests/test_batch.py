@@ -0,0 +1,109 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from graphedexcel import batch
+from graphedexcel.batch import (
+    artifact_names,
+    find_workbooks,
+    print_batch_summary,
+    run_batch,
+    write_report,
+)
+
+fork_only = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="patched functions are only seen by forked workers",
+)
+
+
+@pytest.fixture
+def workbook_dir(tmp_path, create_excel_file):
+    folder = tmp_path / "workbooks"
+    (folder / "sub").mkdir(parents=True)
+    create_excel_file({"Sheet": [["1", "=A1*2"]]}, folder / "a.xlsx")
+    create_excel_file({"Sheet": [["1", "2", "=SUM(A1:B1)"]]}, folder / "sub" / "b.xlsx")
+    (folder / "broken.xlsx").write_bytes(b"not a workbook")
+    (folder / "notes.txt").write_text("not a workbook either")
+    return str(folder)
+
+
+def test_find_workbooks(workbook_dir):
+    files = find_workbooks(workbook_dir)
+    assert [os.path.relpath(file, workbook_dir) for file in files] == [
+        "a.xlsx",
+        "broken.xlsx",
+        os.path.join("sub", "b.xlsx"),
+    ]
+    assert find_workbooks(os.path.join(workbook_dir, "*.txt")) == [
+        os.path.join(workbook_dir, "notes.txt")
+    ]
+
+
+def test_artifact_names_are_unique():
+    names = artifact_names(["x/Book.xlsx", "y/Book.xlsx", "report.xlsx"])
+    assert names == {
+        "x/Book.xlsx": "Book",
+        "y/Book.xlsx": "Book-2",
+        "report.xlsx": "report-2",
+    }
+
+
+def test_run_batch(workbook_dir, tmp_path, capsys):
+    output_dir = str(tmp_path / "out")
+    files = find_workbooks(workbook_dir)
+    results = run_batch(files, output_dir, workers=2, use_cache=False)
+
+    assert [result.status for result in results] == ["ok", "error", "ok"]
+    assert results[0].nodes == 2
+    assert results[2].formulas == 1
+    assert "Could not load workbook" in results[1].error
+    with open(results[2].summary_path) as file:
+        assert json.load(file)["functions"] == {"SUM": 1}
+
+    json_path, csv_path = write_report(results, output_dir)
+    with open(json_path) as file:
+        report = json.load(file)
+    assert report["files"] == 3
+    assert report["statuses"] == {"ok": 2, "error": 1}
+    with open(csv_path, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["status"] for row in rows] == ["ok", "error", "ok"]
+
+    print_batch_summary(results)
+    assert "broken.xlsx" in capsys.readouterr().out
+
+
+def slow_analysis(file_path, **options):
+    time.sleep(30)
+
+
+def greedy_analysis(file_path, **options):
+    return bytearray(4 * 1024 * 1024 * 1024)
+
+
+@fork_only
+def test_timeout_stops_slow_workbooks(workbook_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "analyze_workbook", slow_analysis)
+    files = find_workbooks(workbook_dir)[:1]
+
+    start = time.perf_counter()
+    results = run_batch(files, str(tmp_path / "out"), timeout=0.5)
+
+    assert results[0].status == "timeout"
+    assert time.perf_counter() - start < 10
+
+
+@fork_only
+def test_memory_cap(workbook_dir, tmp_path, monkeypatch):
+    pytest.importorskip("resource")
+    monkeypatch.setattr(batch, "analyze_workbook", greedy_analysis)
+    files = find_workbooks(workbook_dir)[:1]
+
+    results = run_batch(files, str(tmp_path / "out"), max_memory_bytes=256 * 1024**2)
+
+    assert results[0].status == "memory"
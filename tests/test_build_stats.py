@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from graphedexcel.build_stats import BuildStats, SheetStats
+from graphedexcel.graphbuilder import build_graph_and_stats
+
+
+WORKBOOK = {
+    "Inputs": [["1", "2", "=SUM(A1:B1)"]],
+    "Calc": [["=Inputs!A1+Inputs!B1", "=IF(A1>0,SUM(A1,C1),0)"]],
+}
+
+
+def test_sheet_stats_record_formula():
+    stats = SheetStats()
+    stats.record_formula(["A1", "B1:B3"], ["SUM", "SUM"])
+    stats.record_formula(["C1"], [])
+
+    assert stats.formulas == 2
+    assert stats.references == 3
+    assert stats.functions == {"SUM": 2}
+
+
+def test_build_stats(workbook_path):
+    _, stats = build_graph_and_stats(workbook_path)
+
+    assert stats.functions == {"SUM": 2, "IF": 1}
+    assert list(stats.sheets) == ["Inputs", "Calc"]
+    assert stats.sheets["Inputs"].formulas == 1
+    assert stats.sheets["Calc"].formulas == 2
+    assert stats.sheets["Calc"].references == 5
+    assert stats.formula_count == 3
+    assert stats.reference_count == 6
+    assert stats.total_seconds >= stats.parse_seconds > 0
+
+
+def test_builds_do_not_share_stats(workbook_path):
+    _, first = build_graph_and_stats(workbook_path)
+    _, second = build_graph_and_stats(workbook_path)
+
+    assert first.functions == second.functions == {"SUM": 2, "IF": 1}
+    assert first.functions is not second.functions
+
+
+def test_concurrent_builds(workbook_path):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(build_graph_and_stats, [workbook_path] * 8))
+
+    for _, stats in results:
+        assert stats.functions == {"SUM": 2, "IF": 1}
+        assert stats.formula_count == 3
+
+
+def test_to_dict_roundtrip(workbook_path):
+    _, stats = build_graph_and_stats(workbook_path)
+
+    assert BuildStats.from_dict(stats.to_dict()) == stats
+
+
+def test_build_stats_count_copied_formulas(create_excel_file):
+    rows = [[row, row, f"=A{row}*B{row}"] for row in range(1, 11)]
+    rows[0].append("=SUM(C1:C10)")
+    file_path = create_excel_file({"Sheet": rows})
+
+    _, stats = build_graph_and_stats(str(file_path))
+
+    assert stats.template_count == 2
+    assert stats.templates == {"=RC[-2]*RC[-1]": 10, "=SUM(RC[-1]:R[9]C[-1])": 1}
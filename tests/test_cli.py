@@ -1,26 +1,12 @@
+import json
 import os
 import tempfile
 from openpyxl import Workbook
 import pytest
-from graphedexcel.cli import parse_arguments, main
+from graphedexcel.cli import parse_arguments, parse_serve_arguments, main
 from unittest.mock import patch
 
 
-@pytest.fixture
-def create_excel_file(tmp_path):
-    def _create_excel_file(data):
-        file_path = tmp_path / "test.xlsx"
-        wb = Workbook()
-        for sheet_name, sheet_data in data.items():
-            ws = wb.create_sheet(title=sheet_name)
-            for row in sheet_data:
-                ws.append(row)
-        wb.save(file_path)
-        return file_path
-
-    return _create_excel_file
-
-
 # test cli.main
 def test_main():
     # assert that main with no arguments raises SystemExit error
@@ -63,6 +49,66 @@ def test_main_with_test_xlsx_file(capsys):
     assert "Dependency graph image saved" in captured.out
 
 
+def test_main_uses_cache_dir(tmp_path, create_excel_file, capsys):
+    """Test that a run with --cache-dir stores the graph in that directory"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2"]]})
+    cache_dir = tmp_path / "cache"
+
+    test_args = [
+        "graphedexcel",
+        str(test_file_path),
+        "-n",
+        "--cache-dir",
+        str(cache_dir),
+    ]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    assert len(os.listdir(cache_dir)) == 1
+
+    test_args.append("--no-cache")
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    assert len(os.listdir(cache_dir)) == 1
+    assert "Cell/Node count                 2" in capsys.readouterr().out
+
+
+def test_main_incremental_reports_changes(tmp_path, create_excel_file, capsys):
+    """Test that --incremental writes a state file and prints the changes"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2"]]})
+    state_path = tmp_path / "state.json.gz"
+
+    test_args = ["graphedexcel", str(test_file_path), "-n"]
+    test_args += ["--incremental", str(state_path)]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+
+    assert state_path.exists()
+    assert "Added sheets                    1" in capsys.readouterr().out
+
+
+def test_main_dependency_analysis(tmp_path, create_excel_file, capsys):
+    """Test that --dependency-analysis prints the recalculation analysis"""
+    test_file_path = create_excel_file(
+        {"Sheet": [["1", "=A1*2", "=B1+1", "=E1", "=D1"]]}
+    )
+
+    test_args = ["graphedexcel", str(test_file_path), "-n", "--no-cache"]
+    with patch("sys.argv", test_args + ["--dependency-analysis"]):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+
+    with patch("sys.argv", test_args + ["--dependency-analysis", "-d"]):
+        with pytest.raises(SystemExit):
+            main()
+    output = capsys.readouterr().out
+    assert "Max dependency depth            2" in output
+    assert "Circular references             1" in output
+
+
 def test_parse_arguments_required(monkeypatch):
     """
     Test that the required positional argument is parsed correctly.
@@ -106,6 +152,10 @@ def test_parse_arguments_optional_arguments():
         "--output-path",
         "output.png",
         "--open-image",
+        "--workers",
+        "4",
+        "--seed",
+        "7",
     ]
     with patch("sys.argv", test_args):
         args = parse_arguments()
@@ -114,6 +164,8 @@ def test_parse_arguments_optional_arguments():
         assert args.config == "config.json"
         assert args.output_path == "output.png"
         assert args.open_image is True
+        assert args.workers == 4
+        assert args.seed == 7
 
 
 def test_parse_arguments_default_values():
@@ -130,6 +182,17 @@ def test_parse_arguments_default_values():
         assert args.no_visualize is False
         assert args.open_image is False
         assert args.hide_legends is None
+        assert args.workers == 1
+        assert args.cache_dir is None
+        assert args.no_cache is False
+        assert args.incremental is None
+        assert args.reader == "openpyxl"
+        assert args.compact_graph is False
+        assert args.condensed_graph is False
+        assert args.dependency_analysis is False
+        assert args.renderer == "networkx"
+        assert args.seed is None
+        assert args.max_memory is None
 
 
 def test_parse_arguments_invalid():
@@ -140,3 +203,201 @@ def test_parse_arguments_invalid():
     with patch("sys.argv", test_args):
         with pytest.raises(SystemExit):
             parse_arguments()
+
+
+def test_parse_serve_arguments():
+    args = parse_serve_arguments(["--socket", "/tmp/ge.sock", "--queue-size", "4"])
+    assert args.socket == "/tmp/ge.sock"
+    assert args.queue_size == 4
+    assert args.host == "127.0.0.1"
+    assert args.workers is None
+    assert args.no_cache is False
+
+
+def test_main_batch(tmp_path, create_excel_file, capsys):
+    """Test that the batch subcommand analyzes a directory and writes a report"""
+    folder = tmp_path / "workbooks"
+    folder.mkdir()
+    create_excel_file({"Sheet": [["1", "=A1*2"]]}, folder / "book.xlsx")
+    output_dir = tmp_path / "out"
+
+    test_args = [
+        "graphedexcel",
+        "batch",
+        str(folder),
+        "-o",
+        str(output_dir),
+        "--no-cache",
+    ]
+    with patch("sys.argv", test_args):
+        main()
+
+    assert (output_dir / "book.json").exists()
+    assert (output_dir / "report.json").exists()
+    assert (output_dir / "report.csv").exists()
+    assert "Report saved to" in capsys.readouterr().out
+
+
+def test_query_main(tmp_path, create_excel_file, capsys, monkeypatch):
+    """Test that the query subcommand answers queries from arguments and stdin"""
+    import io
+
+    from graphedexcel.cli import query_main
+
+    test_file_path = create_excel_file(
+        {"Sheet": [["1", "=A1*2", "=B1+1", "=SUM(A1:B1)"]]}
+    )
+
+    args = [str(test_file_path), "--no-cache", "--dependents", "Sheet!A1"]
+    query_main(
+        args + ["--precedents", "Sheet!$c$1", "--depends-on", "Sheet!D1", "Sheet!A1"]
+    )
+    output = capsys.readouterr().out
+    assert "Dependents of Sheet!A1 (4):" in output
+    assert "  Sheet!A1:B1" in output
+    assert "Precedents of Sheet!$c$1 (2):" in output
+    assert "Sheet!D1 depends on Sheet!A1: yes" in output
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("precedents Sheet!A1\nbogus\n"))
+    query_main([str(test_file_path), "--no-cache", "--stdin", "--count"])
+    captured = capsys.readouterr()
+    assert "Sheet!A1 is not in the graph." not in captured.out
+    assert "Precedents of Sheet!A1: 0" in captured.out
+    assert "Invalid query: bogus" in captured.err
+
+
+def test_main_export_import(tmp_path, create_excel_file, capsys):
+    """Test that a graph written with --export is summarized again with --import"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2", "=B1+1"]]})
+    graph_path = str(tmp_path / "graph.npz")
+
+    test_args = ["graphedexcel", str(test_file_path), "-n", "-d", "--no-cache"]
+    with patch("sys.argv", test_args + ["--export", graph_path]):
+        with pytest.raises(SystemExit):
+            main()
+    exported = capsys.readouterr().out
+
+    test_args = ["graphedexcel", "--import", graph_path, "-n", "--dependency-analysis"]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    imported = capsys.readouterr().out
+    assert imported.startswith(exported)
+    assert "Max dependency depth            2" in imported
+
+    with patch(
+        "sys.argv", ["graphedexcel", str(test_file_path), "--import", graph_path]
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 2
+
+
+def test_main_edges(tmp_path, create_excel_file, capsys):
+    """Test that --edges streams the dependencies instead of building the graph"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2", "=SUM(A1:B1)"]]})
+
+    edges_path = tmp_path / "edges.csv"
+    with patch(
+        "sys.argv", ["graphedexcel", str(test_file_path), "--edges", str(edges_path)]
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 0
+    assert edges_path.read_text().splitlines()[:2] == [
+        "source,target,sheet,kind",
+        "Sheet!B1,Sheet!A1,Sheet,direct",
+    ]
+    assert "Range member edges              2" in capsys.readouterr().out
+
+    with patch("sys.argv", ["graphedexcel", str(test_file_path), "--edges", "-"]):
+        with pytest.raises(SystemExit):
+            main()
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()) == 4
+    assert "Dependency count                4" in captured.err
+
+
+def test_main_profile(tmp_path, create_excel_file, capsys):
+    """Test that --profile prints the stages of the run to stderr"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2", "=B1+1"]]})
+
+    test_args = ["graphedexcel", str(test_file_path), "-n", "--no-cache", "--profile"]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    captured = capsys.readouterr()
+    assert "===  Profile" in captured.err
+    assert "  extract references                2" in captured.err
+    assert "summary" in captured.err
+    assert "Profile" not in captured.out
+
+
+def test_main_summary_format_json(tmp_path, create_excel_file, capsys):
+    """Test that --summary-format json prints the summary as JSON"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2", "=B1+1"]]})
+
+    test_args = [
+        "graphedexcel",
+        str(test_file_path),
+        "-n",
+        "--no-cache",
+        "--as-directed-graph",
+        "--dependency-analysis",
+        "--summary-format",
+        "json",
+    ]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["nodes"] == 3
+    assert summary["edges"] == 2
+    assert summary["most_in_degree"] == [
+        ["Sheet!B1", 1],
+        ["Sheet!A1", 1],
+        ["Sheet!C1", 0],
+    ]
+    assert summary["component_count"] == 1
+    assert summary["dependency_analysis"]["max_depth"] == 2
+
+
+def test_main_max_memory(tmp_path, create_excel_file, capsys):
+    """Test that --max-memory builds the graph on disk and skips large images"""
+    test_file_path = create_excel_file({"Sheet": [["1", "=A1*2", "=B1+1"]]})
+
+    test_args = ["graphedexcel", str(test_file_path), "--max-memory", "1K"]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 0
+    captured = capsys.readouterr()
+    assert "Cell/Node count" in captured.out
+    assert "Dependency graph image saved" not in captured.out
+
+    test_args = [
+        "graphedexcel",
+        str(test_file_path),
+        "--max-memory",
+        "1K",
+        "--compact-graph",
+    ]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    assert (
+        "--max-memory can not be used with --compact-graph" in capsys.readouterr().err
+    )
+
+    test_args = [
+        "graphedexcel",
+        str(test_file_path),
+        "--max-memory",
+        "1K",
+        "--workers",
+        "2",
+    ]
+    with patch("sys.argv", test_args):
+        with pytest.raises(SystemExit):
+            main()
+    assert "--max-memory can not be used with --workers" in capsys.readouterr().err
@@ -0,0 +1,91 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.graph_cache import deserialize_graph, serialize_graph
+from graphedexcel.graph_summarizer import print_summary
+from graphedexcel.graphbuilder import build_graph_and_stats
+
+
+WORKBOOK = {
+    "Inputs": [["1", "2", "3"], ["=A1*2", "=SUM(A1:C1)", "=Calc!A1"]],
+    "Calc": [["=Inputs!A2+Inputs!B2", "=SUM(Inputs!A1:B2)"], ["=A1+B1", "=B2"]],
+    "Output": [["=MAX(Calc!A1:B2)", "=SUM(Inputs!B:B)", "=SUM(1:2)"]],
+}
+
+
+def test_node_encoding_roundtrip():
+    graph = CompactGraph()
+    names = ["Sheet1!A1", "Data Sheet!XFD1048576", "Sheet1!A1:B3", "Sheet1!B:D"]
+    names.append("Sheet1!2:5")
+    ids = [graph.add_node(name) for name in names]
+    for i in range(len(names) - 1):
+        graph.add_edge(names[i], names[i + 1])
+
+    assert graph.add_node("Sheet1!A1") == ids[0]
+    graph.finalize()
+    assert [graph.node_name(i) for i in ids] == names
+    assert graph.node_sheets() == ["Sheet1", "Data Sheet", "Sheet1", "Sheet1", "Sheet1"]
+
+
+@pytest.mark.parametrize("node", ["Sheet!A1048577", "Sheet!XFE1", "Sheet!A1:A2097153"])
+def test_nodes_outside_the_sheet_are_rejected(node):
+    graph = CompactGraph()
+    graph.add_node("Sheet!A1")
+    with pytest.raises(ValueError):
+        graph.add_node(node)
+    assert graph.add_node("Sheet!XFD1048576") == 1
+
+
+def test_finalize_removes_self_loops_duplicates_and_isolates():
+    graph = CompactGraph()
+    graph.add_node("S!Z9")
+    graph.add_edge("S!A1", "S!A1")
+    graph.add_edge("S!A1", "S!B1")
+    graph.add_edge("S!A1", "S!B1")
+    graph.add_edge("S!B1", "S!A1")
+    graph.finalize(as_directed=False)
+
+    assert graph.number_of_nodes() == 2
+    assert graph.number_of_edges() == 1
+    assert list(graph.degree()) == [1, 1]
+    assert graph.csr().sum() == 2
+
+
+@pytest.mark.parametrize(
+    "as_directed, expand_ranges", [(True, True), (False, True), (True, False)]
+)
+def test_compact_build_matches_networkx_build(
+    workbook_path, as_directed, expand_ranges
+):
+    graph, _ = build_graph_and_stats(
+        workbook_path, as_directed=as_directed, expand_ranges=expand_ranges
+    )
+    compact, _ = build_graph_and_stats(
+        workbook_path,
+        as_directed=as_directed,
+        expand_ranges=expand_ranges,
+        compact=True,
+        workers=2,
+    )
+
+    converted = compact.to_networkx()
+    assert isinstance(compact, CompactGraph)
+    assert nx.utils.graphs_equal(graph, converted)
+    assert list(graph.nodes) == list(converted.nodes)
+    assert dict(graph.nodes(data="sheet")) == dict(converted.nodes(data="sheet"))
+    assert np.array_equal(compact.degree(), [d for _, d in graph.degree()])
+
+
+def test_compact_graph_serialization_and_summary(workbook_path, capsys):
+    graph, functions = build_graph_and_stats(workbook_path, compact=True)
+    data = serialize_graph(graph, functions)
+    loaded, _ = deserialize_graph(data, compact=True)
+
+    assert nx.utils.graphs_equal(graph.to_networkx(), loaded.to_networkx())
+
+    print_summary(graph, functions)
+    compact_output = capsys.readouterr().out
+    print_summary(graph.to_networkx(), functions)
+    assert compact_output == capsys.readouterr().out
@@ -0,0 +1,102 @@
+from collections import Counter
+
+
+from graphedexcel.condensed_graph import CondensedGraphBuilder, is_condensed
+from graphedexcel.graph_cache import deserialize_graph, serialize_graph
+from graphedexcel.graph_summarizer import print_summary, summarize_graph
+from graphedexcel.graph_visualizer import visualize_dependency_graph
+from graphedexcel.graphbuilder import build_graph_and_stats
+
+
+WORKBOOK = {
+    "Inputs": [["1", "2", "3"], ["=A1*2", "=SUM(A1:C1)", "=Calc!A1"]],
+    "Calc": [["=Inputs!A2+Inputs!B2", "=SUM(Inputs!A1:B2)"], ["=A1+B1", "=B2"]],
+    "Output": [["=MAX(Calc!A1:B2)+Calc!A1+Calc!A1", "=SUM(Inputs!B:B)", "=SUM(1:2)"]],
+}
+
+
+def references_between_sheets(graph):
+    """
+    Count the edges of a directed cell-level graph per pair of sheets,
+    leaving out the edges from ranges to their cells.
+    """
+    counts = Counter()
+    for u, v in graph.edges:
+        source_sheet, _, reference = u.rpartition("!")
+        if ":" not in reference:
+            counts[source_sheet, v.rpartition("!")[0]] += 1
+    return counts
+
+
+def test_condensed_graph_counts_cell_level_references(workbook_path):
+    cells, _ = build_graph_and_stats(workbook_path, as_directed=True)
+    sheets, _ = build_graph_and_stats(workbook_path, as_directed=True, condensed=True)
+    counts = references_between_sheets(cells)
+
+    assert is_condensed(sheets)
+    assert set(sheets.nodes) == {"Inputs", "Calc", "Output"}
+    assert {(u, v): w for u, v, w in sheets.edges(data="weight")} == {
+        (u, v): count for (u, v), count in counts.items() if u != v
+    }
+    assert dict(sheets.nodes(data="internal")) == {
+        sheet: counts[sheet, sheet] for sheet in sheets.nodes
+    }
+
+
+def test_condensed_graph_is_the_same_in_parallel(workbook_path):
+    serial, _ = build_graph_and_stats(workbook_path, condensed=True)
+    parallel, _ = build_graph_and_stats(workbook_path, condensed=True, workers=2)
+
+    assert dict(parallel.nodes(data="internal")) == dict(serial.nodes(data="internal"))
+    assert sorted(parallel.edges(data="weight")) == sorted(serial.edges(data="weight"))
+
+
+def test_undirected_condensed_graph_adds_up_both_directions():
+    builder = CondensedGraphBuilder()
+    builder.add_edge("A!A1", "B!A1")
+    builder.add_edge("A!A1", "B!A1")  # repeated in the same formula
+    builder.add_edge("A!A2", "B!A1:A3")
+    builder.add_edge("B!A1:A3", "B!A1")  # range member, not a reference
+    builder.add_edge("B!A2", "A!A1")
+    builder.add_edge("C!A1", "C!A1")  # self reference
+    builder.add_node("D!A1", sheet="D")
+    graph = builder.finalize(as_directed=False)
+
+    assert sorted(graph.nodes) == ["A", "B"]
+    assert graph["A"]["B"]["weight"] == 3
+    assert dict(graph.nodes(data="internal")) == {"A": 0, "B": 0}
+
+
+def test_condensed_graph_cache_roundtrip(workbook_path):
+    graph, stats = build_graph_and_stats(
+        workbook_path, as_directed=True, condensed=True
+    )
+    loaded, loaded_stats = deserialize_graph(serialize_graph(graph, stats))
+
+    assert is_condensed(loaded)
+    assert dict(loaded.nodes(data=True)) == dict(graph.nodes(data=True))
+    assert sorted(loaded.edges(data="weight")) == sorted(graph.edges(data="weight"))
+    assert loaded_stats == stats
+
+
+def test_summary_of_condensed_graph(workbook_path, capsys):
+    graph, stats = build_graph_and_stats(
+        workbook_path, as_directed=True, condensed=True
+    )
+    print_summary(graph, stats)
+    output = capsys.readouterr().out
+
+    assert "Sheet count" in output
+    assert "Most connected sheets" in output
+    assert "Calc -> Inputs" in output
+    summary = summarize_graph(graph, stats)
+    assert summary["nodes"] == 3
+    assert summary["sheet_dependencies"][0] == ["Calc", "Inputs", 3]
+
+
+def test_visualize_condensed_graph(workbook_path, tmp_path):
+    graph, _ = build_graph_and_stats(workbook_path, condensed=True)
+    for renderer in ["networkx", "fast"]:
+        file_path = tmp_path / f"{renderer}.png"
+        visualize_dependency_graph(graph, str(file_path), renderer=renderer)
+        assert file_path.exists()
@@ -0,0 +1,111 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.dependency_analysis import (
+    analyze_dependencies,
+    print_dependency_analysis,
+)
+
+
+def chain_graph():
+    # S!A4 = S!A3 + SUM(S!B1:B2), S!A3 = S!A2, S!A2 = S!A1
+    G = nx.DiGraph()
+    G.add_edges_from(
+        [
+            ("S!A4", "S!A3"),
+            ("S!A4", "S!B1:B2"),
+            ("S!B1:B2", "S!B1"),
+            ("S!B1:B2", "S!B2"),
+            ("S!A3", "S!A2"),
+            ("S!A2", "S!A1"),
+            ("S!B2", "S!A1"),
+        ]
+    )
+    return G
+
+
+def test_depths_and_levels():
+    analysis = analyze_dependencies(chain_graph())
+
+    assert analysis.depths() == {
+        "S!A4": 3,
+        "S!A3": 2,
+        "S!B1:B2": 1,  # ranges take no calculation of their own
+        "S!B1": 0,
+        "S!B2": 1,
+        "S!A2": 1,
+        "S!A1": 0,
+    }
+    assert analysis.max_depth == 3
+    assert analysis.level_widths.tolist() == [2, 2, 1, 1]
+    assert analysis.cycles == []
+
+
+def test_evaluation_order_puts_precedents_first():
+    G = chain_graph()
+    analysis = analyze_dependencies(G)
+    position = {node: i for i, node in enumerate(analysis.evaluation_order())}
+
+    assert len(position) == len(G)
+    assert all(position[v] < position[u] for u, v in G.edges)
+
+
+def test_critical_path():
+    analysis = analyze_dependencies(chain_graph())
+    assert analysis.to_dict()["critical_path"] == ["S!A4", "S!A3", "S!A2", "S!A1"]
+
+
+def test_circular_references():
+    G = chain_graph()
+    G.add_edge("S!A1", "S!A3")  # A3 -> A2 -> A1 -> A3
+    analysis = analyze_dependencies(G)
+
+    assert [sorted(analysis.node_name(i) for i in c) for c in analysis.cycles] == [
+        ["S!A1", "S!A2", "S!A3"]
+    ]
+    depths = analysis.depths()
+    assert depths["S!A1"] == depths["S!A3"] == 0
+    assert depths["S!A4"] == 2
+    assert analysis.to_dict()["cycle_count"] == 1
+
+
+def test_compact_graph_gives_the_same_analysis():
+    G = chain_graph()
+    compact = CompactGraph.from_networkx(G)
+
+    expected = analyze_dependencies(G).depths()
+    assert analyze_dependencies(compact).depths() == expected
+
+
+def test_long_chain():
+    count = 100_000
+    G = nx.DiGraph()
+    G.add_edges_from((f"S!A{i + 1}", f"S!A{i}") for i in range(1, count))
+    analysis = analyze_dependencies(G)
+
+    assert analysis.max_depth == count - 1
+    assert len(analysis.critical_path) == count
+    assert np.all(analysis.level_widths == 1)
+
+
+def test_undirected_graph_is_rejected():
+    with pytest.raises(ValueError):
+        analyze_dependencies(nx.Graph(chain_graph()))
+
+
+def test_empty_graph():
+    analysis = analyze_dependencies(nx.DiGraph())
+    assert analysis.max_depth == -1
+    assert analysis.critical_path == []
+    print_dependency_analysis(analysis)
+
+
+def test_print_dependency_analysis(capsys):
+    print_dependency_analysis(analyze_dependencies(chain_graph()))
+    output = capsys.readouterr().out
+
+    assert "Max dependency depth            3" in output
+    assert "Depth 0                         2" in output
+    assert "S!A4                            3" in output
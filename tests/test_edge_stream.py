@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+
+import pytest
+
+from graphedexcel import edge_stream, graphbuilder
+from graphedexcel.edge_stream import EdgeStreamWriter, print_edge_summary, stream_edges
+from graphedexcel.graphbuilder import build_graph_and_stats
+
+
+WORKBOOK = {
+    "Sheet": [
+        ["1", "2", "=SUM(A1:B1)+A1+A1", "=SUM(A1:B1)"],
+        ["=A1*2", "=C1+A2", "=Other!A1", "=B2+B2"],
+    ],
+    "Other": [["=Sheet!C1"]],
+}
+
+
+def test_stream_matches_graph(workbook_path):
+    stream = io.StringIO()
+    counts, stats = stream_edges(workbook_path, stream)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    graph, graph_stats = build_graph_and_stats(workbook_path, as_directed=True)
+    edges = [(record["source"], record["target"]) for record in records]
+    assert len(edges) == len(set(edges))
+    assert set(edges) == set(graph.edges)
+    assert stats.functions == graph_stats.functions
+    assert {
+        "source": "Sheet!A1:B1",
+        "target": "Sheet!B1",
+        "sheet": "Sheet",
+    }.items() <= (records[3].items())
+
+    assert counts.total == graph.number_of_edges()
+    assert counts.kinds == {"direct": 7, "range": 2, "range-member": 2}
+    assert counts.cross_sheet == 2
+    assert counts.sheets == {"Sheet": 10, "Other": 1}
+
+
+@pytest.mark.parametrize(
+    "workbook_path",
+    [{"Sheet": [[row, f"=A{row}*SUM($A$1:$A$50)"] for row in range(1, 51)]}],
+    indirect=True,
+)
+def test_stream_remembers_ranges_and_templates(workbook_path, monkeypatch):
+    """
+    One builder is used for the whole stream, so a shared range is expanded
+    once and copied formulas are counted like in a graph build.
+    """
+    expanded = []
+    expand_range = graphbuilder.expand_range
+    monkeypatch.setattr(
+        graphbuilder,
+        "expand_range",
+        lambda reference: expanded.append(reference) or expand_range(reference),
+    )
+
+    counts, stats = stream_edges(workbook_path, io.StringIO())
+    _, graph_stats = build_graph_and_stats(workbook_path)
+
+    assert counts.kinds == {"direct": 50, "range": 50, "range-member": 50}
+    assert expanded == ["A1:A50", "A1:A50"]  # once by the stream, once by the build
+    assert stats.template_count == graph_stats.template_count == 1
+    assert stats.templates == graph_stats.templates
+
+
+def test_stream_csv(workbook_path):
+    stream = io.StringIO()
+    counts, _ = stream_edges(workbook_path, stream, format="csv", expand_ranges=False)
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+
+    assert len(rows) == counts.total
+    assert {
+        "source": "Sheet!D1",
+        "target": "Sheet!A1:B1",
+        "sheet": "Sheet",
+        "kind": "range",
+    } in rows
+    assert counts.kinds["range-member"] == 0  # ranges that are not expanded
+
+
+def test_writer_skips_self_loops_and_repeated_ranges(monkeypatch):
+    monkeypatch.setattr(edge_stream, "_EXPANDED_RANGES_SIZE", 1)
+    stream = io.StringIO()
+    writer = EdgeStreamWriter(stream)
+    writer.add_edge("S!A1", "S!A1")
+    writer.add_edge("S!A1", "T!A1")
+    writer.add_edge("S!A1", "T!A1")
+    assert writer.counts.cross_sheet == 1
+    for range_node in ["S!B1:B2", "S!B1:B2", "S!C1:C2", "S!B1:B2"]:
+        writer.add_edge(range_node, "S!" + range_node[2:4])
+
+    # the cells of S!B1:B2 are written again after it was forgotten
+    assert writer.counts.kinds == {"direct": 1, "range": 0, "range-member": 3}
+    assert writer.counts.total == len(stream.getvalue().splitlines())
+
+    with pytest.raises(ValueError):
+        EdgeStreamWriter(stream, format="xml")
+
+
+def test_print_edge_summary(workbook_path, capsys):
+    counts, stats = stream_edges(workbook_path, io.StringIO())
+    print_edge_summary(counts, stats)
+    output = capsys.readouterr().out
+    assert "Dependency count               11" in output
+    assert "Range member edges              2" in output
+    assert "SUM                             2" in output
@@ -1,5 +1,5 @@
 import pytest
-from graphedexcel.excel_parser import extract_references
+from graphedexcel.excel_parser import extract_references, range_bounds, tokenize_formula
 
 
 # Helper function to assert references
@@ -144,3 +144,66 @@ def test_mixed_references():
         "Sheet2!B3": "Sheet2!A1:B3",
     }
     assert_references(formula, expected_direct, expected_range, expected_deps)
+
+
+# Test that ranges are not expanded when expand_ranges is False
+def test_ranges_not_expanded():
+    """
+    Test that ranges are kept as range references only when not expanded.
+    """
+    direct_references, range_references, deps = extract_references(
+        "=SUM(Sheet2!A1:B3, A5)", expand_ranges=False
+    )
+    assert direct_references == ["A5"]
+    assert range_references == ["Sheet2!A1:B3"]
+    assert deps == {}
+
+
+def test_range_bounds():
+    """
+    Test splitting range references into sheet name and bounds.
+    """
+    assert range_bounds("A1:B3") == (None, (1, 1, 2, 3))
+    assert range_bounds("Sheet2!B2:C10") == ("Sheet2", (2, 2, 3, 10))
+
+
+@pytest.mark.parametrize(
+    "formula, expected_references",
+    [
+        # Functions with digits in their names are not cell references
+        ("=LOG10(A1)+ATAN2(B1,B2)", ["A1", "B1", "B2"]),
+        # Whole-column and whole-row references
+        ("=SUM(A:A)+SUM(Sheet2!$B:$C)+SUM(1:3)", ["A:A", "Sheet2!B:C", "1:3"]),
+        # Quoted sheet names
+        ("='My Sheet'!C5+'O''Brien'!A1:A2", ["'My Sheet'!C5", "'O''Brien'!A1:A2"]),
+        # Nothing inside string literals
+        ('=IF(A1>0,"see B2","C3:C4")', ["A1"]),
+        # Lowercase references are normalized
+        ("=a1+Sheet1!b2", ["A1", "Sheet1!B2"]),
+    ],
+)
+def test_tokenize_references(formula, expected_references):
+    """
+    Test that the lexer finds references and nothing else.
+    """
+    assert tokenize_formula(formula).references == expected_references
+
+
+def test_tokenize_functions_names_and_tables():
+    """
+    Test that functions, defined names and structured references are found.
+    """
+    tokens = tokenize_formula(
+        "=SUM(Sales[Amount])*TaxRate+_xlfn.XLOOKUP(A1,Data!Keys,[@Value])+TRUE"
+    )
+    assert tokens.references == ["A1"]
+    assert tokens.functions == ["SUM", "XLOOKUP"]
+    assert tokens.names == ["TaxRate", "Data!Keys"]
+    assert tokens.table_references == ["Sales[Amount]", "[@Value]"]
+
+
+def test_unbounded_ranges_are_not_expanded():
+    """
+    Test that whole-column ranges are returned as ranges, but never expanded.
+    """
+    assert_references("=SUM(A:A)+B1", ["B1"], ["A:A"], {})
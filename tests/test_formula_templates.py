@@ -0,0 +1,96 @@
+from openpyxl.formula.translate import Translator
+import pytest
+
+from graphedexcel.build_stats import SheetStats
+from graphedexcel.excel_parser import tokenize_formula
+from graphedexcel.formula_templates import FormulaTemplates, SharedFormula, r1c1_formula
+
+FORMULAS = [
+    "=B{row}*C{row}",
+    "=SUM(Data!A{row}:A{end})+$B$1",
+    '=IF(A{row}>10,"x{row}",LOG10(B{row}))',
+    "='Sheet 2'!c{row}+MYNAME1+Table1[Col]",
+    "=VLOOKUP(A{row},$F$1:$G$100,2,FALSE)",
+    "=SUM(A:A)+SUM({row}:{end})",
+    "=$A${row}*1.5E3+{row}",
+    "=1+2",
+]
+
+
+@pytest.mark.parametrize("formula", FORMULAS)
+def test_tokenize_matches_tokenize_formula(formula):
+    templates = FormulaTemplates(maxsize=2)
+    for row in range(1, 30):
+        copy = formula.format(row=row, end=row + row % 3)
+        assert templates.tokenize(copy, f"D{row}") == tokenize_formula(copy)
+
+
+def test_copies_are_counted_by_r1c1_form():
+    templates = FormulaTemplates()
+    for row in range(2, 12):
+        templates.tokenize(f"=B{row}*C{row}+$A$1", f"D{row}")
+        templates.tokenize(f"=B{row}*C{row}+$A$1", f"E{row}")
+    templates.tokenize("=B2*C3", "D2")
+
+    assert templates.pop_counts() == {
+        "=RC[-2]*RC[-1]+R1C1": 10,
+        "=RC[-3]*RC[-2]+R1C1": 10,
+        "=RC[-2]*R[1]C[-1]": 1,
+    }
+    assert templates.pop_counts() == {}
+
+
+def test_absolute_rows_are_part_of_the_template():
+    templates = FormulaTemplates()
+    templates.tokenize("=B2*$A$1", "D2")
+    templates.tokenize("=B3*$A$2", "D3")
+    templates.tokenize("=B4*$A$1", "D4")
+    templates.tokenize("=B2*$A$1", "E2")
+
+    assert templates.pop_counts() == {
+        "=RC[-2]*R1C1": 2,
+        "=RC[-2]*R2C1": 1,
+        "=RC[-3]*R1C1": 1,
+    }
+
+
+def test_constants_are_part_of_the_template():
+    templates = FormulaTemplates()
+    for row, factor in [(1, 2), (2, 3), (3, 2), (4, 12)]:
+        templates.tokenize(f"=A{row}*{factor}", f"B{row}")
+
+    assert templates.pop_counts() == {"=RC[-1]*2": 2, "=RC[-1]*3": 1, "=RC[-1]*12": 1}
+
+
+def test_r1c1_formula():
+    assert r1c1_formula("=B2*C2+$A$1", "D2") == "=RC[-2]*RC[-1]+R1C1"
+    assert (
+        r1c1_formula("=SUM(A:A)+SUM(1:3)", "C2") == "=SUM(C[-2]:C[-2])+SUM(R[-1]:R[1])"
+    )
+    assert r1c1_formula('=Data!$B4&"A1"', "B2") == '=Data!R[2]C2&"A1"'
+
+
+def test_record_templates():
+    stats = SheetStats()
+    stats.record_templates({f"=R[{i}]C": i for i in range(1, 21)})
+
+    assert stats.template_count == 20
+    assert list(stats.templates) == [f"=R[{i}]C" for i in range(20, 10, -1)]
+
+
+@pytest.mark.parametrize(
+    "formula",
+    [
+        "=B2*C2",
+        "=SUM($A$1:A2)+Sheet2!b$3",
+        '=IF(A2>"B3",LOG10(C2),MYNAME1)',
+        "=SUM(A:A)+SUM(2:3)+$B:B",
+        "='My Sheet'!$C2*Table1[Col]",
+        "=1+2",
+    ],
+)
+def test_shared_formula_matches_translator(formula):
+    shared = SharedFormula(formula, "D2")
+    for coordinate in ["D2", "D3", "F10", "E1", "AZ500"]:
+        expected = Translator(formula, "D2").translate_formula(coordinate)
+        assert shared.translate(coordinate) == expected
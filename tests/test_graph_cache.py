@@ -0,0 +1,113 @@
+import os
+import time
+
+import networkx as nx
+
+from graphedexcel import graph_cache
+from graphedexcel.build_stats import BuildStats
+from graphedexcel.graph_cache import (
+    DiskCache,
+    cached_build_graph_and_stats,
+    deserialize_graph,
+    graph_cache_key,
+    serialize_graph,
+)
+
+
+def test_disk_cache_roundtrip(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    assert cache.get("missing") is None
+
+    cache.put("key", b"data")
+    assert cache.get("key") == b"data"
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    # make "a" older than "b", then read it so it becomes the most recently used
+    old = time.time() - 100
+    os.utime(tmp_path / "a", (old, old))
+    os.utime(tmp_path / "b", (old + 1, old + 1))
+    assert cache.get("a") is not None
+
+    cache.put("c", b"c" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_serialize_graph_roundtrip():
+    graph = nx.DiGraph()
+    graph.add_node("Sheet1!A1", sheet="Sheet1")
+    graph.add_node("Sheet2!B1:B3", sheet="Sheet2")
+    graph.add_edge("Sheet1!A1", "Sheet2!B1:B3")
+
+    loaded, functions = deserialize_graph(
+        serialize_graph(graph, BuildStats({"SUM": 2}))
+    )
+
+    assert loaded.is_directed()
+    assert nx.utils.graphs_equal(graph, loaded)
+    assert functions.functions == {"SUM": 2}
+
+
+def test_cache_key_depends_on_options_and_content(workbook_path):
+    key = graph_cache_key(workbook_path)
+    assert key == graph_cache_key(workbook_path)
+    assert key != graph_cache_key(workbook_path, as_directed=True)
+    assert key != graph_cache_key(workbook_path, expand_ranges=False)
+    assert key != graph_cache_key(workbook_path, reader="xml")
+
+    with open(workbook_path, "ab") as file:
+        file.write(b"\0")
+    assert key != graph_cache_key(workbook_path)
+
+
+def test_cache_key_depends_on_cache_format(workbook_path, monkeypatch):
+    key = graph_cache_key(workbook_path)
+    monkeypatch.setattr(graph_cache, "CACHE_FORMAT", graph_cache.CACHE_FORMAT + 1)
+    assert key != graph_cache_key(workbook_path)
+
+
+def test_cached_build_skips_parsing(workbook_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    graph, functions = cached_build_graph_and_stats(workbook_path, cache_dir)
+    expected_functions = functions.functions
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the workbook should not be parsed again")
+
+    monkeypatch.setattr(graph_cache, "build_graph_and_stats", fail)
+    cached_graph, cached_functions = cached_build_graph_and_stats(
+        workbook_path, cache_dir
+    )
+
+    assert nx.utils.graphs_equal(graph, cached_graph)
+    assert cached_functions.functions == expected_functions == {"SUM": 1}
+
+
+def test_cached_condensed_build_with_compact(workbook_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    options = {"compact": True, "condensed": True, "as_directed": True}
+    graph, _ = cached_build_graph_and_stats(workbook_path, cache_dir, **options)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the workbook should not be parsed again")
+
+    monkeypatch.setattr(graph_cache, "build_graph_and_stats", fail)
+    cached_graph, _ = cached_build_graph_and_stats(workbook_path, cache_dir, **options)
+
+    assert nx.utils.graphs_equal(graph, cached_graph)
+    assert dict(cached_graph.nodes(data=True)) == dict(graph.nodes(data=True))
+
+
+def test_unreadable_cache_entry_is_rebuilt(workbook_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    DiskCache(cache_dir).put(graph_cache_key(workbook_path), b"not gzip")
+
+    graph, _ = cached_build_graph_and_stats(workbook_path, cache_dir)
+
+    assert graph.number_of_nodes() == 6
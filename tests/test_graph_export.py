@@ -0,0 +1,79 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from graphedexcel.build_stats import BuildStats
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.graph_export import export_graph, import_graph, load_npz
+from graphedexcel.graphbuilder import build_graph_and_stats
+
+
+WORKBOOK = {
+    "Sheet": [["1", "2", "=SUM(A1:B1)"], ["=A1*2", "=C1+A2"]],
+    "Other": [["=Sheet!C1", "=SUM(Sheet!A:A)"]],
+}
+
+
+@pytest.mark.parametrize("as_directed", [True, False])
+def test_export_import_roundtrip(workbook_path, tmp_path, as_directed):
+    graph, stats = build_graph_and_stats(
+        workbook_path, as_directed=as_directed, expand_ranges=False
+    )
+    path = str(tmp_path / "graph.npz")
+    export_graph(graph, stats, path)
+
+    loaded, loaded_stats = import_graph(path)
+    assert loaded.is_directed() == as_directed
+    assert set(loaded.nodes(data="sheet")) == set(graph.nodes(data="sheet"))
+    assert nx.utils.edges_equal(loaded.edges, graph.edges)
+    assert loaded_stats == stats
+
+
+def test_import_compact_is_memory_mapped(workbook_path, tmp_path):
+    graph, stats = build_graph_and_stats(workbook_path, as_directed=True, compact=True)
+    path = str(tmp_path / "graph.npz")
+    export_graph(graph, stats, path)
+
+    loaded, _ = import_graph(path, compact=True)
+    assert isinstance(loaded, CompactGraph)
+    assert isinstance(loaded.src, np.memmap)
+    assert list(loaded.node_names()) == list(graph.node_names())
+    assert loaded.src.tolist() == graph.src.tolist()
+    assert loaded.to_networkx().edges == graph.to_networkx().edges
+
+    read, _ = import_graph(path, compact=True, mmap=False)
+    assert not isinstance(read.src, np.memmap)
+    assert read.dst.tolist() == graph.dst.tolist()
+
+
+def test_export_import_condensed(workbook_path, tmp_path):
+    graph, stats = build_graph_and_stats(
+        workbook_path, as_directed=True, condensed=True
+    )
+    path = str(tmp_path / "graph.npz")
+    export_graph(graph, stats, path)
+
+    loaded, _ = import_graph(path)
+    assert loaded.graph["condensed"]
+    assert dict(loaded.nodes(data="internal")) == dict(graph.nodes(data="internal"))
+    assert set(loaded.edges(data="weight")) == set(graph.edges(data="weight"))
+
+
+def test_export_empty_graph(tmp_path):
+    path = str(tmp_path / "graph.npz")
+    export_graph(nx.DiGraph(), BuildStats(), path)
+    loaded, _ = import_graph(path)
+    assert loaded.number_of_nodes() == 0
+
+
+def test_import_invalid_files(tmp_path):
+    not_zip = tmp_path / "graph.npz"
+    not_zip.write_bytes(b"not a graph")
+    with pytest.raises(ValueError):
+        import_graph(str(not_zip))
+
+    other = str(tmp_path / "other.npz")
+    np.savez(other, values=np.arange(3))
+    assert load_npz(other)["values"].tolist() == [0, 1, 2]
+    with pytest.raises(ValueError):
+        import_graph(other)
@@ -1,5 +1,17 @@
-from graphedexcel.graph_summarizer import print_summary
+from collections import Counter
+
+from openpyxl import Workbook
 import networkx as nx
+import numpy as np
+
+from graphedexcel.build_stats import BuildStats, SheetStats
+from graphedexcel.graph_summarizer import (
+    print_summary,
+    summarize,
+    summarize_graph,
+    top_k,
+)
+from graphedexcel.graphbuilder import build_graph_and_stats
 
 
 def test_graph_with_functionsstats():
@@ -31,3 +43,69 @@ def test_empty_functionsdict():
 
     print_summary(G, {})
     assert True
+
+
+def test_summary_with_most_copied_formulas(capsys):
+    graph = nx.DiGraph()
+    graph.add_edge("Sheet1!C1", "Sheet1!A1")
+    stats = BuildStats()
+    sheet_stats = SheetStats()
+    sheet_stats.record_templates({"=RC[-2]": 3, "=R1C1": 1})
+    stats.add_sheet("Sheet1", sheet_stats)
+
+    print_summary(graph, stats)
+    summary = summarize_graph(graph, stats)
+
+    assert "Most copied formulas" in capsys.readouterr().out
+    assert summary["template_count"] == 2
+    assert summary["templates"] == {"=RC[-2]": 3, "=R1C1": 1}
+
+
+def test_top_k_breaks_ties_by_node_order():
+    values = np.array([3, 1, 5, 3, 3, 0, 5])
+
+    assert top_k(values, 3).tolist() == [2, 6, 0]
+    assert top_k(values, 10).tolist() == [2, 6, 0, 3, 4, 1, 5]
+    assert top_k(values, 0).tolist() == []
+
+
+def test_summarize_matches_networkx():
+    graph = nx.gnm_random_graph(200, 300, seed=1, directed=True)
+    graph = nx.relabel_nodes(graph, {i: f"Sheet{i % 3}!A{i + 1}" for i in graph})
+
+    summary = summarize(graph, {"SUM": 2})
+
+    degrees = dict(graph.degree())
+    assert summary.nodes == 200
+    assert summary.edges == 300
+    assert summary.most_connected == Counter(degrees).most_common(10)
+    assert summary.most_in_degree == Counter(dict(graph.in_degree())).most_common(10)
+    assert summary.degree_distribution == dict(
+        sorted(Counter(degrees.values()).items())
+    )
+    assert summary.max_degree == max(degrees.values())
+    components = sorted(map(len, nx.weakly_connected_components(graph)), reverse=True)
+    assert summary.component_count == len(components)
+    assert summary.largest_components == components[:10]
+    assert sum(sheet["nodes"] for sheet in summary.sheets.values()) == 200
+    assert summary.cross_sheet_edges == sum(
+        u.split("!")[0] != v.split("!")[0] for u, v in graph.edges
+    )
+
+
+def test_summarize_compact_graph_like_networkx(tmp_path):
+    file_path = tmp_path / "test.xlsx"
+    wb = Workbook()
+    wb.active.append([1, 2, "=SUM(A1:B1)", "=C1*2"])
+    wb.create_sheet("Other").append(["=Sheet!D1+Sheet!A1"])
+    wb.save(file_path)
+    graph, stats = build_graph_and_stats(str(file_path), compact=True)
+
+    summary = summarize(graph, stats).to_dict()
+
+    assert summary == summarize(graph.to_networkx(), stats).to_dict()
+    assert summary["sheets"] == {
+        "Sheet": {"nodes": 5, "edges": 6},
+        "Other": {"nodes": 1, "edges": 2},
+    }
+    assert summary["cross_sheet_edges"] == 2
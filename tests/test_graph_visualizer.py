@@ -6,9 +6,12 @@ from graphedexcel.graph_visualizer import (
     load_json_config,
     get_graph_default_settings,
     get_node_colors_and_legend,
+    rasterize_edges,
     visualize_dependency_graph,
 )
+from graphedexcel.compact_graph import CompactGraph
 import networkx as nx
+import numpy as np
 
 
 def test_merge_configs():
@@ -123,7 +126,7 @@ def test_invalid_json_in_config_will_not_break(tmp_path, caplog):
 def test_all_layouts():
     G = create_two_node_graph()
 
-    for layout in ["spring", "kamada_kawai", "circular", "shell", "spectral"]:
+    for layout in ["spring", "kamada_kawai", "circular", "shell", "spectral", "grid"]:
         file_path = f"{layout}.png"
         visualize_dependency_graph(G, layout=layout, output_path=file_path)
         try:
@@ -158,3 +161,53 @@ def create_two_node_graph():
     G.add_node(2, sheet="Sheet2")
     G.add_edge(1, 2)
     return G
+
+
+def test_fast_renderer(tmp_path):
+    G = nx.path_graph(20)
+    nx.set_node_attributes(G, "Sheet1", "sheet")
+    file_path = tmp_path / "fast.png"
+
+    visualize_dependency_graph(G, str(file_path), layout="circular", renderer="fast")
+    assert file_path.exists()
+
+
+def test_fast_renderer_rasterizes_large_graphs(tmp_path):
+    G = nx.grid_2d_graph(10, 10)
+    nx.set_node_attributes(G, "Sheet1", "sheet")
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"raster_threshold": 10, "raster_size": 64}))
+    file_path = tmp_path / "raster.png"
+
+    visualize_dependency_graph(
+        G, str(file_path), config_path=str(config_file), renderer="fast"
+    )
+    assert file_path.exists()
+
+
+def test_compact_graph_is_drawn_from_arrays(tmp_path, monkeypatch):
+    graph = CompactGraph()
+    for row in range(1, 30):
+        graph.add_edge(f"Sheet1!B{row}", f"Sheet2!A{row}")
+    graph.add_edge("Sheet1!B1", "Sheet1!A1:A9")
+    graph.finalize()
+
+    def to_networkx():
+        raise AssertionError("converted to networkx")
+
+    monkeypatch.setattr(graph, "to_networkx", to_networkx)
+    file_path = tmp_path / "compact.png"
+    visualize_dependency_graph(graph, str(file_path), layout="grid", renderer="fast")
+    assert file_path.exists()
+
+
+def test_rasterize_edges():
+    start = np.array([[0.0, 0.0], [0.0, 0.0]])
+    end = np.array([[1.0, 0.0], [1.0, 1.0]])
+    density = rasterize_edges(start, end, [0, 1, 0, 1], size=11)
+
+    assert density.shape == (11, 11)
+    # the horizontal edge covers the bottom row, the diagonal edge the diagonal
+    assert list(density[0]) == [2] + [1] * 10
+    assert all(density[i, i] == 1 for i in range(1, 11))
+    assert density.sum() == 22
@@ -1,29 +1,23 @@
-from openpyxl import Workbook
 import pytest
 
 # from unittest import mock
 import networkx as nx
 
 # Import the functions and variables from your module
+from graphedexcel import graphbuilder
 from graphedexcel.graphbuilder import (
+    FormulaGraphBuilder,
     sanitize_sheetname,
     sanitize_range,
     stat_functions,
     add_node,
     build_graph_and_stats,
-    functions_dict,
+    memo_sizes,
 )
+from graphedexcel.formula_templates import TEMPLATE_CACHE_SIZE
 from graphedexcel.graphbuilder import sanitize_nodename
 
 
-@pytest.fixture(autouse=True)
-def reset_functions_dict():
-    """
-    Fixture to reset the global functions_dict before each test.
-    """
-    functions_dict.clear()
-
-
 def test_sanitize_nodename():
     """
     Test the sanitize node name
@@ -58,20 +52,20 @@ def test_sanitize_range():
 def test_stat_functions():
     """
     Test the stat_functions function to ensure it correctly
-    parses function names and updates functions_dict.
+    parses function names and updates the given counts.
     """
-    stat_functions("=SUM(A1:A10)")
-    assert functions_dict.get("SUM") == 1
+    counts = stat_functions("=SUM(A1:A10)")
+    assert counts.get("SUM") == 1
 
-    stat_functions("=AVERAGE(B1:B5)")
-    assert functions_dict.get("AVERAGE") == 1
+    stat_functions("=AVERAGE(B1:B5)", counts)
+    assert counts.get("AVERAGE") == 1
 
-    stat_functions("=SUM(A1:A10) + SUM(B1:B10)")
-    assert functions_dict.get("SUM") == 3
+    stat_functions("=SUM(A1:A10) + SUM(B1:B10)", counts)
+    assert counts.get("SUM") == 3
 
-    stat_functions("=IF(C1 > 0, SUM(D1:D10), 0)")
-    assert functions_dict.get("IF") == 1
-    assert functions_dict.get("SUM") == 4  # SUM incremented again
+    stat_functions("=IF(C1 > 0, SUM(D1:D10), 0)", counts)
+    assert counts.get("IF") == 1
+    assert counts.get("SUM") == 4  # SUM incremented again
 
 
 def test_add_node():
@@ -100,21 +94,6 @@ def test_add_node():
     assert graph.nodes["Sheet3!C1"]["sheet"] == "Sheet3"
 
 
-@pytest.fixture
-def create_excel_file(tmp_path):
-    def _create_excel_file(data):
-        file_path = tmp_path / "test.xlsx"
-        wb = Workbook()
-        for sheet_name, sheet_data in data.items():
-            ws = wb.create_sheet(title=sheet_name)
-            for row in sheet_data:
-                ws.append(row)
-        wb.save(file_path)
-        return file_path
-
-    return _create_excel_file
-
-
 def test_build_graph_with_simple_formulas(create_excel_file):
     data = {
         "Sheet1": [
@@ -124,12 +103,12 @@ def test_build_graph_with_simple_formulas(create_excel_file):
         ]
     }
     file_path = create_excel_file(data)
-    graph, functions_dict = build_graph_and_stats(file_path)
+    graph, stats = build_graph_and_stats(file_path)
 
     assert isinstance(graph, nx.Graph)
     assert len(graph.nodes) == 12
     assert len(graph.edges) == 8
-    assert functions_dict == {}
+    assert stats.functions == {}
 
 
 def test_build_graph_with_range_references(create_excel_file):
@@ -139,18 +118,18 @@ def test_build_graph_with_range_references(create_excel_file):
         ]
     }
     file_path = create_excel_file(data)
-    graph, functions_dict = build_graph_and_stats(file_path)
+    graph, stats = build_graph_and_stats(file_path)
 
     assert isinstance(graph, nx.Graph)
     assert len(graph.nodes) == 8
     assert len(graph.edges) == 6
-    assert functions_dict == {"SUM": 2}
+    assert stats.functions == {"SUM": 2}
 
 
 def test_self_loops_are_removed(create_excel_file):
     data = {"sheet1": [["=A1", "=B1"]]}
     file_path = create_excel_file(data)
-    graph, functions_dict = build_graph_and_stats(file_path)
+    graph, stats = build_graph_and_stats(file_path)
     selfloops = nx.selfloop_edges(graph)
     for loop in selfloops:
         print(loop)
@@ -167,12 +146,12 @@ def test_directed_graph(create_excel_file):
         ]
     }
     file_path = create_excel_file(data)
-    graph, functions_dict = build_graph_and_stats(file_path, as_directed=True)
+    graph, stats = build_graph_and_stats(file_path, as_directed=True)
 
     assert isinstance(graph, nx.DiGraph)
     assert len(graph.nodes) == 2
     assert len(graph.edges) == 2
-    assert functions_dict == {}
+    assert stats.functions == {}
 
 
 def test_undirected_graph(create_excel_file):
@@ -182,9 +161,175 @@ def test_undirected_graph(create_excel_file):
         ]
     }
     file_path = create_excel_file(data)
-    graph, functions_dict = build_graph_and_stats(file_path, as_directed=False)
+    graph, stats = build_graph_and_stats(file_path, as_directed=False)
 
     assert isinstance(graph, nx.Graph)
     assert len(graph.nodes) == 2
     assert len(graph.edges) == 1
-    assert functions_dict == {}
+    assert stats.functions == {}
+
+
+def test_compact_ranges_only_link_existing_cells(create_excel_file):
+    data = {
+        "Sheet1": [
+            ["=SUM(A2:A100000)", "=A3"],
+        ]
+    }
+    file_path = create_excel_file(data)
+    graph, stats = build_graph_and_stats(
+        file_path, as_directed=True, expand_ranges=False
+    )
+
+    # the range is a single node, linked to the only cell of it in the graph
+    assert set(graph.nodes) == {
+        "Sheet1!A1",
+        "Sheet1!B1",
+        "Sheet1!A3",
+        "Sheet1!A2:A100000",
+    }
+    assert set(graph.edges) == {
+        ("Sheet1!A1", "Sheet1!A2:A100000"),
+        ("Sheet1!B1", "Sheet1!A3"),
+        ("Sheet1!A2:A100000", "Sheet1!A3"),
+    }
+    assert stats.functions == {"SUM": 1}
+
+
+def test_compact_ranges_across_sheets(create_excel_file):
+    data = {
+        "Sheet1": [["=SUM(Sheet2!A1:B2)"]],
+        "Sheet2": [["=Sheet1!A1", "=C3"]],
+    }
+    file_path = create_excel_file(data)
+    graph, _ = build_graph_and_stats(file_path, as_directed=True, expand_ranges=False)
+
+    assert graph.has_edge("Sheet2!A1:B2", "Sheet2!A1")
+    assert graph.has_edge("Sheet2!A1:B2", "Sheet2!B1")
+    assert not graph.has_node("Sheet2!A2")
+
+
+def test_whole_column_ranges_link_existing_cells(create_excel_file):
+    data = {
+        "Sheet1": [
+            ["=SUM(B:B)", "=C1"],
+            [None, "=C2"],
+        ]
+    }
+    file_path = create_excel_file(data)
+    graph, stats = build_graph_and_stats(file_path, as_directed=True)
+
+    assert graph.has_edge("Sheet1!A1", "Sheet1!B:B")
+    assert graph.has_edge("Sheet1!B:B", "Sheet1!B1")
+    assert graph.has_edge("Sheet1!B:B", "Sheet1!B2")
+    assert not graph.has_node("Sheet1!B3")
+    assert stats.functions == {"SUM": 1}
+
+
+@pytest.mark.parametrize(
+    "as_directed, expand_ranges", [(True, True), (False, True), (True, False)]
+)
+def test_parallel_build_is_identical_to_serial(
+    create_excel_file, as_directed, expand_ranges
+):
+    data = {
+        "Inputs": [["1", "2", "3"], ["=A1*2", "=SUM(A1:C1)", "=Calc!A1"]],
+        "Calc": [["=Inputs!A2+Inputs!B2", "=SUM(Inputs!A1:B2)"], ["=A1+B1"]],
+        "Output": [["=MAX(Calc!A1:B2)", "=Inputs!C2", "=LOG10(A1)"]],
+    }
+    file_path = create_excel_file(data)
+
+    serial_graph, stats = build_graph_and_stats(
+        file_path, as_directed=as_directed, expand_ranges=expand_ranges
+    )
+    serial_stats = stats.functions
+
+    parallel_graph, parallel_stats = build_graph_and_stats(
+        file_path, as_directed=as_directed, expand_ranges=expand_ranges, workers=3
+    )
+
+    assert nx.utils.graphs_equal(serial_graph, parallel_graph)
+    assert list(serial_graph.nodes) == list(parallel_graph.nodes)
+    assert parallel_stats.functions == serial_stats
+    assert parallel_stats.sheets.keys() == stats.sheets.keys()
+    for name, sheet_stats in stats.sheets.items():
+        assert parallel_stats.sheets[name].formulas == sheet_stats.formulas
+        assert parallel_stats.sheets[name].references == sheet_stats.references
+    assert serial_stats == {"SUM": 2, "MAX": 1, "LOG10": 1}
+
+
+def test_builder_links_each_range_once(monkeypatch):
+    """
+    The cells of a range are linked to it when it is first used,
+    also when ranges of a formula overlap.
+    """
+    graph = nx.DiGraph()
+    added = []
+    add_edges_from = graph.add_edges_from
+    monkeypatch.setattr(
+        graph,
+        "add_edges_from",
+        lambda edges: added.extend(edges) or add_edges_from(edges),
+    )
+    builder = FormulaGraphBuilder(graph)
+    builder.add_formula("B1", "=SUM(A1:A3)+SUM(A2:A4)", "Sheet")
+    builder.add_formula("B2", "=SUM(A1:A3)*2+SUM('Sheet'!A1:A3)", "Sheet")
+    builder.add_formula("B3", "=SUM(A:A)", "Sheet")
+    builder.flush()
+
+    members = [(u, v) for u, v in added if u.endswith(("A1:A3", "A2:A4"))]
+    assert members == [
+        ("Sheet!A1:A3", "Sheet!A1"),
+        ("Sheet!A1:A3", "Sheet!A2"),
+        ("Sheet!A1:A3", "Sheet!A3"),
+        ("Sheet!A2:A4", "Sheet!A2"),
+        ("Sheet!A2:A4", "Sheet!A3"),
+        ("Sheet!A2:A4", "Sheet!A4"),
+    ]
+    assert ("Sheet!B2", "Sheet!A1:A3") in added
+    assert not graph.has_edge("Sheet!A:A", "Sheet!A1")  # linked when finalized
+    assert dict(graph.nodes(data="sheet"))["Sheet!A4"] == "Sheet"
+
+
+def test_builder_memo_is_bounded():
+    graph = nx.DiGraph()
+    builder = FormulaGraphBuilder(graph, memo_size=2)
+    for row in range(1, 6):
+        builder.add_formula(f"B{row}", f"=A{row}+SUM(C1:C2)", "Sheet")
+    builder.flush()
+
+    assert len(builder._node_names) <= 2
+    assert graph.number_of_edges() == 5 + 5 + 2
+
+
+def test_memo_sizes_follow_max_memory():
+    assert memo_sizes() == (graphbuilder._MEMO_SIZE, TEMPLATE_CACHE_SIZE)
+    assert memo_sizes(1024) == (1024, 16)
+    memo_size, template_cache_size = memo_sizes(64 * 1024**2)
+    assert 1024 < memo_size < graphbuilder._MEMO_SIZE
+    assert 16 < template_cache_size < TEMPLATE_CACHE_SIZE
+    assert memo_sizes(1024**4) == memo_sizes()
+
+
+def test_builder_skips_self_loops_and_lists_unlinked_cells():
+    graph = nx.Graph()
+    builder = FormulaGraphBuilder(graph)
+    builder.add_formula("A1", "=A1+Sheet!A1", "Sheet")
+    builder.add_formula("B1", "=1+2", "Sheet")
+    builder.add_formula("C1", "=C1+D1", "Sheet")
+    builder.add_formula("E1", "=SUM(B:B)", "Sheet")
+    builder.flush()
+
+    assert nx.number_of_selfloops(graph) == 0
+    assert list(graph.edges) == [("Sheet!C1", "Sheet!D1"), ("Sheet!E1", "Sheet!B:B")]
+    assert builder.unlinked == ["Sheet!A1", "Sheet!B1"]
+
+    graph = graphbuilder.finalize_graph(graph, unlinked=builder.unlinked)
+    # B1 is linked to the whole-column range, A1 is removed
+    assert list(graph.nodes) == [
+        "Sheet!B1",
+        "Sheet!C1",
+        "Sheet!D1",
+        "Sheet!E1",
+        "Sheet!B:B",
+    ]
+    assert graph.has_edge("Sheet!B:B", "Sheet!B1")
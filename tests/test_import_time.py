@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import textwrap
+
+from openpyxl import Workbook
+
+# Generous budget for importing the CLI, to catch heavy modules sneaking in
+# without making the test flaky on slow machines
+IMPORT_BUDGET_SECONDS = 2.0
+
+HEAVY_MODULES = ("matplotlib", "scipy")
+
+
+def import_times(statement):
+    """
+    The cumulative import time in seconds of every module imported by the
+    statement in a fresh interpreter, from the output of python -X importtime.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+def test_cli_import_time_budget():
+    times = import_times("import graphedexcel.cli")
+
+    assert times["graphedexcel.cli"] < IMPORT_BUDGET_SECONDS
+    heavy = [module for module in times if module.split(".")[0] in HEAVY_MODULES]
+    assert heavy == []
+
+
+def test_no_visualize_run_does_not_import_heavy_modules(tmp_path):
+    file_path = tmp_path / "test.xlsx"
+    wb = Workbook()
+    wb.active.append(["1", "2", "=SUM(A1:B1)"])
+    wb.save(file_path)
+
+    script = textwrap.dedent(
+        f"""
+        import sys
+        from graphedexcel.cli import main
+
+        sys.argv = ["graphedexcel", {str(file_path)!r}, "-n", "--no-cache"]
+        try:
+            main()
+        except SystemExit:
+            pass
+        heavy = [name for name in sys.modules if name.split(".")[0] in {HEAVY_MODULES}]
+        print(heavy)
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip().splitlines()[-1] == "[]"
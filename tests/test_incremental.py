@@ -0,0 +1,126 @@
+from openpyxl import load_workbook
+import networkx as nx
+
+from graphedexcel import incremental
+from graphedexcel.graphbuilder import build_graph_and_stats
+from graphedexcel.incremental import incremental_build_graph_and_stats, print_changes
+
+
+WORKBOOK = {
+    "Inputs": [["1", "2", "=A1+B1"]],
+    "Calc": [["=SUM(Inputs!A1:C1)", "=A1*2"]],
+}
+
+
+def edit_sheet(file_path, sheet_name, coordinate, value):
+    wb = load_workbook(file_path)
+    wb[sheet_name][coordinate] = value
+    wb.save(file_path)
+
+
+def test_first_run_parses_all_sheets(workbook_path, tmp_path):
+    graph, functions, changes = incremental_build_graph_and_stats(
+        workbook_path, str(tmp_path / "state.json.gz")
+    )
+
+    expected_graph, expected_functions = build_graph_and_stats(workbook_path)
+    assert nx.utils.graphs_equal(graph, expected_graph)
+    assert functions.functions == expected_functions.functions
+    assert changes.added_sheets == ["Inputs", "Calc"]
+    assert changes.unchanged_sheets == []
+
+
+def test_only_changed_sheets_are_parsed(workbook_path, tmp_path, monkeypatch):
+    state_path = str(tmp_path / "state.json.gz")
+    incremental_build_graph_and_stats(workbook_path, state_path, as_directed=True)
+
+    parsed = []
+    sheet_graph_from_cells = incremental.sheet_graph_from_cells
+
+    def tracking_sheet_graph_from_cells(sheet_name, cells, expand_ranges):
+        parsed.append(sheet_name)
+        return sheet_graph_from_cells(sheet_name, cells, expand_ranges)
+
+    monkeypatch.setattr(
+        incremental, "sheet_graph_from_cells", tracking_sheet_graph_from_cells
+    )
+
+    _, _, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path, as_directed=True
+    )
+    assert parsed == []
+    assert changes.unchanged_sheets == ["Inputs", "Calc"]
+    assert changes.nodes_added == changes.edges_removed == 0
+
+    edit_sheet(workbook_path, "Calc", "C1", "=B1+Inputs!A1")
+    graph, functions, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path, as_directed=True
+    )
+
+    assert parsed == ["Calc"]
+    assert changes.changed_sheets == ["Calc"]
+    assert changes.unchanged_sheets == ["Inputs"]
+    assert changes.nodes_added == 1  # Calc!C1
+    assert changes.edges_added == 2
+
+    expected_graph, expected_functions = build_graph_and_stats(
+        workbook_path, as_directed=True
+    )
+    assert nx.utils.graphs_equal(graph, expected_graph)
+    assert functions.functions == expected_functions.functions
+
+
+def test_removed_sheets_are_reported(workbook_path, tmp_path, capsys):
+    state_path = str(tmp_path / "state.json.gz")
+    incremental_build_graph_and_stats(workbook_path, state_path)
+
+    wb = load_workbook(workbook_path)
+    del wb["Calc"]
+    wb.save(workbook_path)
+    graph, functions, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path
+    )
+
+    assert changes.removed_sheets == ["Calc"]
+    assert changes.edges_removed == 5
+    assert functions.functions == {}
+    assert set(graph.nodes) == {"Inputs!A1", "Inputs!B1", "Inputs!C1"}
+
+    print_changes(changes)
+    assert "Removed sheets                  1\n  Calc" in capsys.readouterr().out
+
+
+def test_state_with_other_options_is_ignored(workbook_path, tmp_path):
+    state_path = str(tmp_path / "state.json.gz")
+    incremental_build_graph_and_stats(workbook_path, state_path)
+
+    _, _, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path, expand_ranges=False
+    )
+    assert changes.added_sheets == ["Inputs", "Calc"]
+
+    _, _, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path, expand_ranges=False, reader="xml"
+    )
+    assert changes.added_sheets == ["Inputs", "Calc"]
+    _, _, changes = incremental_build_graph_and_stats(
+        workbook_path, state_path, expand_ranges=False, reader="xml"
+    )
+    assert changes.unchanged_sheets == ["Inputs", "Calc"]
+
+
+def test_state_of_another_cache_format_is_ignored(workbook_path, tmp_path, monkeypatch):
+    state_path = str(tmp_path / "state.json.gz")
+    incremental_build_graph_and_stats(workbook_path, state_path)
+
+    monkeypatch.setattr(incremental, "CACHE_FORMAT", incremental.CACHE_FORMAT + 1)
+    _, _, changes = incremental_build_graph_and_stats(workbook_path, state_path)
+    assert changes.added_sheets == ["Inputs", "Calc"]
+
+
+def test_unreadable_state_is_ignored(workbook_path, tmp_path):
+    state_path = tmp_path / "state.json.gz"
+    state_path.write_bytes(b"garbage")
+
+    _, _, changes = incremental_build_graph_and_stats(workbook_path, str(state_path))
+    assert changes.added_sheets == ["Inputs", "Calc"]
@@ -0,0 +1,148 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.layouts import (
+    WARM_START_ITERATIONS,
+    LayoutCache,
+    compute_layout,
+    graph_structure_hash,
+    grid_layout,
+    grid_positions,
+)
+
+
+def dependency_graph():
+    G = nx.DiGraph()
+    G.add_node("Sheet1!A1", sheet="Sheet1")
+    G.add_node("Sheet1!C5", sheet="Sheet1")
+    G.add_node("Sheet1!A1:C5", sheet="Sheet1")
+    G.add_node("Sheet1!B:B", sheet="Sheet1")
+    G.add_node("Sheet2!A1", sheet="Sheet2")
+    G.add_edge("Sheet1!C5", "Sheet1!A1:C5")
+    G.add_edge("Sheet1!A1:C5", "Sheet1!A1")
+    G.add_edge("Sheet2!A1", "Sheet1!B:B")
+    return G
+
+
+def test_grid_layout_places_cells_by_row_and_column():
+    pos = grid_layout(dependency_graph())
+
+    assert pos["Sheet1!A1"] == pytest.approx([0, 0])
+    assert pos["Sheet1!C5"] == pytest.approx([1, -1])
+    assert pos["Sheet1!A1:C5"] == pytest.approx([0.5, -0.5])
+    # whole columns are clipped to the used rows of the sheet
+    assert pos["Sheet1!B:B"] == pytest.approx([0.5, -0.5])
+    # the second sheet is a block of its own, a single cell at its center
+    assert pos["Sheet2!A1"] == pytest.approx([1.7, -0.5])
+
+
+def test_grid_layout_places_other_nodes_apart():
+    G = dependency_graph()
+    G.add_node("Sheet1!MyName")
+    G.add_node(1)
+    pos = grid_layout(G)
+
+    # in a block after the sheets, stacked in a column
+    assert pos["Sheet1!MyName"] == pytest.approx([0.5, -1.2])
+    assert pos[1] == pytest.approx([0.5, -2.2])
+
+
+def test_grid_layout_of_compact_graph_matches_networkx():
+    G = dependency_graph()
+    compact = CompactGraph.from_networkx(G)
+
+    pos = grid_layout(G)
+    compact_pos = grid_layout(compact)
+    assert compact_pos.keys() == pos.keys()
+    for node, xy in compact_pos.items():
+        assert xy == pytest.approx(pos[node])
+
+
+def test_grid_positions_scales_linearly():
+    count = 200_000
+    sheet = np.arange(count) % 4
+    row = np.arange(count) // 40 + 1
+    col = np.arange(count) % 40 + 1
+
+    xy = grid_positions(sheet, row, col, row, col)
+    assert xy.shape == (count, 2)
+    assert np.isfinite(xy).all()
+
+
+def test_compute_layout_falls_back_to_spring(caplog):
+    G = nx.path_graph(3)
+    pos = compute_layout(G, "nosuchlayout")
+    assert len(pos) == 3
+    assert "Falling back to spring layout" in caplog.text
+
+
+def test_graph_structure_hash_ignores_order_and_attributes():
+    G = dependency_graph()
+    H = nx.DiGraph()
+    H.add_nodes_from(reversed(list(G.nodes)))
+    H.add_edges_from(reversed(list(G.edges)))
+
+    assert graph_structure_hash(H) == graph_structure_hash(G)
+    H.add_edge("Sheet1!A1", "Sheet2!A1")
+    assert graph_structure_hash(H) != graph_structure_hash(G)
+    assert graph_structure_hash(G.to_undirected()) != graph_structure_hash(G)
+
+
+def test_layout_cache_reuses_positions(tmp_path, monkeypatch):
+    G = nx.path_graph([f"Sheet1!A{row}" for row in range(1, 30)])
+    cache = LayoutCache(str(tmp_path))
+    pos = cache.layout(G, "spring", seed=1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("layout computed again")
+
+    monkeypatch.setattr(nx, "spring_layout", fail)
+    cached = LayoutCache(str(tmp_path)).layout(G, "spring", seed=1)
+    assert cached.keys() == pos.keys()
+    for node, xy in cached.items():
+        assert xy == pytest.approx(pos[node])
+
+
+def test_layout_cache_keys_by_layout_and_seed(tmp_path):
+    G = nx.path_graph(10)
+    cache = LayoutCache(str(tmp_path))
+    cache.layout(G, "spring", seed=1)
+    cache.layout(G, "spring", seed=2)
+    cache.layout(G, "spectral")
+
+    assert len(list(tmp_path.glob("*.layout.json.gz"))) == 3
+
+
+def test_layout_cache_warm_starts_changed_graph(tmp_path, monkeypatch):
+    G = nx.path_graph(50)
+    cache = LayoutCache(str(tmp_path), name="book.xlsx")
+    pos = cache.layout(G, "spring", seed=1)
+
+    G.add_edge(49, 50)
+    calls = []
+    spring_layout = nx.spring_layout
+
+    def spy(graph, **kwargs):
+        calls.append(kwargs)
+        return spring_layout(graph, **kwargs)
+
+    monkeypatch.setattr(nx, "spring_layout", spy)
+    warm = cache.layout(G, "spring", seed=1)
+
+    assert len(warm) == 51
+    assert calls[0]["iterations"] == WARM_START_ITERATIONS
+    # the new node starts next to its neighbor
+    assert calls[0]["pos"][50] == pytest.approx(pos[49])
+
+
+def test_layout_cache_ignores_unreadable_entries(tmp_path, caplog):
+    G = nx.path_graph(5)
+    cache = LayoutCache(str(tmp_path))
+    cache.layout(G, "spectral")
+    for entry in tmp_path.glob("*.layout.json.gz"):
+        entry.write_bytes(b"garbage")
+
+    assert len(cache.layout(G, "spectral")) == 5
+    assert "Ignoring unreadable layout cache entry" in caplog.text
@@ -0,0 +1,97 @@
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from graphedexcel import profiling
+from graphedexcel.graphbuilder import build_graph_and_stats
+from graphedexcel.profiling import Profiler, profile
+
+
+def test_stage_without_profiler():
+    assert profiling.active_profiler() is None
+    with profiling.stage("nothing"):
+        pass
+
+
+def test_stages_and_laps(capsys):
+    profiler = Profiler()
+    profiler.start()
+    with profiling.stage("outer"):
+        profiler.lap("step")
+        profiler.lap("step")
+        with profiling.stage("inner"):
+            pass
+    with profiling.stage("outer"):
+        pass
+    profiler.stop()
+    assert profiling.active_profiler() is None
+
+    assert list(profiler.stages) == ["step", "inner", "outer"]
+    assert profiler.stages["outer"].calls == 2
+    assert profiler.stages["step"].calls == 2
+    assert profiler.stages["step"].parent == "outer"
+    assert profiler.stages["inner"].parent == "outer"
+    assert profiler.stages["outer"].parent is None
+    assert profiler.stages["outer"].peak_bytes > 0
+
+    profiler.print_table()
+    lines = capsys.readouterr().err.splitlines()
+    assert [line.split()[0] for line in lines[3:7]] == [
+        "outer",
+        "step",
+        "inner",
+        "Total",
+    ]
+
+
+def test_build_stages(workbook_path):
+    profiler = Profiler()
+    profiler.start()
+    build_graph_and_stats(workbook_path)
+    profiler.stop()
+
+    assert profiler.stages["extract references"].calls == 3
+    assert profiler.stages["insert into graph"].parent == "parse sheets"
+    for stage in ["open workbook", "read rows", "link ranges", "remove isolates"]:
+        assert stage in profiler.stages
+
+
+def test_builds_in_other_threads_are_not_profiled(workbook_path):
+    profiler = Profiler()
+    profiler.start()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        seen = list(pool.map(lambda _: profiling.active_profiler(), range(2)))
+        list(pool.map(build_graph_and_stats, [workbook_path] * 2))
+    profiler.stop()
+
+    assert seen == [None, None]
+    assert profiler.stages == {}
+
+
+def test_tracemalloc_memory(tmp_path):
+    profiler = Profiler("tracemalloc")
+    profiler.start()
+    with profiling.stage("allocate"):
+        data = bytearray(10_000_000)
+    del data
+    profiler.stop()
+    assert profiler.stages["allocate"].peak_bytes >= 10_000_000
+
+    output_path = str(tmp_path / "memory.txt")
+    profiler.dump(output_path)
+    with open(output_path) as file:
+        assert "size=" in file.read()
+
+
+def test_cprofile_output(workbook_path, tmp_path, capsys):
+    output_path = str(tmp_path / "run.prof")
+    with profile("cprofile", output_path):
+        build_graph_and_stats(workbook_path)
+
+    stats = pstats.Stats(output_path)
+    assert any(function[2] == "add_formula" for function in stats.stats)
+    assert "Profile written to" in capsys.readouterr().err
+
+    with pytest.raises(ValueError):
+        Profiler("perf")
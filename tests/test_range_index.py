@@ -0,0 +1,62 @@
+from graphedexcel.range_index import RangeIndex
+
+
+def test_empty_index():
+    index = RangeIndex()
+    assert len(index) == 0
+    assert index.ranges_containing("Sheet1", 1, 1) == []
+
+
+def test_ranges_containing_cell():
+    index = RangeIndex()
+    # A1:A3, B2:C10 and A5:C5 given as (min_col, min_row, max_col, max_row)
+    index.add("Sheet1", (1, 1, 1, 3), "Sheet1!A1:A3")
+    index.add("Sheet1", (2, 2, 3, 10), "Sheet1!B2:C10")
+    index.add("Sheet1", (1, 5, 3, 5), "Sheet1!A5:C5")
+
+    assert len(index) == 3
+    assert index.ranges_containing("Sheet1", 2, 1) == ["Sheet1!A1:A3"]
+    assert index.ranges_containing("Sheet1", 4, 1) == []
+    assert sorted(index.ranges_containing("Sheet1", 5, 2)) == [
+        "Sheet1!A5:C5",
+        "Sheet1!B2:C10",
+    ]
+    assert index.ranges_containing("Sheet1", 10, 3) == ["Sheet1!B2:C10"]
+    assert index.ranges_containing("Sheet1", 11, 3) == []
+
+
+def test_ranges_are_per_sheet():
+    index = RangeIndex()
+    index.add("Sheet1", (1, 1, 1, 3), "Sheet1!A1:A3")
+
+    assert index.ranges_containing("Sheet2", 1, 1) == []
+
+
+def test_adding_after_query_rebuilds_index():
+    index = RangeIndex()
+    index.add("Sheet1", (1, 1, 1, 3), "Sheet1!A1:A3")
+    assert index.ranges_containing("Sheet1", 1, 1) == ["Sheet1!A1:A3"]
+
+    index.add("Sheet1", (1, 1, 2, 2), "Sheet1!A1:B2")
+    assert sorted(index.ranges_containing("Sheet1", 1, 1)) == [
+        "Sheet1!A1:A3",
+        "Sheet1!A1:B2",
+    ]
+
+
+def test_matches_brute_force():
+    index = RangeIndex()
+    ranges = []
+    for i in range(1, 30):
+        bounds = (i % 4 + 1, i, i % 4 + 3, i * 2)
+        ranges.append((bounds, f"R{i}"))
+        index.add("Sheet1", bounds, f"R{i}")
+
+    for row in range(1, 65):
+        for col in range(1, 8):
+            expected = sorted(
+                name
+                for (min_col, min_row, max_col, max_row), name in ranges
+                if min_row <= row <= max_row and min_col <= col <= max_col
+            )
+            assert sorted(index.ranges_containing("Sheet1", row, col)) == expected
@@ -0,0 +1,103 @@
+import random
+
+import networkx as nx
+import pytest
+
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.reachability import ReachabilityIndex, normalize_node_name
+
+
+def model_graph():
+    # Out!A1 = Calc!A1 * 2, Calc!A1 = SUM(In!A1:A2), Calc!B1 = Calc!C1, Calc!C1 = Calc!B1
+    G = nx.DiGraph()
+    G.add_edges_from(
+        [
+            ("Out!A1", "Calc!A1"),
+            ("Calc!A1", "In!A1:A2"),
+            ("In!A1:A2", "In!A1"),
+            ("In!A1:A2", "In!A2"),
+            ("Calc!B1", "Calc!C1"),
+            ("Calc!C1", "Calc!B1"),
+            ("Out!A2", "Calc!B1"),
+        ]
+    )
+    return G
+
+
+def test_precedents_and_dependents():
+    index = ReachabilityIndex(model_graph())
+
+    assert len(index) == 8
+    assert set(index.precedents("Out!A1")) == {"Calc!A1", "In!A1:A2", "In!A1", "In!A2"}
+    assert set(index.dependents("In!A2")) == {"In!A1:A2", "Calc!A1", "Out!A1"}
+    assert index.precedents("In!A1") == []
+    assert index.dependents("Out!A1") == []
+
+
+def test_circular_references():
+    index = ReachabilityIndex(model_graph())
+
+    assert set(index.precedents("Calc!B1")) == {"Calc!C1"}
+    assert set(index.dependents("Calc!B1")) == {"Calc!C1", "Out!A2"}
+    assert index.depends_on("Calc!B1", "Calc!C1")
+    assert index.depends_on("Calc!C1", "Calc!B1")
+    assert not index.depends_on("Out!A1", "Out!A1")
+
+
+def test_depends_on():
+    index = ReachabilityIndex(model_graph())
+
+    assert index.depends_on("Out!A1", "In!A1")
+    assert not index.depends_on("In!A1", "Out!A1")
+    assert not index.depends_on("Out!A2", "In!A1")
+    assert not index.depends_on("Unknown!A1", "In!A1")
+
+
+def test_cells_within_compact_ranges():
+    # In!A1:A2 is not expanded, so In!A2 is only a member of the range
+    G = nx.DiGraph([("Calc!A1", "In!A1:A2"), ("Out!A1", "Calc!A1")])
+    index = ReachabilityIndex(G)
+
+    assert "In!A2" not in index
+    assert set(index.dependents("In!A2")) == {"In!A1:A2", "Calc!A1", "Out!A1"}
+    assert index.depends_on("Out!A1", "In!A2")
+    assert index.dependents("In!B2") == []
+
+
+def test_node_names_as_typed():
+    index = ReachabilityIndex(nx.DiGraph([("My Sheet!A1", "In!B4")]))
+
+    assert normalize_node_name("'My Sheet'!$a$1") == "My Sheet!A1"
+    assert index.dependents("In!$b$4") == ["My Sheet!A1"]
+    assert index.precedents("'My Sheet'!A1") == ["In!B4"]
+
+
+def test_compact_graph():
+    graph = model_graph()
+    compact = CompactGraph(directed=True)
+    compact.add_edges_from(graph.edges())
+    index = ReachabilityIndex(compact.finalize())
+
+    assert set(index.dependents("In!A2")) == {"In!A1:A2", "Calc!A1", "Out!A1"}
+    assert index.depends_on("Out!A2", "Calc!C1")
+
+
+def test_undirected_graph():
+    with pytest.raises(ValueError):
+        ReachabilityIndex(nx.Graph(model_graph()))
+
+
+def test_random_graph_matches_networkx():
+    rng = random.Random(1)
+    names = [f"S!A{i}" for i in range(1, 301)]
+    G = nx.DiGraph()
+    G.add_nodes_from(names)
+    G.add_edges_from((rng.choice(names), rng.choice(names)) for _ in range(450))
+    G.remove_edges_from(nx.selfloop_edges(G))
+    index = ReachabilityIndex(G)
+
+    for node in rng.sample(names, 40):
+        assert set(index.precedents(node)) == nx.descendants(G, node)
+        assert set(index.dependents(node)) == nx.ancestors(G, node)
+        other = rng.choice([name for name in names if name != node])
+        assert index.depends_on(node, other) == nx.has_path(G, node, other)
@@ -0,0 +1,178 @@
+import http.client
+import json
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+
+from graphedexcel import server
+from graphedexcel.server import (
+    AnalysisService,
+    RequestError,
+    create_server,
+    parse_options,
+)
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = AnalysisService(workers=1, queue_size=0, use_cache=False)
+    service.warm()
+    yield service
+    service.close()
+
+
+def run_server(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def server_url(service):
+    server = run_server(create_server(service, port=0))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body, content_type):
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": content_type}, method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.headers.get_content_type(), response.read()
+
+
+def test_parse_options():
+    options, image_format = parse_options(
+        {"directed": ["1"], "reader": ["xml"], "format": ["png"]}
+    )
+    assert image_format == "png"
+    assert options == {
+        "as_directed": True,
+        "expand_ranges": True,
+        "compact": False,
+        "reader": "xml",
+        "image_layout": "spring",
+    }
+    with pytest.raises(RequestError):
+        parse_options({"reader": ["pandas"]})
+
+
+def test_health(server_url):
+    with urllib.request.urlopen(f"{server_url}/health") as response:
+        assert json.load(response) == {"status": "ok", "workers": 1, "pending": 0}
+
+
+def test_analyze_path(server_url, workbook_path):
+    content_type, body = post(
+        f"{server_url}/analyze?directed=1",
+        json.dumps({"path": workbook_path}).encode(),
+        "application/json",
+    )
+    result = json.loads(body)
+
+    assert content_type == "application/json"
+    assert result["summary"]["nodes"] == 6
+    assert result["summary"]["edges"] == 6
+    assert result["summary"]["functions"] == {"SUM": 1}
+    assert result["stats"]["sheets"]["Sheet"]["formulas"] == 3
+
+
+def test_analyze_upload_as_image(server_url, workbook_path):
+    with open(workbook_path, "rb") as file:
+        content_type, body = post(
+            f"{server_url}/analyze?format=png&layout=circular",
+            file.read(),
+            "application/octet-stream",
+        )
+
+    assert content_type == "image/png"
+    assert body.startswith(b"\x89PNG")
+
+
+def test_errors(server_url, tmp_path):
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a workbook")
+    for body, status in [
+        (json.dumps({"path": str(tmp_path / "missing.xlsx")}), 404),
+        (json.dumps({"file": "x"}), 400),
+        (json.dumps({"path": str(broken)}), 422),
+    ]:
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            post(f"{server_url}/analyze", body.encode(), "application/json")
+        assert exc_info.value.code == status
+
+
+def test_invalid_content_length(server_url):
+    host, port = server_url.removeprefix("http://").split(":")
+    connection = http.client.HTTPConnection(host, int(port))
+    connection.putrequest("POST", "/analyze")
+    connection.putheader("Content-Length", "lots")
+    connection.endheaders()
+    assert connection.getresponse().status == 400
+    connection.close()
+
+
+def crash(*args, **kwargs):
+    os._exit(1)
+
+
+def test_broken_pool_is_replaced(workbook_path, monkeypatch):
+    service = AnalysisService(workers=1, queue_size=0, use_cache=False, images=False)
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(server, "analyze_workbook", crash)
+            with pytest.raises(BrokenProcessPool):
+                service.analyze(workbook_path)
+        assert service.analyze(workbook_path).summary["nodes"] == 6
+    finally:
+        service.close()
+
+
+def test_full_queue_is_rejected(server_url, service, workbook_path):
+    with service.reserve():
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            post(
+                f"{server_url}/analyze",
+                json.dumps({"path": workbook_path}).encode(),
+                "application/json",
+            )
+    assert exc_info.value.code == 503
+    assert exc_info.value.headers["Retry-After"] == "1"
+    assert service.pending == 0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def test_unix_socket(service, workbook_path, tmp_path):
+    socket_path = str(tmp_path / "graphedexcel.sock")
+    server = run_server(create_server(service, socket_path=socket_path))
+    try:
+        connection = UnixHTTPConnection(socket_path)
+        connection.request(
+            "POST",
+            "/analyze",
+            json.dumps({"path": workbook_path}),
+            {"Content-Type": "application/json"},
+        )
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.load(response)["summary"]["functions"] == {"SUM": 1}
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,67 @@
+import gc
+import os
+
+import networkx as nx
+import pytest
+
+from graphedexcel.compact_graph import CompactGraph
+from graphedexcel.graph_summarizer import summarize
+from graphedexcel.graphbuilder import build_graph_and_stats
+from graphedexcel.spill_graph import SpillGraph, fits_in_memory, parse_memory_size
+
+
+WORKBOOK = {
+    "Inputs": [["1", "2", "3"], ["=A1*2", "=SUM(A1:C1)", "=Calc!A1"]],
+    "Calc": [["=Inputs!A2+Inputs!B2", "=SUM(Inputs!A1:B2)"], ["=A1+B1", "=B2"]],
+    "Output": [["=MAX(Calc!A1:B2)", "=SUM(Inputs!B:B)", "=SUM(1:2)"]],
+}
+
+
+def test_parse_memory_size():
+    assert parse_memory_size("512M") == 512 * 1024**2
+    assert parse_memory_size("2g") == 2 * 1024**3
+    assert parse_memory_size("1.5GB") == int(1.5 * 1024**3)
+    assert parse_memory_size("4096") == 4096
+    with pytest.raises(ValueError):
+        parse_memory_size("lots")
+
+
+@pytest.mark.parametrize(
+    "as_directed, expand_ranges",
+    [(True, True), (False, True), (True, False), (False, False)],
+)
+def test_spilled_build_matches_compact_build(workbook_path, as_directed, expand_ranges):
+    options = {"as_directed": as_directed, "expand_ranges": expand_ranges}
+    compact, stats = build_graph_and_stats(workbook_path, compact=True, **options)
+    # a tiny limit writes the buffers to disk after every 1024 rows
+    spilled, spilled_stats = build_graph_and_stats(
+        workbook_path, max_memory=1, **options
+    )
+
+    assert isinstance(spilled, CompactGraph)
+    expected, converted = compact.to_networkx(), spilled.to_networkx()
+    assert nx.utils.graphs_equal(expected, converted)
+    assert list(expected.nodes) == list(converted.nodes)
+    assert summarize(spilled, spilled_stats) == summarize(compact, stats)
+
+
+def test_spill_graph_spills_and_removes_its_files(tmp_path):
+    graph = SpillGraph(max_memory=1, directory=str(tmp_path))
+    for row in range(1, 3001):
+        graph.add_node(f"S!A{row}")
+        graph.add_node(f"S!B{row}")
+        graph.add_edge(f"S!A{row}", f"S!B{row}")
+        graph.add_edge(f"S!A{row}", f"S!A{row}")
+    assert graph.stats.spills > 2
+
+    directory = graph.directory
+    compact = graph.finalize(as_directed=True)
+    assert compact.number_of_nodes() == 6000
+    assert compact.number_of_edges() == 3000
+    assert compact.node_name(0) == "S!A1"
+    assert graph.stats.disk_bytes > 0
+    assert not fits_in_memory(compact, 1024)
+
+    del compact
+    gc.collect()
+    assert not os.path.exists(directory)
@@ -0,0 +1,141 @@
+import zipfile
+
+from openpyxl import Workbook
+from openpyxl.worksheet.formula import ArrayFormula
+import networkx as nx
+import pytest
+
+from graphedexcel.graphbuilder import build_graph_and_stats
+from graphedexcel.xlsx_reader import (
+    OpenpyxlFormulaReader,
+    XmlFormulaReader,
+    open_formula_reader,
+)
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml"
+ ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Target="xl/workbook.xml"
+ Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+ xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Data Sheet" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Target="/xl/worksheets/sheet1.xml"
+ Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>
+</Relationships>"""
+
+SHEET = """<?xml version="1.0" encoding="UTF-8"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetData>
+<row r="1"><c r="A1"><v>1</v></c><c r="B1"><v>2</v></c>
+<c r="C1"><f t="shared" ref="C1:C3" si="0">A1*B1</f><v>2</v></c></row>
+<row r="2"><c r="A2"><v>3</v></c><c r="B2"><v>4</v></c>
+<c r="C2"><f t="shared" si="0"/><v>12</v></c></row>
+<row r="3"><c><v>5</v></c><c><v>6</v></c>
+<c r="C3"><f t="shared" si="0"/><v>30</v></c><c><f>SUM(C1:C3)&amp;"&lt;x&gt;"</f></c></row>
+<row><c r="A4"><f t="array" ref="A4">MAX(A1:A3*2)</f></c></row>
+</sheetData>
+</worksheet>"""
+
+
+@pytest.fixture
+def shared_formula_workbook(tmp_path):
+    file_path = tmp_path / "shared.xlsx"
+    with zipfile.ZipFile(file_path, "w") as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", ROOT_RELS)
+        archive.writestr("xl/workbook.xml", WORKBOOK)
+        archive.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+        archive.writestr("xl/worksheets/sheet1.xml", SHEET)
+    return str(file_path)
+
+
+@pytest.fixture
+def openpyxl_workbook(tmp_path):
+    file_path = tmp_path / "test.xlsx"
+    wb = Workbook()
+    wb.active.append(["1", "2", "=A1+B1"])
+    calc = wb.create_sheet("Calc 'Sheet'")
+    calc.append(["=SUM(Sheet!A1:C1)", "text", "=A1*2"])
+    calc.append([None, None, None, '=IF(A1>0,"yes","no")'])
+    wb.save(file_path)
+    return str(file_path)
+
+
+def read_all(reader):
+    try:
+        return {
+            name: list(reader.iter_formula_cells(name)) for name in reader.sheetnames
+        }
+    finally:
+        reader.close()
+
+
+def test_shared_formulas_are_expanded(shared_formula_workbook):
+    cells = read_all(XmlFormulaReader(shared_formula_workbook))
+
+    assert cells == {
+        "Data Sheet": [
+            ("C1", "=A1*B1"),
+            ("C2", "=A2*B2"),
+            ("C3", "=A3*B3"),
+            ("D3", '=SUM(C1:C3)&"<x>"'),
+            ("A4", "=MAX(A1:A3*2)"),
+        ]
+    }
+
+
+def test_xml_reader_matches_openpyxl_reader(shared_formula_workbook, openpyxl_workbook):
+    for file_path in [shared_formula_workbook, openpyxl_workbook]:
+        openpyxl_cells = read_all(OpenpyxlFormulaReader(file_path))
+        xml_cells = read_all(XmlFormulaReader(file_path))
+        assert xml_cells == openpyxl_cells
+
+
+def test_build_with_xml_reader(openpyxl_workbook):
+    graph, functions = build_graph_and_stats(openpyxl_workbook, as_directed=True)
+    expected_functions = functions.functions
+
+    xml_graph, xml_functions = build_graph_and_stats(
+        openpyxl_workbook, as_directed=True, reader="xml"
+    )
+
+    assert nx.utils.graphs_equal(graph, xml_graph)
+    assert xml_functions.functions == expected_functions == {"SUM": 1, "IF": 1}
+
+
+def test_array_formulas_are_read_as_formulas(tmp_path):
+    file_path = str(tmp_path / "array.xlsx")
+    wb = Workbook()
+    wb.active.append(["1", "2", "3"])
+    wb.active["A2"] = ArrayFormula("A2", "=MAX(A1:C1*2)")
+    wb.save(file_path)
+
+    for reader in ["openpyxl", "xml"]:
+        cells = read_all(open_formula_reader(file_path, reader))
+        assert cells == {"Sheet": [("A2", "=MAX(A1:C1*2)")]}
+
+    graph, stats = build_graph_and_stats(file_path, as_directed=True)
+    assert graph.has_edge("Sheet!A2", "Sheet!A1:C1")
+    assert stats.functions == {"MAX": 1}
+
+
+def test_unknown_reader():
+    with pytest.raises(ValueError):
+        open_formula_reader("test.xlsx", "csv")